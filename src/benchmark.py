@@ -0,0 +1,768 @@
+# All rights reserved. No part of this code may be reproduced, distributed, or transmitted
+# in any form or by any means, including photocopying, recording, or other electronic or
+# mechanical methods, without the prior written permission of the author, except in the
+# case of brief quotations embodied in critical reviews and certain other noncommercial
+# uses permitted by copyright law. For permission requests, please contact the author.
+#
+# Copyright (c) Lucía Alejandra Moreno Canuto, Gabriel Ernesto Gutiérrez Añez, Alicia Hernández Gutiérrez, Guillermo Daniel González Lozano
+
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Optional
+import cv2
+import numpy as np
+from config import Config
+
+
+def report(name:str, latencies:list[float]):
+    values = np.array(latencies) * 1000
+    if len(values) == 0:
+        print(f"{name}: no samples")
+        return
+    print(
+        f"{name}: n={len(values)} mean={values.mean():.2f}ms p50={np.percentile(values, 50):.2f}ms "
+        f"p95={np.percentile(values, 95):.2f}ms max={values.max():.2f}ms"
+    )
+
+
+def benchmark_replay(args):
+    from camera import ReplayCamera, release_predictions
+
+    config = Config()
+    config.replay.session = args.session
+    config.replay.realtime = args.realtime
+    config.replay.loop = False
+    camera = ReplayCamera(config)
+    if not camera.open_camera():
+        raise SystemExit(f"Unable to open session {args.session}")
+
+    grab_latencies, process_latencies, detected, mask_bytes = [], [], 0, 0
+    started = time.perf_counter()
+    try:
+        while len(process_latencies) < args.frames or args.frames <= 0:
+            t0 = time.perf_counter()
+            frame = camera.grab()
+            if frame is None:
+                break
+            t1 = time.perf_counter()
+            predictions = camera.process(frame)
+            t2 = time.perf_counter()
+            grab_latencies.append(t1 - t0)
+            process_latencies.append(t2 - t1)
+            detected += sum(1 for p in predictions if p.is_complete())
+            mask_bytes += sum(p.mask.nbytes for p in predictions if p.is_complete())
+            release_predictions(predictions)
+    finally:
+        camera.stop_camera()
+    elapsed = time.perf_counter() - started
+
+    report("grab", grab_latencies)
+    report("process", process_latencies)
+    print(f"throughput: {len(process_latencies) / elapsed:.2f} fps, measured boxes: {detected} in {len(process_latencies)} frames")
+    if detected > 0:
+        w, h = config.camera.resolution
+        print(f"mask memory: {mask_bytes / detected:.0f} bytes per prediction, {w * h} as a full frame bool array")
+    print(f"frame buffers: {camera.frame_pool.stats()}")
+    print(f"detection: {camera.detection.stats()}")
+    if camera.temporal_filter is not None:
+        print(f"temporal filter: {camera.temporal_filter.stats()}")
+    if camera.spatial_filter is not None:
+        print(f"spatial filter: {camera.spatial_filter.stats()}")
+
+
+def benchmark_restart(args):
+    from camera import ReplayCamera, release_predictions
+
+    config = Config()
+    config.replay.session = args.session
+    config.replay.realtime = False
+    camera = ReplayCamera(config)
+
+    # The first start loads the models, the following ones must only pay the camera start
+    for i in range(args.restarts + 1):
+        started = time.perf_counter()
+        if not camera.open_camera():
+            raise SystemExit(f"Unable to open session {args.session}")
+        opened = time.perf_counter()
+        predictions = camera.process(camera.grab())
+        measured = time.perf_counter()
+        release_predictions(predictions)
+        camera.stop_camera()
+        print(f"{'cold start' if i == 0 else f'restart {i}'}: open={1000 * (opened - started):.2f}ms first measurement={1000 * (measured - started):.2f}ms")
+    print(f"detection: {camera.detection.stats()}")
+
+
+def import_times(module:str) -> list[tuple[str, int, int, int]]:
+    """Runs `python -X importtime -c "import <module>"` and returns (module, level, self us, cumulative us)"""
+    env = dict(os.environ, KIVY_NO_ARGS="1", KIVY_NO_CONSOLELOG="1")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"Unable to import {module}:\n{result.stderr.splitlines()[-1]}")
+
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        level = (len(name) - len(name.lstrip())) // 2
+        times.append((name.strip(), level, int(own), int(cumulative)))
+    return times
+
+
+def benchmark_startup(args):
+    times = import_times(args.module)
+    # Keep only the imports triggered by the module, not the interpreter start up
+    end = next(i for i, (name, level, _, _) in enumerate(times) if name == args.module and level == 0)
+    start = max([i + 1 for i, (_, level, _, _) in enumerate(times[:end]) if level == 0], default=0)
+    times = times[start:end + 1]
+    total = times[-1][3]
+    print(f"import {args.module}: {total / 1000:.1f}ms, {len(times)} modules")
+
+    # Self time grouped by top level package, then the slowest single imports
+    packages = defaultdict(int)
+    for name, _, own, _ in times:
+        packages[name.split(".")[0]] += own
+    print("by package:")
+    for name, own in sorted(packages.items(), key=lambda p: -p[1])[:args.top]:
+        print(f"  {name:<30} {own / 1000:8.1f}ms")
+    print("by cumulative time:")
+    for name, level, _, cumulative in sorted(times, key=lambda t: -t[3])[:args.top]:
+        print(f"  {name:<30} {cumulative / 1000:8.1f}ms (level {level})")
+
+
+def benchmark_sam(args):
+    from recording import SessionReader
+    from detection.box import BoxDetection
+    from detection.backends import mask_iou
+    import utils
+
+    config = Config()
+    config.detection.sam_roi = True
+    if args.roi_size:
+        config.detection.sam_roi_size = args.roi_size
+    reader = SessionReader(args.session)
+    detection = BoxDetection(config)
+    detection.init(reader.intrinsics)
+    detection.load_models()
+
+    # The full frame masks at the default 1024 input are the reference of the ROI crops
+    full, roi, ious, boxes, frames = [], [], [], 0, 0
+    for i in range(0, len(reader), max(1, args.step)):
+        color, _, _ = reader[i]
+        enhanced = utils.enhance(np.array(color))
+        bboxes = detection.__detect_boxes__(enhanced)
+        if not bboxes:
+            continue
+        t0 = time.perf_counter()
+        result = detection.sam_model(enhanced, bboxes=bboxes, imgsz=1024, verbose=False)
+        t1 = time.perf_counter()
+        masks = detection.__segment_roi__(enhanced, bboxes)
+        t2 = time.perf_counter()
+        full.append(t1 - t0)
+        roi.append(t2 - t1)
+        frames += 1
+        boxes += len(bboxes)
+        if result and result[0].masks is not None:
+            for reference, mask in zip(result[0].masks.data.cpu().numpy() > 0, masks):
+                ious.append(0.0 if mask is None else mask_iou(reference, mask.dense()))
+    reader.close()
+
+    report("full frame SAM", full)
+    report(f"ROI SAM at {config.detection.sam_roi_size}", roi)
+    print(f"{frames} frames, {boxes} boxes")
+    if ious:
+        print(f"mask IoU vs full frame: mean={np.mean(ious):.4f} min={np.min(ious):.4f} p5={np.percentile(ious, 5):.4f}")
+
+
+def brute_force_polygon(points:np.ndarray, k:int=6) -> Optional[np.ndarray]:
+    """The previous best hexagon search, every combination of k points and its ConvexHull"""
+    from itertools import combinations
+    from scipy.spatial import ConvexHull
+
+    best_area, best_points = 0, None
+    for subset in combinations(points, k):
+        subset = np.array(subset)
+        if np.linalg.matrix_rank(subset[1:] - subset[0]) < 2:
+            continue
+        area = ConvexHull(subset).volume
+        if area > best_area:
+            best_area, best_points = area, subset
+    return best_points
+
+
+def polygon_area(points:Optional[np.ndarray]) -> float:
+    if points is None:
+        return 0.0
+    hull = cv2.convexHull(points.astype(np.float32)).reshape(-1, 2)
+    return 0.5 * abs(np.dot(hull[:, 0], np.roll(hull[:, 1], 1)) - np.dot(hull[:, 1], np.roll(hull[:, 0], 1)))
+
+
+def benchmark_hexagon(args):
+    import utils
+
+    rng = np.random.default_rng(0)
+    # Pay the scipy import before timing
+    brute_force_polygon(np.array([[0, 0], [4, 0], [6, 3], [4, 6], [0, 6], [-2, 3]]))
+    for n in range(6, args.max_points + 1, 2):
+        # Noisy contour approximations: points around an ellipse
+        samples = []
+        for _ in range(args.samples):
+            angles = np.sort(rng.uniform(0, 2 * np.pi, n))
+            radius = rng.uniform(0.8, 1.0, n)
+            samples.append(np.unique(np.int32(np.c_[320 + 200 * radius * np.cos(angles), 240 + 150 * radius * np.sin(angles)]), axis=0))
+
+        timings, mismatches = {"brute force": [], "max area polygon": []}, 0
+        for points in samples:
+            t0 = time.perf_counter()
+            expected = brute_force_polygon(points)
+            t1 = time.perf_counter()
+            result = utils.max_area_polygon(points)
+            t2 = time.perf_counter()
+            timings["brute force"].append(t1 - t0)
+            timings["max area polygon"].append(t2 - t1)
+            mismatches += abs(polygon_area(expected) - polygon_area(result)) > 1e-6
+
+        brute, fast = np.mean(timings["brute force"]), np.mean(timings["max area polygon"])
+        print(f"points={n}: brute force {brute * 1000:.2f}ms, max area polygon {fast * 1000:.3f}ms, speedup x{brute / fast:.1f}, area mismatches {mismatches}")
+
+
+def window_stable_value(values:list[int], sigma:float=3) -> int:
+    """The previous Tracker estimate, np.percentile and np.median over the whole window"""
+    data = np.array(values)
+    q1, q3 = np.percentile(data, [25, 75])
+    iqr = q3 - q1
+    return int(np.median(data[(data >= q1 - sigma * iqr) & (data <= q3 + sigma * iqr)]))
+
+
+def benchmark_tracker(args):
+    from detection.tracking import Tracker
+    from domain import Dimensions, DimSide
+
+    rng = np.random.default_rng(0)
+    truth = np.array([30, 20, 15])
+    tracker = Tracker()
+    window:list[np.ndarray] = []
+    tracker_latencies, window_latencies = [], []
+    mismatches, raw_errors, stable_errors = 0, [], []
+    for i in range(args.updates):
+        values = truth + rng.integers(-1, 2, 3)
+        if rng.random() < args.outliers:
+            values = rng.integers(0, 500, 3)
+        sides = [DimSide(value=int(v), point1=(0, 0), point2=(1, 1)) for v in (0, 0, *values, 0)]
+        dimension = Dimensions(sides=sides, detection_time=i)
+
+        t0 = time.perf_counter()
+        stable = tracker.update(dimension)
+        t1 = time.perf_counter()
+        window = (window + [values])[-tracker.maxlen:]
+        expected = [window_stable_value([v[j] for v in window]) for j in range(3)] if len(window) >= tracker.min_samples else list(values)
+        t2 = time.perf_counter()
+        tracker_latencies.append(t1 - t0)
+        window_latencies.append(t2 - t1)
+
+        result = [stable.side3.value, stable.side4.value, stable.side5.value]
+        mismatches += result != expected
+        if len(window) >= tracker.min_samples:
+            raw_errors.append(np.abs(values - truth).max())
+            stable_errors.append(np.abs(np.array(result) - truth).max())
+
+    report("tracker update", tracker_latencies)
+    report("window percentile", window_latencies)
+    print(f"mismatches against the window estimate: {mismatches} of {args.updates}")
+    print(f"max error in cm: raw {max(raw_errors)}, stabilized {max(stable_errors)} with {args.outliers:.0%} outliers")
+
+
+def benchmark_tracks(args):
+    from detection.tracking import MultiObjectTracker
+    from domain import Dimensions, DimSide
+
+    rng = np.random.default_rng(0)
+    for n in args.tracks:
+        tracker = MultiObjectTracker(Config())
+        # Boxes spread over a grid, moving a few pixels per frame and missed now and then
+        columns = int(np.ceil(np.sqrt(n * 4 / 3)))
+        cell = 640 / columns
+        centers = np.array([((i % columns + 0.5) * cell, (i // columns + 0.5) * cell) for i in range(n)])
+        sizes = rng.integers(20, 60, (n, 3))
+        latencies, switches, errors = [], 0, []
+        last_ids:dict[int, int] = {}
+        for frame in range(args.frames):
+            centers += rng.normal(0, 2, centers.shape)
+            visible = [i for i in rng.permutation(n) if rng.random() > args.misses]
+            bboxes = [np.int32([*(centers[i] - cell * 0.3), *(centers[i] + cell * 0.3)]) for i in visible]
+            dimensions = []
+            for i in visible:
+                values = sizes[i] + rng.integers(-1, 2, 3) if rng.random() > args.outliers else rng.integers(0, 500, 3)
+                sides = [DimSide(value=int(v), point1=(0, 0), point2=(1, 1)) for v in (0, 0, *values, 0)]
+                dimensions.append(Dimensions(sides=sides, detection_time=frame * 33))
+
+            started = time.perf_counter()
+            tracked = tracker.update(bboxes, dimensions, frame * 33)
+            latencies.append(time.perf_counter() - started)
+
+            for i, (track_id, stable) in zip(visible, tracked):
+                switches += i in last_ids and last_ids[i] != track_id
+                last_ids[i] = track_id
+                if frame >= 30:
+                    errors.append(np.abs(np.array([stable.side3.value, stable.side4.value, stable.side5.value]) - sizes[i]).max())
+
+        values = np.array(latencies) * 1000
+        print(
+            f"tracks={n}: update mean={values.mean():.3f}ms p95={np.percentile(values, 95):.3f}ms, "
+            f"tracks created {tracker.created}, id switches {switches}, max stabilized error {max(errors)}cm"
+        )
+
+
+def synthetic_intrinsics(w:int, h:int, coeffs:Optional[list[float]]=None):
+    import pyrealsense2 as rs
+
+    intrinsics = rs.intrinsics()
+    intrinsics.width, intrinsics.height = w, h
+    intrinsics.ppx, intrinsics.ppy, intrinsics.fx, intrinsics.fy = w / 2, h / 2, 600.0, 600.0
+    intrinsics.model = rs.distortion.inverse_brown_conrady
+    intrinsics.coeffs = coeffs or [0.0] * 5
+    return intrinsics
+
+
+def benchmark_distance(args):
+    from detection.distance import DistanceEstimator
+
+    config = Config()
+    w, h = config.camera.resolution
+    estimator = DistanceEstimator(synthetic_intrinsics(w, h), config)
+
+    rng = np.random.default_rng(0)
+    per_side, batched, difference = [], [], 0.0
+    for _ in range(args.samples):
+        depth = rng.integers(800, 1200, (h, w)).astype(np.uint16)
+        depth[rng.random((h, w)) < 0.1] = 0
+        corners = np.c_[rng.integers(0, w, 6), rng.integers(0, h, 6)]
+
+        t0 = time.perf_counter()
+        expected = [estimator.distance(depth, corners[i], corners[(i + 1) % 6]) for i in range(6)]
+        t1 = time.perf_counter()
+        result = estimator.distances(depth, corners)
+        t2 = time.perf_counter()
+        per_side.append(t1 - t0)
+        batched.append(t2 - t1)
+        difference = max(difference, float(np.abs(np.array(expected) - result).max()))
+
+    report("per side distance", per_side)
+    report("batched distances", batched)
+    print(f"max difference: {difference:.6f}cm")
+
+
+def benchmark_dimensions(args):
+    from camera import ReplayCamera, release_predictions
+
+    config = Config()
+    config.replay.session = args.session
+    config.replay.realtime = False
+    config.replay.loop = False
+    config.detection.dimensions_method = "corners"
+    camera = ReplayCamera(config)
+    if not camera.open_camera():
+        raise SystemExit(f"Unable to open session {args.session}")
+
+    # Both methods measure the same masks, the corner method ones are the reference
+    detection = camera.detection
+    latencies = {"corners": [], "pointcloud": []}
+    sides = {"corners": [], "pointcloud": []}
+    confidences, frames = [], 0
+    try:
+        while frames < args.frames or args.frames <= 0:
+            frame = camera.grab()
+            if frame is None:
+                break
+            frames += 1
+            predictions = camera.process(frame)
+            for prediction in predictions:
+                if not prediction.is_complete():
+                    continue
+                t0 = time.perf_counter()
+                corners = detection.estimator.calculate_object_dimensions(frame.depth, prediction.corners)
+                t1 = time.perf_counter()
+                pointcloud = detection.pointcloud_estimator.calculate_object_dimensions(frame.depth, prediction.mask)
+                t2 = time.perf_counter()
+                latencies["corners"].append(t1 - t0)
+                latencies["pointcloud"].append(t2 - t1)
+                for name, dimensions in (("corners", corners), ("pointcloud", pointcloud)):
+                    sides[name].append(None if dimensions is None else sorted([dimensions.side3.value, dimensions.side4.value, dimensions.side5.value]))
+                if pointcloud is not None:
+                    confidences.append(pointcloud.confidence)
+            release_predictions(predictions)
+    finally:
+        camera.stop_camera()
+
+    budget = config.detection.pointcloud_budget_ms
+    for name in ("corners", "pointcloud"):
+        report(f"{name} dimensions", latencies[name])
+        measured = [s for s in sides[name] if s is not None]
+        line = f"{name}: measured {len(measured)} of {len(sides[name])} masks in {frames} frames"
+        if args.dimensions and measured:
+            errors = np.abs(np.array(measured) - np.array(sorted(args.dimensions)))
+            line += f", error vs truth mean={errors.mean():.2f}cm max={errors.max():.2f}cm"
+        print(line)
+    pairs = [(a, b) for a, b in zip(sides["corners"], sides["pointcloud"]) if a is not None and b is not None]
+    if pairs:
+        difference = np.abs(np.array([a for a, _ in pairs]) - np.array([b for _, b in pairs]))
+        print(f"pointcloud vs corners: mean difference {difference.mean():.2f}cm, max {difference.max():.2f}cm")
+    if confidences:
+        print(f"pointcloud confidence: mean={np.mean(confidences):.2f} min={np.min(confidences):.2f}")
+    print(f"pointcloud budget {budget:.1f}ms: {detection.pointcloud_estimator.stats()}")
+
+
+def benchmark_temporal(args):
+    import tracemalloc
+    from detection.depth_filters import TemporalDepthFilter
+
+    config = Config()
+    w, h = config.camera.resolution
+    rng = np.random.default_rng(0)
+    # A tilted plane with distance dependent noise and 10% of the pixels dropping out every frame
+    truth = (900 + np.linspace(0, 300, w)[None, :] + np.linspace(0, 100, h)[:, None]).astype(np.float64)
+    frames = []
+    for _ in range(args.frames):
+        depth = np.rint(truth + rng.normal(0, truth * args.noise)).astype(np.uint16)
+        depth[rng.random((h, w)) < 0.1] = 0
+        frames.append(depth)
+    raw = frames[-1]
+    raw_error = np.abs(raw[raw > 0] - truth[raw > 0])
+
+    for mode in ("mean", "median"):
+        config.depth.temporal_mode = mode
+        temporal = TemporalDepthFilter(config)
+        latencies = []
+        tracemalloc.start()
+        for depth in frames:
+            t0 = time.perf_counter()
+            fused = temporal.update(depth)
+            latencies.append(time.perf_counter() - t0)
+            if len(latencies) == config.depth.temporal_frames:
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+        tracemalloc.stop()
+        valid = fused > 0
+        error = np.abs(fused[valid] - truth[valid])
+        report(f"temporal {mode} update", latencies)
+        print(
+            f"{mode}: mean abs error {error.mean():.2f} (raw {raw_error.mean():.2f}), valid {valid.mean():.1%} (raw {(raw > 0).mean():.1%}), "
+            f"peak allocation per update {peak} bytes"
+        )
+
+        moved = (truth + 200).astype(np.uint16)
+        resets = temporal.resets
+        temporal.update(moved)
+        print(f"{mode}: scene moved by 200, reset={temporal.resets > resets}")
+
+
+def benchmark_spatial(args):
+    from detection.depth_filters import SpatialDepthFilter
+    from detection.distance import DistanceEstimator
+
+    config = Config()
+    w, h = config.camera.resolution
+    rng = np.random.default_rng(0)
+    ys, xs = np.mgrid[0:h, 0:w]
+    # A box in front of a wall, with noise, scattered dropouts and invalid bands along the box edges
+    bbox = np.array([w // 4, h // 4, 3 * w // 4, 3 * h // 4])
+    inside = (xs >= bbox[0]) & (xs < bbox[2]) & (ys >= bbox[1]) & (ys < bbox[3])
+    truth = np.where(inside, 800 + 0.2 * (xs - bbox[0]), 1500).astype(np.float64)
+    edges = inside & ~((xs >= bbox[0] + 4) & (xs < bbox[2] - 4) & (ys >= bbox[1] + 4) & (ys < bbox[3] - 4))
+    frames = []
+    for _ in range(args.frames):
+        depth = np.rint(truth + rng.normal(0, truth * args.noise)).astype(np.uint16)
+        depth[(rng.random((h, w)) < 0.05) | (edges & (rng.random((h, w)) < 0.5))] = 0
+        frames.append(depth)
+
+    estimator = DistanceEstimator(synthetic_intrinsics(w, h), config)
+    x1, y1, x2, y2 = bbox + [6, 6, -7, -7]
+    corners = np.array([[x1, y1], [x2, y1], [x2, y2], [x1, y2], [x1, (y1 + y2) // 2], [(x1 + x2) // 2, y1]])
+    expected = estimator.distances(np.rint(truth).astype(np.uint16), corners)
+
+    for roi in (False, True):
+        config.depth.spatial_roi = roi
+        spatial = SpatialDepthFilter(config)
+        latencies, raw_errors, errors = [], [], []
+        for depth in frames:
+            t0 = time.perf_counter()
+            processed = spatial.process(depth, [bbox])
+            latencies.append(time.perf_counter() - t0)
+            raw_errors.append(np.abs(estimator.distances(depth, corners) - expected).mean())
+            errors.append(np.abs(estimator.distances(processed, corners) - expected).mean())
+        region = inside if roi else np.ones((h, w), dtype=bool)
+        stats = spatial.stats()
+        stages = ", ".join(f"{stage} {stats[f'spatial_{stage}_ms']:.2f}ms" for stage in SpatialDepthFilter.STAGES)
+        report(f"spatial {'roi' if roi else 'full frame'}", latencies)
+        print(f"  stages: {stages}")
+        print(
+            f"  invalid pixels in the box {(depth[region & inside] == 0).mean():.1%} -> {(processed[region & inside] == 0).mean():.1%}, "
+            f"side error {np.mean(raw_errors):.2f}cm -> {np.mean(errors):.2f}cm"
+        )
+
+
+def reference_alignment(depth:np.ndarray, depth_intrinsics, color_intrinsics, extrinsics, depth_scale:float) -> np.ndarray:
+    """Pixel by pixel port of the librealsense depth to color alignment, with its own point functions"""
+    import pyrealsense2 as rs
+
+    h, w = color_intrinsics.height, color_intrinsics.width
+    aligned = np.zeros((h, w), dtype=np.uint16)
+    for y, x in zip(*np.nonzero(depth)):
+        z = float(depth[y, x]) * depth_scale
+        corners = []
+        for offset in (-0.5, 0.5):
+            point = rs.rs2_deproject_pixel_to_point(depth_intrinsics, [x + offset, y + offset], z)
+            point = rs.rs2_transform_point_to_point(extrinsics, point)
+            pixel = rs.rs2_project_point_to_pixel(color_intrinsics, point)
+            corners.append((int(pixel[0] + 0.5), int(pixel[1] + 0.5)))
+        (x0, y0), (x1, y1) = corners
+        if x0 < 0 or y0 < 0 or x1 >= w or y1 >= h:
+            continue
+        for v in range(y0, y1 + 1):
+            for u in range(x0, x1 + 1):
+                aligned[v, u] = min(aligned[v, u], depth[y, x]) if aligned[v, u] else depth[y, x]
+    return aligned
+
+
+def benchmark_alignment(args):
+    import pyrealsense2 as rs
+    from detection.alignment import DepthAligner
+
+    config = Config()
+    w, h = config.camera.resolution
+    depth_intrinsics = synthetic_intrinsics(w, h)
+    color_intrinsics = synthetic_intrinsics(w, h)
+    color_intrinsics.fx, color_intrinsics.fy, color_intrinsics.ppx = 615.0, 615.0, w / 2 + 4
+    extrinsics = rs.extrinsics()
+    angle = np.deg2rad(0.5)
+    rotation = np.array([[np.cos(angle), 0, np.sin(angle)], [0, 1, 0], [-np.sin(angle), 0, np.cos(angle)]])
+    extrinsics.rotation = rotation.T.reshape(-1).tolist()
+    extrinsics.translation = [0.015, 0.0, 0.0]
+    depth_scale = 0.001
+
+    rng = np.random.default_rng(0)
+    ys, xs = np.mgrid[0:h, 0:w]
+    bbox = np.array([w // 3, h // 3, 2 * w // 3, 2 * h // 3])
+    inside = (xs >= bbox[0]) & (xs < bbox[2]) & (ys >= bbox[1]) & (ys < bbox[3])
+    depth = np.where(inside, 800, 1500).astype(np.uint16) + rng.integers(0, 5, (h, w), dtype=np.uint16)
+    depth[rng.random((h, w)) < 0.05] = 0
+
+    started = time.perf_counter()
+    aligner = DepthAligner(depth_intrinsics, color_intrinsics, extrinsics, depth_scale, config)
+    print(f"projection tables built in {(time.perf_counter() - started) * 1000:.1f}ms")
+    full, roi = [], []
+    for _ in range(args.frames):
+        t0 = time.perf_counter()
+        full_depth = aligner.align_full(depth).copy()
+        t1 = time.perf_counter()
+        roi_depth = aligner.align(depth, [bbox])
+        t2 = time.perf_counter()
+        full.append(t1 - t0)
+        roi.append(t2 - t1)
+    report("full frame alignment", full)
+    report("roi alignment", roi)
+    x1, y1, x2, y2 = bbox
+    region = (slice(y1, y2), slice(x1, x2))
+    print(f"roi against full frame inside the bbox: {np.count_nonzero(roi_depth[region] != full_depth[region])} differing pixels")
+
+    if args.reference:
+        t0 = time.perf_counter()
+        expected = reference_alignment(depth, depth_intrinsics, color_intrinsics, extrinsics, depth_scale)
+        t1 = time.perf_counter()
+        differing = np.count_nonzero(expected != full_depth)
+        print(f"full frame against the pixel by pixel reference ({(t1 - t0):.1f}s): {differing} differing pixels of {w * h}")
+
+
+def percentile_bounds(values:np.ndarray, sigma:float) -> tuple[float, float]:
+    q1, q3 = np.percentile(values, [25, 75])
+    iqr = q3 - q1
+    return q1 - sigma * iqr, q3 + sigma * iqr
+
+
+def depth_values(rng:np.random.Generator, case:str, shape) -> np.ndarray:
+    """Depth around a box, spread over most of the range, or with 1% saturated pixels"""
+    if case == "wide":
+        return rng.integers(300, 3000, shape).astype(np.uint16)
+    values = rng.normal(1000, 40, shape).clip(1).astype(np.uint16)
+    if case == "outliers":
+        values[rng.random(shape) < 0.01] = 65535
+    return values
+
+
+def benchmark_quantiles(args):
+    from detection.statistics import iqr_bounds
+    from detection.distance import DistanceEstimator
+
+    rng = np.random.default_rng(0)
+    config = Config()
+    sigma = config.detection.mask_optimization_sigma
+    w, h = config.camera.resolution
+    estimator = DistanceEstimator(synthetic_intrinsics(w, h), config)
+    for case in args.cases:
+        print(f"{case} depth")
+        print("  mask IQR bounds, np.percentile against the histogram (percentile when the range is too wide)")
+        for size in args.sizes:
+            sort_based, counted, mismatches = [], [], 0
+            for _ in range(args.repeats):
+                values = depth_values(rng, case, size)
+                t0 = time.perf_counter()
+                expected = percentile_bounds(values, sigma)
+                t1 = time.perf_counter()
+                result = iqr_bounds(values, sigma)
+                t2 = time.perf_counter()
+                sort_based.append(t1 - t0)
+                counted.append(t2 - t1)
+                mismatches += expected != result
+            report(f"    {size} pixels percentile", sort_based)
+            report(f"    {size} pixels counted", counted)
+            print(f"    mismatches: {mismatches}")
+
+        # The corner patches are small, they are sorted in one batch
+        print(f"  {args.patches} corner patches of a {w}x{h} frame, per point np.percentile against the sorted batch")
+        per_point, batched, mismatches = [], [], 0
+        for _ in range(args.repeats):
+            depth = depth_values(rng, case, (h, w))
+            depth[rng.random((h, w)) < 0.1] = 0
+            corners = np.c_[rng.integers(0, w, args.patches), rng.integers(0, h, args.patches)]
+            t0 = time.perf_counter()
+            expected = [estimator.get_stable_value(depth, corner) for corner in corners]
+            t1 = time.perf_counter()
+            result = estimator.get_stable_values(depth, corners)
+            t2 = time.perf_counter()
+            per_point.append(t1 - t0)
+            batched.append(t2 - t1)
+            mismatches += int(np.count_nonzero(np.array(expected) != result))
+        report("    per point percentile", per_point)
+        report("    sorted batch", batched)
+        print(f"    mismatches: {mismatches}")
+
+
+def benchmark_pointcloud(args):
+    import tempfile
+    from detection.mask import CompactMask
+    from detection.projection import RayTable, deproject
+
+    w, h = Config().camera.resolution
+    # Non zero coefficients, the iterative undistortion is what the table saves on every frame
+    intrinsics = synthetic_intrinsics(w, h, [0.05, -0.02, 0.001, 0.001, 0.0])
+    with tempfile.TemporaryDirectory() as directory:
+        t0 = time.perf_counter()
+        RayTable(intrinsics, directory)
+        t1 = time.perf_counter()
+        table = RayTable(intrinsics, directory)
+        t2 = time.perf_counter()
+        print(f"ray table: build and save {(t1 - t0) * 1000:.1f}ms, memory mapped load {(t2 - t1) * 1000:.2f}ms (loaded={table.loaded})")
+
+        rng = np.random.default_rng(0)
+        depth = rng.integers(800, 1200, (h, w)).astype(np.uint16)
+        depth[rng.random((h, w)) < 0.1] = 0
+        box = np.zeros((h, w), dtype=bool)
+        box[h // 5:h // 5 + int(h * 0.55), w // 5:w // 5 + int(w * 0.55)] = True
+        mask = CompactMask.from_dense(box)
+
+        for name, region in (("full frame", None), (f"{box.mean():.0%} mask", mask)):
+            latencies = []
+            for _ in range(args.frames):
+                t0 = time.perf_counter()
+                points = table.point_cloud(depth, region)
+                latencies.append(time.perf_counter() - t0)
+            report(f"point cloud {name} ({len(points)} points)", latencies)
+
+        ys, xs = np.nonzero(box & (depth > 0))
+        t0 = time.perf_counter()
+        expected = deproject(intrinsics, np.c_[xs, ys], depth[ys, xs])
+        t1 = time.perf_counter()
+        points = table.point_cloud(depth, mask)
+        print(f"per frame deprojection of the mask {(t1 - t0) * 1000:.2f}ms, max difference {np.abs(points - expected).max():.4f} depth units")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Organaizer benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    replay = commands.add_parser("replay", help="End-to-end detection throughput over a recorded session")
+    replay.add_argument("session", help="Recorded session directory")
+    replay.add_argument("--frames", type=int, default=0, help="Maximum frames to process, 0 for the whole session")
+    replay.add_argument("--realtime", action="store_true", help="Pace frames like the original recording")
+    replay.set_defaults(func=benchmark_replay)
+
+    restart = commands.add_parser("restart", help="Time to the first measurement when starting and restarting the camera")
+    restart.add_argument("session", help="Recorded session directory")
+    restart.add_argument("--restarts", type=int, default=3)
+    restart.set_defaults(func=benchmark_restart)
+
+    startup = commands.add_parser("startup", help="Import time breakdown of the application start")
+    startup.add_argument("--module", default="app", help="Module to import, defaults to the application")
+    startup.add_argument("--top", type=int, default=15)
+    startup.set_defaults(func=benchmark_startup)
+
+    sam = commands.add_parser("sam", help="SAM over ROI crops against the full frame, latency and mask IoU")
+    sam.add_argument("session", help="Recorded session directory")
+    sam.add_argument("--step", type=int, default=1, help="Use every n-th frame of the session")
+    sam.add_argument("--roi-size", type=int, default=0, help="ROI inference size, defaults to DetectionConfig.sam_roi_size")
+    sam.set_defaults(func=benchmark_sam)
+
+    hexagon = commands.add_parser("hexagon", help="Best hexagon selection against the brute force search")
+    hexagon.add_argument("--max-points", type=int, default=16)
+    hexagon.add_argument("--samples", type=int, default=20)
+    hexagon.set_defaults(func=benchmark_hexagon)
+
+    tracker = commands.add_parser("tracker", help="Incremental dimension tracker against the window percentile estimate")
+    tracker.add_argument("--updates", type=int, default=5000)
+    tracker.add_argument("--outliers", type=float, default=0.1, help="Fraction of outlier measurements")
+    tracker.set_defaults(func=benchmark_tracker)
+
+    tracks = commands.add_parser("tracks", help="Multi-object tracking with several boxes in view")
+    tracks.add_argument("--tracks", type=int, nargs="+", default=[1, 2, 5, 10, 20])
+    tracks.add_argument("--frames", type=int, default=300)
+    tracks.add_argument("--misses", type=float, default=0.1, help="Probability of missing a box in a frame")
+    tracks.add_argument("--outliers", type=float, default=0.1, help="Fraction of outlier measurements")
+    tracks.set_defaults(func=benchmark_tracks)
+
+    distance = commands.add_parser("distance", help="Batched corner depth sampling and deprojection against the per side path")
+    distance.add_argument("--samples", type=int, default=200)
+    distance.set_defaults(func=benchmark_distance)
+
+    dimensions = commands.add_parser("dimensions", help="Point cloud box dimensions against the corner method over a recorded session")
+    dimensions.add_argument("session", help="Recorded session directory")
+    dimensions.add_argument("--frames", type=int, default=0, help="Maximum frames to process, 0 for the whole session")
+    dimensions.add_argument("--dimensions", type=float, nargs=3, default=None, metavar=("W", "H", "D"), help="Real size in cm of the recorded box")
+    dimensions.set_defaults(func=benchmark_dimensions)
+
+    temporal = commands.add_parser("temporal", help="Temporal depth fusion noise, validity and update cost")
+    temporal.add_argument("--frames", type=int, default=60)
+    temporal.add_argument("--noise", type=float, default=0.01, help="Depth noise as a fraction of the distance")
+    temporal.set_defaults(func=benchmark_temporal)
+
+    spatial = commands.add_parser("spatial", help="Spatial depth post-processing cost per stage, holes and side error")
+    spatial.add_argument("--frames", type=int, default=30)
+    spatial.add_argument("--noise", type=float, default=0.01, help="Depth noise as a fraction of the distance")
+    spatial.set_defaults(func=benchmark_spatial)
+
+    alignment = commands.add_parser("alignment", help="Depth to color alignment around the boxes against the full frame")
+    alignment.add_argument("--frames", type=int, default=30)
+    alignment.add_argument("--reference", action="store_true", help="Also compare against a pixel by pixel port of librealsense, slow")
+    alignment.set_defaults(func=benchmark_alignment)
+
+    quantiles = commands.add_parser("quantiles", help="Histogram mask quantiles and sorted corner patches against np.percentile")
+    quantiles.add_argument("--sizes", type=int, nargs="+", default=[5000, 20000, 60000, 150000], help="Mask sizes in pixels")
+    quantiles.add_argument("--patches", type=int, default=6)
+    quantiles.add_argument("--cases", nargs="+", choices=["normal", "wide", "outliers"], default=["normal", "wide", "outliers"])
+    quantiles.add_argument("--repeats", type=int, default=50)
+    quantiles.set_defaults(func=benchmark_quantiles)
+
+    pointcloud = commands.add_parser("pointcloud", help="Cached ray table point clouds against per frame deprojection")
+    pointcloud.add_argument("--frames", type=int, default=100)
+    pointcloud.set_defaults(func=benchmark_pointcloud)
+
+    args = parser.parse_args()
+    args.func(args)
\ No newline at end of file
@@ -0,0 +1,125 @@
+# All rights reserved. No part of this code may be reproduced, distributed, or transmitted
+# in any form or by any means, including photocopying, recording, or other electronic or
+# mechanical methods, without the prior written permission of the author, except in the
+# case of brief quotations embodied in critical reviews and certain other noncommercial
+# uses permitted by copyright law. For permission requests, please contact the author.
+#
+# Copyright (c) Lucía Alejandra Moreno Canuto, Gabriel Ernesto Gutiérrez Añez, Alicia Hernández Gutiérrez, Guillermo Daniel González Lozano
+
+
+import threading
+import numpy as np
+from typing import Any
+
+
+class PooledBuffer:
+    """Preallocated array owned by a BufferPool, it goes back to the pool when its last reference is released"""
+
+    __slots__ = ("array", "pool", "references")
+
+    def __init__(self, array:np.ndarray, pool:"BufferPool"):
+        self.array = array
+        self.pool = pool
+        self.references = 0
+
+
+class BufferPool:
+    """Fixed set of arrays of the same shape and dtype, it only allocates when every buffer is in use"""
+
+    def __init__(self, shape:tuple[int, ...], dtype:Any, size:int):
+        self.shape = shape
+        self.dtype = np.dtype(dtype)
+        self.lock = threading.Lock()
+        self.buffers:list[PooledBuffer] = [PooledBuffer(np.empty(shape, dtype=self.dtype), self) for _ in range(size)]
+        self.free:list[PooledBuffer] = list(self.buffers)
+        self.allocated_bytes = 0
+
+
+    def acquire(self) -> PooledBuffer:
+        with self.lock:
+            if self.free:
+                buffer = self.free.pop()
+            else:
+                buffer = PooledBuffer(np.empty(self.shape, dtype=self.dtype), self)
+                self.buffers.append(buffer)
+                self.allocated_bytes += buffer.array.nbytes
+            buffer.references = 1
+            return buffer
+
+
+    def retain(self, buffer:PooledBuffer):
+        with self.lock:
+            buffer.references += 1
+
+
+    def release(self, buffer:PooledBuffer):
+        with self.lock:
+            buffer.references -= 1
+            if buffer.references == 0:
+                self.free.append(buffer)
+
+
+class FrameLease:
+    """Color, depth and overlay buffers of a single frame, shared by everyone that still uses the frame.
+
+    Whoever receives a lease owns one reference and must release it, retain adds a
+    reference for a new owner (e.g. the recorder or the UI).
+    """
+
+    __slots__ = ("color_buffer", "depth_buffer", "overlay_buffer")
+
+    def __init__(self, color:PooledBuffer, depth:PooledBuffer, overlay:PooledBuffer):
+        self.color_buffer = color
+        self.depth_buffer = depth
+        self.overlay_buffer = overlay
+
+    @property
+    def color(self) -> np.ndarray:
+        return self.color_buffer.array
+
+    @property
+    def depth(self) -> np.ndarray:
+        return self.depth_buffer.array
+
+    @property
+    def overlay(self) -> np.ndarray:
+        return self.overlay_buffer.array
+
+    def retain(self) -> "FrameLease":
+        for buffer in (self.color_buffer, self.depth_buffer, self.overlay_buffer):
+            buffer.pool.retain(buffer)
+        return self
+
+    def release(self):
+        for buffer in (self.color_buffer, self.depth_buffer, self.overlay_buffer):
+            buffer.pool.release(buffer)
+
+
+class FramePool:
+    """Pools for the per frame buffers of a camera resolution, with allocation counters"""
+
+    def __init__(self, resolution:tuple[int, int], size:int):
+        w, h = resolution
+        self.color = BufferPool((h, w, 3), np.uint8, size)
+        self.depth = BufferPool((h, w), np.uint16, size)
+        self.overlay = BufferPool((h, w, 3), np.uint8, size)
+        self.frames = 0
+
+
+    def acquire(self) -> FrameLease:
+        self.frames += 1
+        return FrameLease(self.color.acquire(), self.depth.acquire(), self.overlay.acquire())
+
+
+    def allocated_bytes(self) -> int:
+        return self.color.allocated_bytes + self.depth.allocated_bytes + self.overlay.allocated_bytes
+
+
+    def stats(self) -> dict[str, Any]:
+        allocated = self.allocated_bytes()
+        return {
+            "frames": self.frames,
+            "buffers": len(self.color.buffers),
+            "allocated_bytes": allocated,
+            "bytes_per_frame": allocated / self.frames if self.frames > 0 else 0.0,
+        }
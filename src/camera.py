@@ -7,15 +7,49 @@
 # Copyright (c) Lucía Alejandra Moreno Canuto, Gabriel Ernesto Gutiérrez Añez, Alicia Hernández Gutiérrez, Guillermo Daniel González Lozano
 
 
+import os
 import time
+import threading
 import cv2
 import numpy as np
 import pyrealsense2 as rs
-from typing import Optional
+from collections import deque
+from datetime import datetime
+from typing import Optional, NamedTuple, List
 from detection.box import BoxDetection
+from detection.depth_filters import TemporalDepthFilter, SpatialDepthFilter
+from detection.alignment import DepthAligner
 from domain import Prediction
 from log import logging
 from config import Config
+import utils
+from recording import SessionReader, SessionWriter
+from buffers import FramePool, FrameLease
+
+
+class Frame(NamedTuple):
+    color: np.ndarray
+    depth: np.ndarray
+    timestamp: float
+    lease: Optional[FrameLease] = None
+    aligned: bool = True
+
+
+def release_frame(frame:Optional[Frame]):
+    if frame is not None and frame.lease is not None:
+        frame.lease.release()
+
+
+def release_prediction(prediction:Optional[Prediction]):
+    if prediction is not None and prediction.buffers is not None:
+        prediction.buffers.release()
+
+
+def release_predictions(predictions:Optional[List[Prediction]]):
+    # Predictions of the same frame share a single reference to the frame buffers
+    if predictions:
+        release_prediction(predictions[0])
+
 
 class DepthCamera:
 
@@ -23,11 +57,23 @@ class DepthCamera:
     def __init__(self, config:Config):
         self.config:Config = config
         self.detection = BoxDetection(config)
+        self.temporal_filter = TemporalDepthFilter(config) if config.depth.temporal_filter else None
+        self.spatial_filter = SpatialDepthFilter(config) if config.depth.spatial_filter else None
+        self.last_bboxes:List[np.ndarray] = []
+        self.last_aligned:Optional[bool] = None
         self.pipeline = None
         self.depth_intrinsics = None
         self.distance_estimator = None
         self.align = None
+        self.aligner:Optional[DepthAligner] = None
+        self.grabbed = 0
+        self.recorder:Optional[SessionWriter] = None
         self.running = False
+
+        w, h = self.config.camera.resolution
+        self.frame_pool = FramePool(self.config.camera.resolution, self.config.camera.buffer_pool_size)
+        self.gray = np.empty((h, w), dtype=np.uint8)
+        self.enhanced = np.empty((h, w, 3), dtype=np.uint8)
         
         self.rs_config = rs.config()
         self.rs_config.disable_all_streams()
@@ -42,27 +88,80 @@ class DepthCamera:
                 pipeline_profile = self.pipeline.start(self.rs_config)
                 self.align = rs.align(rs.stream.color)
                 self.depth_intrinsics:rs.intrinsics = rs.video_stream_profile(pipeline_profile.get_stream(rs.stream.depth)).get_intrinsics()
+                if self.config.depth.alignment == "roi":
+                    self.aligner = self.__create_aligner__(pipeline_profile)
                 
                 self.detection.init(self.depth_intrinsics)
+                if self.temporal_filter is not None:
+                    self.temporal_filter.clear()
+                self.last_bboxes = []
+                self.last_aligned = None
                 self.running = True
                 logging.info("Depth Camera openned.")
+
+                if self.config.recording.directory:
+                    self.start_recording(os.path.join(self.config.recording.directory, datetime.now().strftime("%Y%m%d_%H%M%S")))
             except:
                 self.running = False
+                # The stream may already be running, leaving it open keeps the device busy
+                try:
+                    if self.pipeline:
+                        self.pipeline.stop()
+                except:
+                    logging.error("Failed to close camera.", exc_info=True)
                 self.pipeline = None
                 self.depth_intrinsics = None
                 self.distance_estimator = None
                 self.align = None
+                self.aligner = None
                 logging.error("Unable to open camera", exc_info=True)
 
         return self.running
 
 
+    def __create_aligner__(self, pipeline_profile:rs.pipeline_profile) -> DepthAligner:
+        depth_profile = rs.video_stream_profile(pipeline_profile.get_stream(rs.stream.depth))
+        color_profile = rs.video_stream_profile(pipeline_profile.get_stream(rs.stream.color))
+        return DepthAligner(
+            depth_profile.get_intrinsics(),
+            color_profile.get_intrinsics(),
+            depth_profile.get_extrinsics_to(color_profile),
+            pipeline_profile.get_device().first_depth_sensor().get_depth_scale(),
+            self.config
+        )
+
+
     def is_open(self):
         return self.running
 
 
+    def is_recording(self) -> bool:
+        return self.recorder is not None
+
+
+    def start_recording(self, path:str):
+        if self.is_recording() or self.depth_intrinsics is None:
+            return
+        self.recorder = SessionWriter(
+            path,
+            self.depth_intrinsics,
+            self.config.camera.resolution,
+            self.config.camera.fps,
+            chunk_size=self.config.recording.chunk_size,
+            queue_size=self.config.recording.queue_size
+        )
+        self.recorder.start()
+
+
+    def stop_recording(self):
+        if self.recorder is not None:
+            recorder, self.recorder = self.recorder, None
+            recorder.close()
+
+
     def stop_camera(self):
         try:
+            self.stop_recording()
             if self.is_open():
                 logging.info("Closing camera ...")
                 try:
@@ -75,11 +174,12 @@ class DepthCamera:
                 self.depth_intrinsics = None
                 self.distance_estimator = None
                 self.align = None
+                self.aligner = None
                 logging.info("Resources closed!")
         finally:
             self.running = False
 
-    def read(self) -> Optional[Prediction]:
+    def grab(self) -> Optional[Frame]:
         if not self.is_open(): return None
         try:
             frames:rs.composite_frame = self.pipeline.wait_for_frames(timeout_ms=1000)
@@ -91,21 +191,309 @@ class DepthCamera:
                     logging.warning("Depth and Color frame not found.")
                     return None
 
-                frames = self.align.process(frames)
-                depth_frame = frames.get_depth_frame()
-                color_frame = frames.get_color_frame()
+                # In ROI mode the depth stays raw and the detection aligns it around the boxes, recordings
+                # are always aligned. A full alignment is still timed now and then as the reference
+                self.grabbed += 1
+                aligned = self.aligner is None or self.is_recording()
+                if aligned or (self.grabbed - 1) % self.config.depth.alignment_sample_interval == 0:
+                    started = time.perf_counter()
+                    aligned_frames = self.align.process(frames)
+                    if self.aligner is not None:
+                        self.aligner.record_full(time.perf_counter() - started)
+                    if aligned:
+                        frames = aligned_frames
+                        depth_frame = frames.get_depth_frame()
+                        color_frame = frames.get_color_frame()
 
                 if not depth_frame or not color_frame:
                     logging.warning("Depth and Color frame not found after alignment.")
                     return None
-                
-                color_frame = np.asanyarray(color_frame.get_data()).copy()
-                depth_frame = np.asanyarray(depth_frame.get_data()).copy()
-                enhanced = cv2.cvtColor(cv2.equalizeHist(cv2.cvtColor(color_frame, cv2.COLOR_RGB2GRAY)), cv2.COLOR_GRAY2BGR)
 
-                return self.detection.predict(color_frame, enhanced, depth_frame)
+                return self.__to_frame__(
+                    np.asanyarray(color_frame.get_data()),
+                    np.asanyarray(depth_frame.get_data()),
+                    frames.get_timestamp(),
+                    aligned
+                )
             logging.warning("Frames are None")
         except:
             logging.error("Unable to capture frames.", exc_info=True)
 
-        return None
\ No newline at end of file
+        return None
+
+
+    def __to_frame__(self, color:np.ndarray, depth:np.ndarray, timestamp:float, aligned:bool=True) -> Frame:
+        # The SDK (or the memory mapped session) owns the source buffers, they are copied
+        # once into pooled buffers that live until the last user of the frame releases them.
+        lease = self.frame_pool.acquire()
+        np.copyto(lease.color, color)
+        np.copyto(lease.depth, depth)
+        if self.recorder is not None:
+            self.recorder.write(lease.color, lease.depth, timestamp, lease.retain())
+        return Frame(color=lease.color, depth=lease.depth, timestamp=timestamp, lease=lease, aligned=aligned)
+
+
+    def process(self, frame:Frame) -> List[Prediction]:
+        """Runs the detection over the frame, the predictions take over the frame buffers"""
+        utils.enhance(frame.color, self.gray, self.enhanced)
+        overlay = frame.lease.overlay if frame.lease is not None else None
+        try:
+            aligner = None if frame.aligned else self.aligner
+            # Raw and aligned depth pixels are not the same points, the fused window starts over
+            # whenever recording switches between them
+            if self.temporal_filter is not None and frame.aligned != self.last_aligned:
+                self.temporal_filter.clear()
+            self.last_aligned = frame.aligned
+            # The raw depth stays in the frame (and the recording), detection measures the fused one
+            depth = frame.depth if self.temporal_filter is None else self.temporal_filter.update(frame.depth)
+            if self.spatial_filter is not None:
+                # The bboxes are color frame ones, over raw depth the ROI is where they come from
+                bboxes = self.last_bboxes if aligner is None else aligner.depth_bboxes(self.last_bboxes)
+                depth = self.spatial_filter.process(depth, bboxes)
+            if aligner is not None:
+                aligner.next_frame()
+            predictions = self.detection.predict_all(frame.color, self.enhanced, depth, overlay=overlay, aligner=aligner)
+        except:
+            release_frame(frame)
+            raise
+        for prediction in predictions:
+            prediction.buffers = frame.lease
+        self.last_bboxes = [p.bbox for p in predictions if p.bbox is not None]
+        return predictions
+
+
+    def read(self) -> Optional[Prediction]:
+        """Grabs and processes a frame, the caller owns the returned prediction buffers
+        and must hand them back with release_prediction"""
+        frame = self.grab()
+        if frame is None: return None
+        try:
+            return self.process(frame)[0]
+        except:
+            logging.error("Unable to process frame.", exc_info=True)
+
+        return None
+
+
+class ReplayCamera(DepthCamera):
+    """Plays a recorded session through the same surface as DepthCamera, either paced like the
+    original recording or as fast as the detection allows"""
+
+    def __init__(self, config:Config):
+        DepthCamera.__init__(self, config)
+        self.reader:Optional[SessionReader] = None
+        self.index = 0
+        self.clock_start:Optional[float] = None
+        self.first_timestamp:Optional[float] = None
+
+
+    def open_camera(self):
+        if not self.is_open():
+            try:
+                self.reader = SessionReader(self.config.replay.session)
+                self.depth_intrinsics = self.reader.intrinsics
+                self.index = 0
+                self.clock_start = None
+                self.detection.init(self.depth_intrinsics)
+                if self.temporal_filter is not None:
+                    self.temporal_filter.clear()
+                self.last_bboxes = []
+                self.last_aligned = None
+                self.running = len(self.reader) > 0
+                logging.info(f"Replaying {len(self.reader)} frames from {self.config.replay.session}.")
+            except:
+                self.running = False
+                self.reader = None
+                self.depth_intrinsics = None
+                logging.error("Unable to open recorded session", exc_info=True)
+
+        return self.running
+
+
+    def stop_camera(self):
+        try:
+            if self.reader is not None:
+                self.reader.close()
+            self.reader = None
+            self.depth_intrinsics = None
+        finally:
+            self.running = False
+
+
+    def grab(self) -> Optional[Frame]:
+        if not self.is_open(): return None
+        if self.index >= len(self.reader):
+            if not self.config.replay.loop:
+                logging.info("Recorded session finished.")
+                self.running = False
+                return None
+            self.index = 0
+            self.clock_start = None
+
+        color, depth, timestamp = self.reader[self.index]
+        self.index += 1
+
+        if self.config.replay.realtime:
+            if self.clock_start is None:
+                self.clock_start = time.perf_counter()
+                self.first_timestamp = timestamp
+            delay = (timestamp - self.first_timestamp) / 1000 - (time.perf_counter() - self.clock_start)
+            if delay > 0:
+                time.sleep(delay)
+
+        return self.__to_frame__(color, depth, timestamp)
+
+
+def create_camera(config:Config) -> DepthCamera:
+    if config.replay.session:
+        return ReplayCamera(config)
+    return DepthCamera(config)
+
+
+class FrameRingBuffer:
+    """Bounded buffer of captured frames, the consumer always gets the newest frame and stale ones are dropped"""
+
+    def __init__(self, capacity:int=2):
+        self.frames:deque[Frame] = deque(maxlen=max(1, capacity))
+        self.condition = threading.Condition()
+        self.dropped = 0
+
+
+    def put(self, frame:Frame):
+        with self.condition:
+            if len(self.frames) == self.frames.maxlen:
+                self.dropped += 1
+                release_frame(self.frames.popleft())
+            self.frames.append(frame)
+            self.condition.notify()
+
+
+    def get(self, timeout:float) -> Optional[Frame]:
+        with self.condition:
+            if not self.frames:
+                self.condition.wait(timeout)
+            if not self.frames:
+                return None
+            frame = self.frames.pop()
+            self.dropped += len(self.frames)
+            self.clear()
+            return frame
+
+
+    def clear(self):
+        with self.condition:
+            while self.frames:
+                release_frame(self.frames.popleft())
+
+
+class PredictionSlot:
+    """Thread safe holder of the latest frame predictions, the sequence changes every time new ones are published.
+
+    The slot owns one reference to the predictions buffers and drops it when the predictions are
+    replaced. get hands a new reference to the caller whenever the sequence differs from the
+    one the caller already has.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.predictions:Optional[List[Prediction]] = None
+        self.sequence = 0
+
+
+    def set(self, predictions:Optional[List[Prediction]]):
+        with self.lock:
+            previous, self.predictions = self.predictions, predictions
+            self.sequence += 1
+        release_predictions(previous)
+
+
+    def get(self, sequence:int=-1) -> tuple[int, Optional[List[Prediction]]]:
+        with self.lock:
+            if sequence != self.sequence and self.predictions and self.predictions[0].buffers is not None:
+                self.predictions[0].buffers.retain()
+            return self.sequence, self.predictions
+
+
+class CameraPipeline:
+    """Runs capture and detection on their own threads so the UI only polls the latest prediction"""
+
+    def __init__(self, camera:DepthCamera):
+        self.camera = camera
+        self.frames = FrameRingBuffer(camera.config.camera.frame_buffer_size)
+        self.predictions = PredictionSlot()
+        self.stop_event = threading.Event()
+        self.threads:list[threading.Thread] = []
+        self.processed = 0
+
+
+    def is_running(self) -> bool:
+        return len(self.threads) > 0
+
+
+    def has_failed(self) -> bool:
+        """The threads stopped on their own, stop has not been called yet"""
+        return self.is_running() and self.stop_event.is_set()
+
+
+    def start(self) -> bool:
+        if self.is_running():
+            return True
+
+        if not self.camera.open_camera():
+            return False
+
+        self.stop_event.clear()
+        self.frames.clear()
+        self.predictions.set(None)
+        self.threads = [
+            threading.Thread(target=self.__capture_loop__, name="camera-capture", daemon=True),
+            threading.Thread(target=self.__detection_loop__, name="camera-detection", daemon=True),
+        ]
+        for thread in self.threads:
+            thread.start()
+        logging.info("Camera pipeline started.")
+        return True
+
+
+    def stop(self):
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join(timeout=5)
+        self.threads = []
+        self.camera.stop_camera()
+        self.frames.clear()
+        self.predictions.set(None)
+        logging.info(f"Camera pipeline stopped, processed {self.processed} frames and dropped {self.frames.dropped}, buffers {self.camera.frame_pool.stats()}, detection {self.camera.detection.stats()}.")
+
+
+    def latest(self, sequence:int=-1) -> tuple[int, Optional[List[Prediction]]]:
+        return self.predictions.get(sequence)
+
+
+    def __capture_loop__(self):
+        while not self.stop_event.is_set() and self.camera.is_open():
+            frame = self.camera.grab()
+            if frame is not None:
+                self.frames.put(frame)
+
+
+    def __detection_loop__(self):
+        # The camera opens (on the UI thread) without the models, they are waited for here
+        try:
+            while not self.camera.detection.load_models(timeout=0.1):
+                if self.stop_event.is_set():
+                    return
+        except:
+            logging.error("Unable to load the detection models, stopping the pipeline.", exc_info=True)
+            self.stop_event.set()
+            return
+
+        while not self.stop_event.is_set():
+            frame = self.frames.get(timeout=0.1)
+            if frame is None:
+                continue
+            try:
+                self.predictions.set(self.camera.process(frame))
+                self.processed += 1
+            except:
+                logging.error("Unable to process frame.", exc_info=True)
\ No newline at end of file
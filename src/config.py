@@ -7,12 +7,35 @@
 # Copyright (c) Lucía Alejandra Moreno Canuto, Gabriel Ernesto Gutiérrez Añez, Alicia Hernández Gutiérrez, Guillermo Daniel González Lozano
 
 
+from typing import Optional, Literal
 from pydantic import BaseModel, Field
 
 
 class DistanceConfig(BaseModel):
     distance_factor:float = Field(default=1)
     to_centimeter:float = Field(default=1/10)
+    ray_cache:Optional[str] = Field(default="../cache/rays")
+
+
+class DepthConfig(BaseModel):
+    temporal_filter:bool = Field(default=False)
+    temporal_mode:Literal["mean", "median"] = Field(default="mean")
+    temporal_frames:int = Field(default=8)
+    temporal_min_valid:float = Field(default=0.5)
+    temporal_motion_threshold:float = Field(default=0.05)
+    temporal_motion_fraction:float = Field(default=0.05)
+    spatial_filter:bool = Field(default=False)
+    spatial_decimation:int = Field(default=2)
+    spatial_diameter:int = Field(default=5)
+    spatial_sigma_space:float = Field(default=2)
+    spatial_sigma_depth:float = Field(default=40)
+    hole_filling_radius:int = Field(default=2)
+    spatial_roi:bool = Field(default=False)
+    spatial_roi_padding:float = Field(default=0.2)
+    alignment:Literal["full", "roi"] = Field(default="full")
+    alignment_padding:float = Field(default=0.15)
+    alignment_min_depth:float = Field(default=150)
+    alignment_sample_interval:int = Field(default=300)
 
 
 class DetectionConfig(BaseModel):
@@ -20,16 +43,65 @@ class DetectionConfig(BaseModel):
     iou:float=Field(default=0.1)
     box_model:str = Field(default="../training/best.pt")
     sam_model:str = Field(default="../training/sam2_t.pt")
+    box_backend:Literal["torch", "onnx", "openvino"] = Field(default="torch")
+    sam_backend:Literal["torch", "onnx", "openvino"] = Field(default="torch")
+    sam_encoder:Optional[str] = Field(default=None)
+    warmup:bool = Field(default=True)
+    mask_optimization:bool = Field(default=True)
     mask_optimization_sigma:float = Field(default=3.5)
+    multi_object:bool = Field(default=False)
+    detection_interval:int = Field(default=1)
+    tracking_min_confidence:float = Field(default=0.6)
+    tracking_points:int = Field(default=64)
+    tracking_iou:float = Field(default=0.3)
+    tracking_distance:float = Field(default=0.5)
+    scene_gate:bool = Field(default=False)
+    scene_gate_size:tuple[int, int] = Field(default=(80, 60))
+    scene_gate_gray_threshold:float = Field(default=2.0)
+    scene_gate_depth_threshold:float = Field(default=4.0)
+    scene_gate_max_skip:int = Field(default=30)
+    mask_cache:bool = Field(default=False)
+    mask_cache_iou:float = Field(default=0.9)
+    mask_cache_refresh:int = Field(default=10)
+    sam_roi:bool = Field(default=False)
+    sam_roi_padding:float = Field(default=0.1)
+    sam_roi_size:int = Field(default=512)
+    dimensions_method:Literal["corners", "pointcloud"] = Field(default="corners")
+    pointcloud_budget_ms:float = Field(default=15)
+    pointcloud_max_points:int = Field(default=4000)
+    pointcloud_min_points:int = Field(default=300)
+    pointcloud_min_faces:int = Field(default=2)
+    pointcloud_min_confidence:float = Field(default=0.0)
+    ransac_iterations:int = Field(default=64)
+    ransac_threshold:float = Field(default=8)
+    ransac_min_inliers:float = Field(default=0.1)
 
 
 class CameraConfig(BaseModel):
     camera_id:int = Field(default=0)
     resolution: tuple[int, int] = Field(default=(640, 480))
     fps:int = Field(default=30)
+    frame_buffer_size:int = Field(default=2)
+    buffer_pool_size:int = Field(default=6)
+    ui_fps:int = Field(default=60)
+
+
+class ReplayConfig(BaseModel):
+    session:Optional[str] = Field(default=None)
+    realtime:bool = Field(default=True)
+    loop:bool = Field(default=False)
+
+
+class RecordingConfig(BaseModel):
+    directory:Optional[str] = Field(default=None)
+    chunk_size:int = Field(default=150)
+    queue_size:int = Field(default=60)
     
     
 class Config(BaseModel):
     camera:CameraConfig = Field(default=CameraConfig())
+    replay:ReplayConfig = Field(default=ReplayConfig())
+    recording:RecordingConfig = Field(default=RecordingConfig())
     detection:DetectionConfig = Field(default=DetectionConfig())
-    distance:DistanceConfig = Field(default=DistanceConfig())
\ No newline at end of file
+    distance:DistanceConfig = Field(default=DistanceConfig())
+    depth:DepthConfig = Field(default=DepthConfig())
\ No newline at end of file
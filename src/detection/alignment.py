@@ -0,0 +1,161 @@
+# All rights reserved. No part of this code may be reproduced, distributed, or transmitted
+# in any form or by any means, including photocopying, recording, or other electronic or
+# mechanical methods, without the prior written permission of the author, except in the
+# case of brief quotations embodied in critical reviews and certain other noncommercial
+# uses permitted by copyright law. For permission requests, please contact the author.
+#
+# Copyright (c) Lucía Alejandra Moreno Canuto, Gabriel Ernesto Gutiérrez Añez, Alicia Hernández Gutiérrez, Guillermo Daniel González Lozano
+
+import time
+import numpy as np
+import pyrealsense2 as rs
+from typing import Optional, List
+from config import Config
+from detection.projection import EPSILON, deproject_rays, project_pixels, distort
+
+
+class DepthAligner:
+    """Aligns the raw depth to the color frame only around the boxes, the same way rs.align does.
+
+    Every depth pixel is spread over the color pixels between the projections of its top left
+    and bottom right corners, the nearest depth wins. The depth rays of both corners, already
+    rotated to the color camera, are computed once from the intrinsics and extrinsics, so a
+    frame only scales them by the depth, translates and projects them. Only the depth pixels
+    that can land in the padded bboxes are mapped, the rest of the aligned depth is zero.
+    """
+
+    def __init__(self, depth_intrinsics:rs.intrinsics, color_intrinsics:rs.intrinsics, extrinsics:rs.extrinsics, depth_scale:float, config:Config):
+        self.config = config
+        self.depth_intrinsics = depth_intrinsics
+        self.color_intrinsics = color_intrinsics
+        # librealsense keeps the rotation column major and the translation in meters
+        self.rotation = np.array(extrinsics.rotation, dtype=np.float64).reshape(3, 3).T
+        self.translation = (np.array(extrinsics.translation, dtype=np.float64) / depth_scale).astype(np.float32)
+        h, w = depth_intrinsics.height, depth_intrinsics.width
+        self.corners = [self.__rotated_rays__(w, h, offset) for offset in (-0.5, 0.5)]
+        self.output = np.zeros((color_intrinsics.height, color_intrinsics.width), dtype=np.uint16)
+        self.buffer = np.empty(self.output.size, dtype=np.uint16)
+        self.frames = 0
+        self.roi_frames = 0
+        self.roi_elapsed = 0.0
+        self.full_samples = 0
+        self.full_elapsed = 0.0
+
+
+    def __rotated_rays__(self, w:int, h:int, offset:float) -> list[np.ndarray]:
+        """x, y and z planes of the rays, a plane per coordinate keeps the frame math contiguous"""
+        ys, xs = np.mgrid[0:h, 0:w]
+        pixels = np.column_stack([xs.reshape(-1), ys.reshape(-1)]) + offset
+        rays = np.column_stack([deproject_rays(self.depth_intrinsics, pixels), np.ones(len(pixels))])
+        rotated = (rays @ self.rotation.T).astype(np.float32)
+        return [np.ascontiguousarray(rotated[:, i].reshape(h, w)) for i in range(3)]
+
+
+    def __depth_region__(self, bboxes:List[np.ndarray]) -> Optional[tuple[slice, slice]]:
+        """Depth pixels that can land in the padded union of the bboxes. The outline of the union is
+        mapped back to the depth frame at infinity, nearer depths shift along the baseline up to
+        the parallax of the closest depth"""
+        boxes = np.array(bboxes)
+        x1, y1 = boxes[:, 0].min(), boxes[:, 1].min()
+        x2, y2 = boxes[:, 2].max(), boxes[:, 3].max()
+        pad = max(self.config.depth.alignment_padding * max(x2 - x1, y2 - y1), 16)
+        xs = np.linspace(x1 - pad, x2 + pad, 8)
+        ys = np.linspace(y1 - pad, y2 + pad, 8)
+        outline = np.concatenate([np.c_[xs, np.full(8, ys[0])], np.c_[xs, np.full(8, ys[-1])], np.c_[np.full(8, xs[0]), ys], np.c_[np.full(8, xs[-1]), ys]])
+        rays = np.column_stack([deproject_rays(self.color_intrinsics, outline), np.ones(len(outline))]) @ self.rotation
+        pixels = project_pixels(self.depth_intrinsics, rays)
+
+        parallax = self.translation[:2] / self.config.depth.alignment_min_depth * [self.depth_intrinsics.fx, self.depth_intrinsics.fy]
+        h, w = self.depth_intrinsics.height, self.depth_intrinsics.width
+        dx1, dy1 = np.floor(pixels.min(axis=0) - np.maximum(parallax, 0) - 2).astype(int)
+        dx2, dy2 = np.ceil(pixels.max(axis=0) + np.maximum(-parallax, 0) + 2).astype(int)
+        dx1, dy1, dx2, dy2 = max(dx1, 0), max(dy1, 0), min(dx2 + 1, w), min(dy2 + 1, h)
+        if dx2 <= dx1 or dy2 <= dy1:
+            return None
+        return slice(dy1, dy2), slice(dx1, dx2)
+
+
+    def __map__(self, depth:np.ndarray, region:tuple[slice, slice]):
+        z = depth[region]
+        valid = z > 0
+        if not valid.any():
+            return
+        scale = z.astype(np.float32)
+        h, w = self.output.shape
+        intrinsics = self.color_intrinsics
+        projected = []
+        for rays in self.corners:
+            x, y, depth_z = (plane[region] * scale + t for plane, t in zip(rays, self.translation))
+            np.maximum(depth_z, EPSILON, out=depth_z)
+            x, y = distort(intrinsics, x / depth_z, y / depth_z)
+            # Rounded like librealsense, (int)(x + 0.5) truncates towards zero. Pixels without depth
+            # project anywhere, they are clipped to stay castable and dropped below
+            u = np.clip(x * intrinsics.fx + intrinsics.ppx + 0.5, -1, w).astype(np.int32)
+            v = np.clip(y * intrinsics.fy + intrinsics.ppy + 0.5, -1, h).astype(np.int32)
+            projected.append((u, v))
+        (u1, v1), (u2, v2) = projected
+        inside = valid & (u1 >= 0) & (v1 >= 0) & (u2 < w) & (v2 < h)
+        u1, v1, u2, v2 = u1[inside], v1[inside], u2[inside], v2[inside]
+        values = z[inside]
+
+        # Corners are a pixel or two apart, the footprints are spread one offset at a time and
+        # the nearest depth of every color pixel is kept
+        self.buffer.fill(np.iinfo(np.uint16).max)
+        for dv in range(int((v2 - v1).max(initial=0)) + 1):
+            for du in range(int((u2 - u1).max(initial=0)) + 1):
+                spread = (u1 + du <= u2) & (v1 + dv <= v2)
+                np.minimum.at(self.buffer, (v1[spread] + dv) * w + (u1[spread] + du), values[spread])
+        self.buffer[self.buffer == np.iinfo(np.uint16).max] = 0
+        self.output.reshape(-1)[:] = self.buffer
+
+
+    def next_frame(self):
+        self.frames += 1
+
+
+    def depth_bboxes(self, bboxes:List[np.ndarray]) -> List[np.ndarray]:
+        """The color frame bboxes as a single bbox of the raw depth frame pixels that can land in them"""
+        region = self.__depth_region__(bboxes) if bboxes else None
+        if region is None:
+            return []
+        rows, cols = region
+        return [np.array([cols.start, rows.start, cols.stop, rows.stop])]
+
+
+    def align(self, depth:np.ndarray, bboxes:List[np.ndarray]) -> np.ndarray:
+        """Color aligned depth around the bboxes, zero elsewhere, overwritten by the next call"""
+        started = time.perf_counter()
+        self.output.fill(0)
+        region = self.__depth_region__(bboxes) if bboxes else None
+        if region is not None:
+            self.__map__(depth, region)
+        self.roi_frames += 1
+        self.roi_elapsed += time.perf_counter() - started
+        return self.output
+
+
+    def align_full(self, depth:np.ndarray) -> np.ndarray:
+        """Color aligned depth of the whole frame, like rs.align"""
+        self.output.fill(0)
+        h, w = depth.shape
+        self.__map__(depth, (slice(0, h), slice(0, w)))
+        return self.output
+
+
+    def record_full(self, elapsed:float):
+        """Time of a full frame alignment, the reference for the saved time"""
+        self.full_samples += 1
+        self.full_elapsed += elapsed
+
+
+    def stats(self) -> dict[str, float]:
+        full_ms = 1000 * self.full_elapsed / self.full_samples if self.full_samples else 0.0
+        roi_ms_per_frame = 1000 * self.roi_elapsed / self.frames if self.frames else 0.0
+        return {
+            "alignment_frames": self.frames,
+            "alignment_roi_frames": self.roi_frames,
+            "alignment_skipped_frames": self.frames - self.roi_frames,
+            "alignment_full_ms": full_ms,
+            "alignment_roi_ms": 1000 * self.roi_elapsed / self.roi_frames if self.roi_frames else 0.0,
+            "alignment_saved_ms_per_frame": full_ms - roi_ms_per_frame if self.full_samples else 0.0,
+        }
\ No newline at end of file
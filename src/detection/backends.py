@@ -0,0 +1,207 @@
+# All rights reserved. No part of this code may be reproduced, distributed, or transmitted
+# in any form or by any means, including photocopying, recording, or other electronic or
+# mechanical methods, without the prior written permission of the author, except in the
+# case of brief quotations embodied in critical reviews and certain other noncommercial
+# uses permitted by copyright law. For permission requests, please contact the author.
+#
+# Copyright (c) Lucía Alejandra Moreno Canuto, Gabriel Ernesto Gutiérrez Añez, Alicia Hernández Gutiérrez, Guillermo Daniel González Lozano
+
+import os
+import time
+import importlib.util
+import numpy as np
+import torch
+from torch.utils import _pytree as pytree
+from typing import Any, List, Optional
+from ultralytics import YOLO, SAM
+from config import Config
+from log import logging
+
+
+# torch runs the ultralytics checkpoints as they are. onnx and openvino run the YOLO model
+# exported by ultralytics and, for SAM, swap the image encoder (where almost all the SAM time
+# goes) for the exported encoder while prompt encoding and mask decoding stay in torch.
+BACKENDS = ("torch", "onnx", "openvino")
+# Optional packages of every backend, installed with requirements-backends.txt
+BACKEND_MODULES = {"torch": (), "onnx": ("onnx", "onnxruntime"), "openvino": ("openvino",)}
+
+
+def check_backend(backend:str, *modules:str):
+    """Fails early, with the install hint, when the packages of the backend are missing"""
+    missing = [m for m in (*BACKEND_MODULES.get(backend, ()), *modules) if importlib.util.find_spec(m) is None]
+    if missing:
+        raise ImportError(f"The {backend} backend needs {', '.join(missing)}, install them with pip install -r requirements-backends.txt")
+
+
+def box_model_path(weights:str, backend:str) -> str:
+    base, extension = os.path.splitext(weights)
+    if backend == "onnx":
+        return weights if extension == ".onnx" else base + ".onnx"
+    if backend == "openvino":
+        return weights if weights.rstrip("/").endswith("_openvino_model") else base + "_openvino_model"
+    return weights
+
+
+def sam_encoder_path(weights:str, backend:str, imgsz:int) -> str:
+    base, _ = os.path.splitext(weights)
+    if backend == "onnx":
+        return f"{base}_encoder_{imgsz}.onnx"
+    return f"{base}_encoder_{imgsz}_openvino.xml"
+
+
+def export_box_model(weights:str, backend:str, **kwargs) -> str:
+    if backend == "torch":
+        return weights
+    path = YOLO(weights).export(format=backend, **kwargs)
+    logging.info(f"Exported {weights} to {path}")
+    return str(path)
+
+
+class EncoderOutputs(torch.nn.Module):
+    """Flattens the (possibly nested) encoder outputs so they can be exported as a plain tuple"""
+
+    def __init__(self, encoder:torch.nn.Module):
+        super().__init__()
+        self.encoder = encoder
+
+    def forward(self, image:torch.Tensor):
+        return tuple(pytree.tree_flatten(self.encoder(image))[0])
+
+
+def export_sam_encoder(weights:str, backend:str, imgsz:int=1024) -> str:
+    if backend == "torch":
+        return weights
+
+    sam = SAM(weights)
+    encoder = sam.model.image_encoder.eval()
+    example = torch.zeros((1, 3, imgsz, imgsz), dtype=torch.float32)
+    with torch.no_grad():
+        _, spec = pytree.tree_flatten(encoder(example))
+
+    path = sam_encoder_path(weights, backend, imgsz)
+    module = EncoderOutputs(encoder).eval()
+    if backend == "onnx":
+        torch.onnx.export(module, (example,), path, input_names=["image"], opset_version=17)
+    elif backend == "openvino":
+        import openvino as ov
+        ov.save_model(ov.convert_model(module, example_input=example), path)
+    else:
+        raise ValueError(f"Unknown inference backend {backend}")
+
+    with open(path + ".spec", "w") as f:
+        f.write(pytree.treespec_dumps(spec))
+    logging.info(f"Exported {weights} image encoder to {path}")
+    return path
+
+
+class EncoderRuntime(torch.nn.Module):
+    """Drop-in for the SAM image encoder running the exported model on ONNX Runtime or OpenVINO"""
+
+    def __init__(self, path:str, backend:str):
+        super().__init__()
+        self.backend = backend
+        with open(path + ".spec", "r") as f:
+            self.spec = pytree.treespec_loads(f.read())
+
+        if backend == "onnx":
+            import onnxruntime as ort
+            self.session = ort.InferenceSession(path, providers=["CPUExecutionProvider"])
+            self.input_name = self.session.get_inputs()[0].name
+        else:
+            import openvino as ov
+            self.session = ov.Core().compile_model(path, "CPU")
+
+    def forward(self, image:torch.Tensor) -> Any:
+        inputs = image.detach().cpu().float().numpy()
+        if self.backend == "onnx":
+            outputs = self.session.run(None, {self.input_name: inputs})
+        else:
+            result = self.session(inputs)
+            outputs = [result[output] for output in self.session.outputs]
+        return pytree.tree_unflatten([torch.from_numpy(np.asarray(o)) for o in outputs], self.spec)
+
+
+def load_box_model(weights:str, backend:str) -> YOLO:
+    check_backend(backend)
+    path = box_model_path(weights, backend)
+    if not os.path.exists(path):
+        path = export_box_model(weights, backend)
+    return YOLO(path, task="detect")
+
+
+def load_sam_model(weights:str, backend:str, imgsz:int=1024, encoder:Optional[str]=None) -> SAM:
+    """Loads SAM, with a non torch backend the image encoder runs the exported (or the given) encoder"""
+    check_backend(backend)
+    sam = SAM(weights)
+    if backend != "torch":
+        path = encoder or sam_encoder_path(weights, backend, imgsz)
+        if not os.path.exists(path):
+            path = export_sam_encoder(weights, backend, imgsz)
+        sam.model.image_encoder = EncoderRuntime(path, backend)
+    return sam
+
+
+def sam_imgsz(config:Config) -> int:
+    return config.detection.sam_roi_size if config.detection.sam_roi else 1024
+
+
+def warmup(box_model:YOLO, sam_model:SAM, config:Config, runs:int=2) -> float:
+    """Runs the first (slow) inferences on a blank frame, returns the seconds it took"""
+    w, h = config.camera.resolution
+    frame = np.zeros((h, w, 3), dtype=np.uint8)
+    bbox = np.array([w // 4, h // 4, 3 * w // 4, 3 * h // 4])
+    started = time.perf_counter()
+    for _ in range(runs):
+        box_model.predict(source=frame, conf=config.detection.confidence, verbose=False)
+        sam_model(frame, bboxes=[bbox], imgsz=sam_imgsz(config), verbose=False)
+    return time.perf_counter() - started
+
+
+def mask_iou(a:np.ndarray, b:np.ndarray) -> float:
+    union = np.count_nonzero(a | b)
+    return float(np.count_nonzero(a & b) / union) if union > 0 else 1.0
+
+
+def check_parity(config:Config, backend:str, images:List[np.ndarray], tolerance:float=0.05) -> dict[str, Any]:
+    """Compares the backend against torch on the given images.
+
+    Boxes are matched by order of confidence and must overlap with IoU >= 1 - tolerance,
+    SAM masks (prompted with the torch boxes) must have IoU >= 1 - tolerance.
+    """
+    from detection.mask_cache import bbox_iou
+
+    imgsz = sam_imgsz(config)
+    reference_box = load_box_model(config.detection.box_model, "torch")
+    candidate_box = load_box_model(config.detection.box_model, backend)
+    reference_sam = load_sam_model(config.detection.sam_model, "torch", imgsz)
+    candidate_sam = load_sam_model(config.detection.sam_model, backend, imgsz, config.detection.sam_encoder)
+
+    box_ious:List[float] = []
+    mask_ious:List[float] = []
+    count_mismatches = 0
+    for image in images:
+        kwargs = dict(source=image, conf=config.detection.confidence, iou=config.detection.iou, verbose=False)
+        reference = reference_box.predict(**kwargs)[0].boxes.xyxy.cpu().numpy()
+        candidate = candidate_box.predict(**kwargs)[0].boxes.xyxy.cpu().numpy()
+        if len(reference) != len(candidate):
+            count_mismatches += 1
+        for a, b in zip(reference, candidate):
+            box_ious.append(bbox_iou(a, b))
+
+        if len(reference) > 0:
+            bboxes = [np.int32(b) for b in reference]
+            reference_masks = reference_sam(image, bboxes=bboxes, imgsz=imgsz, verbose=False)[0].masks.data.cpu().numpy() > 0
+            candidate_masks = candidate_sam(image, bboxes=bboxes, imgsz=imgsz, verbose=False)[0].masks.data.cpu().numpy() > 0
+            for a, b in zip(reference_masks, candidate_masks):
+                mask_ious.append(mask_iou(a, b))
+
+    min_box_iou = min(box_ious) if box_ious else 1.0
+    min_mask_iou = min(mask_ious) if mask_ious else 1.0
+    return {
+        "backend": backend,
+        "images": len(images),
+        "box_count_mismatches": count_mismatches,
+        "min_box_iou": min_box_iou,
+        "min_mask_iou": min_mask_iou,
+        "passed": count_mismatches == 0 and min_box_iou >= 1 - tolerance and min_mask_iou >= 1 - tolerance,
+    }
@@ -7,100 +7,38 @@
 # Copyright (c) Lucía Alejandra Moreno Canuto, Gabriel Ernesto Gutiérrez Añez, Alicia Hernández Gutiérrez, Guillermo Daniel González Lozano
 
 import cv2
+import time
 from uuid import uuid4
-from typing import Optional, List
-from ultralytics import YOLO, SAM
+from typing import Optional, List, NamedTuple
 import numpy as np
-from scipy.spatial import ConvexHull
-from itertools import combinations
 from config import Config
 from detection.volume import DimensionsEstimator, DistanceEstimator
+from detection.propagation import MaskPropagator
+from detection.gate import SceneChangeGate
+from detection.mask_cache import MaskCache
+from detection.corners import CornerDetector
+from detection.mask import CompactMask
+from detection.tracking import MultiObjectTracker
+from detection.pointcloud import PointCloudEstimator
+from detection.alignment import DepthAligner
+from detection.statistics import iqr_bounds
+from detection.registry import models
+from log import logging
 from domain import Prediction, Dimensions, DimSide
 import pyrealsense2 as rs
 import utils
 import plot
 
-OBJECT_LOST_SECONDS = 5*1000 # 5 seconds
+CORNER_STATS_FRAMES = 300
 
-class Tracker:
 
-    def __init__(self):
-        self.tracked_dimensions:List[Dimensions] = []
-        self.maxlen = 100
+class Measurement(NamedTuple):
+    bbox: np.ndarray
+    mask: CompactMask
+    corners: np.ndarray
+    dimensions: Optional[Dimensions]
+    track_id: Optional[int] = None
 
-    def get_stable_value(self, data:List[float], sigma:float=3):
-        data_array = np.array(data)
-
-        # Calculate Q1 and Q3
-        q1 = np.percentile(data_array, 25)
-        q3 = np.percentile(data_array, 75)
-        iqr = q3 - q1
-
-        # Define bounds
-        lower_bound = q1 - sigma * iqr
-        upper_bound = q3 + sigma * iqr
-
-        # Filter out outliers
-        filtered_data = data_array[(data_array >= lower_bound) & (data_array <= upper_bound)]
-        return int(np.median(filtered_data))
-
-
-    def get_sides(self):
-        dimension = self.tracked_dimensions[-1]
-        if len(self.tracked_dimensions) < 10:
-            return dimension.side3, dimension.side4, dimension.side5
-        
-        side3, side4, side5 = [], [], []
-        for pred in self.tracked_dimensions:
-            side3.append(dimension.side3.value)
-            side4.append(dimension.side4.value)
-            side5.append(dimension.side5.value)
-
-        side3 = self.get_stable_value(side3)
-        side4 = self.get_stable_value(side4)
-        side5 = self.get_stable_value(side5)
-
-        side3 = DimSide(
-            value=side3,
-            point1=dimension.side3.point1,
-            point2=dimension.side3.point2
-        )
-        side4 = DimSide(
-            value=side4,
-            point1=dimension.side4.point1,
-            point2=dimension.side4.point2
-        )
-        side5 = DimSide(
-            value=side5,
-            point1=dimension.side5.point1,
-            point2=dimension.side5.point2
-        )
-        return side3, side4, side5
-
-    def update(self, dimension: Optional[Dimensions]):
-        if dimension:
-            if len(self.tracked_dimensions) > 0 and (dimension.detection_time - self.tracked_dimensions[-1].detection_time) > OBJECT_LOST_SECONDS:
-                self.tracked_dimensions = []
-
-            if dimension:
-                self.tracked_dimensions.append(dimension)
-                self.tracked_dimensions = self.tracked_dimensions[-self.maxlen:]
-                if len(self.tracked_dimensions) > 5:
-                    side3, side4, side5 = self.get_sides()
-                    return dimension.model_copy(update={
-                        "sides": [
-                            dimension.side1,
-                            dimension.side2,
-                            side3,
-                            side4,
-                            side5,
-                            dimension.side6
-                        ]
-                    })
-                else:
-                    return dimension
-
-        return dimension
 
 class BoxDetection:
 
@@ -109,28 +47,44 @@ class BoxDetection:
         self.config = config
         self.box_model_file = config.detection.box_model
         self.sam_model_file = config.detection.sam_model
-        self.tracker = Tracker()
+        self.tracker = MultiObjectTracker(config)
+        self.propagator = MaskPropagator(config)
+        self.gate = SceneChangeGate(config)
+        self.mask_cache = MaskCache(config)
+        self.corner_detector = CornerDetector()
+        self.box_model = None
+        self.sam_model = None
+        self.pointcloud_estimator:Optional[PointCloudEstimator] = None
+        self.last_measurements:List[Measurement] = []
+        self.full_frames = 0
+        self.propagated_frames = 0
         
 
     
     def init(self, depth_intrinsics:rs.intrinsics):
-        self.box_model = YOLO(self.box_model_file)
-        self.sam_model = SAM(self.sam_model_file)
-        self.estimator = DimensionsEstimator(DistanceEstimator(depth_intrinsics, self.config))
+        # The models are loaded and warmed up once per process in the background, only the estimator
+        # depends on the camera, so opening it never waits for them
+        models.preload(self.config)
+        distance_estimator = DistanceEstimator(depth_intrinsics, self.config)
+        self.estimator = DimensionsEstimator(distance_estimator)
+        self.pointcloud_estimator = PointCloudEstimator(distance_estimator, self.config)
+        self.propagator.clear()
+        self.gate.clear()
+        self.mask_cache.clear()
 
     
-    def __get_bbox_from_mask__(self, mask: np.ndarray, default_bbox:np.ndarray) -> np.ndarray:
-        try:
-            y_indices, x_indices = np.where(mask)
+    def load_models(self, timeout:Optional[float]=None) -> bool:
+        """Takes the shared models, False while they are still loading after timeout seconds"""
+        if self.box_model is None:
+            try:
+                self.box_model, self.sam_model = models.get(self.config, timeout)
+            except TimeoutError:
+                return False
+        return True
 
-            x_min = int(np.min(x_indices))
-            x_max = int(np.max(x_indices))
-            y_min = int(np.min(y_indices))
-            y_max = int(np.max(y_indices))
 
-            return np.array([x_min, y_min, x_max, y_max])
-        except:
-            return default_bbox
+    def __get_bbox_from_mask__(self, mask: CompactMask, default_bbox:np.ndarray) -> np.ndarray:
+        return mask.bbox.copy() if mask.any() else default_bbox
 
 
     def __select_best_points__(self, corners: Optional[np.ndarray]) -> Optional[np.ndarray]:
@@ -141,74 +95,26 @@ class BoxDetection:
         if len(corners) == 6:
             return corners
 
-        def are_points_collinear(points):
-            for i in range(2, len(points)):
-                area = np.linalg.det(np.array([
-                    [points[0][0], points[0][1], 1],
-                    [points[1][0], points[1][1], 1],
-                    [points[i][0], points[i][1], 1]
-                ]))
-                if abs(area) > 1e-10:
-                    return False
-            return True
-
-        def convex_hull_area(points_subset) -> float:
-            if len(points_subset) < 3 or points_subset.shape[1] != 2 or are_points_collinear(points_subset):
-                return 0
-            return ConvexHull(points_subset).volume
-
-        max_area = 0
-        best_points = None
-
-        for subset in combinations(corners, 6):
-            subset = np.array(subset)
-            area = convex_hull_area(subset)
-            if area > max_area:
-                max_area = area
-                best_points = subset
-
-        return best_points if best_points is not None and len(best_points) == 6 else None
+        return utils.max_area_polygon(corners, 6)
     
 
-    def __detect_corners__(self, mask: np.ndarray) -> Optional[np.ndarray]:
-        binary_image = (mask.astype(np.uint8)) * 255
-        contours, _ = cv2.findContours(binary_image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
-
-        if not contours:
-            return None
-
-        contour = max(contours, key=cv2.contourArea)
-        best_result = None
-        factor = 0.001
-
-        for _ in range(100):
-            factor += 0.001
-            epsilon = cv2.arcLength(contour, True) * factor
-            corners = cv2.approxPolyDP(contour, epsilon, True)
-
-            corners = corners.reshape(-1, 2)
-            if best_result is None:
-                best_result = corners
-            elif len(corners) < len(best_result) and len(corners) >= 6:
-                best_result = corners
-
-            if len(best_result) == 6:
-                break
-
-        return self.__select_best_points__(best_result)
+    def __detect_corners__(self, mask: CompactMask) -> Optional[np.ndarray]:
+        return self.__select_best_points__(self.corner_detector.detect(mask))
     
-    def optimize_mask(self, mask: np.ndarray, depth_frame:np.ndarray) -> np.ndarray:
-        object_depth_values = depth_frame[mask]
+    def optimize_mask(self, mask: CompactMask, depth_frame:np.ndarray) -> CompactMask:
+        if not mask.any():
+            return mask
+        rows, cols = mask.roi
+        crop = mask.crop()
+        depth = depth_frame[rows, cols]
+        object_depth_values = depth[crop]
 
-        q1, q3 = np.percentile(object_depth_values, [25, 75])
-        iqr = q3 - q1
-        lower_bound = q1 - self.config.detection.mask_optimization_sigma * iqr
-        upper_bound = q3 + self.config.detection.mask_optimization_sigma * iqr
+        lower_bound, upper_bound = iqr_bounds(object_depth_values, self.config.detection.mask_optimization_sigma)
 
-        return (mask & (depth_frame >= lower_bound) & (depth_frame <= upper_bound))
+        return CompactMask.from_crop(crop & (depth >= lower_bound) & (depth <= upper_bound), cols.start, rows.start, mask.shape)
 
 
-    def predict(self, frame: np.ndarray, enhanced: np.ndarray, depth_frame:np.ndarray) -> Prediction:
+    def __detect_boxes__(self, enhanced:np.ndarray) -> List[np.ndarray]:
         box_results = self.box_model.predict(
             source=enhanced,
             conf=self.config.detection.confidence,
@@ -216,49 +122,290 @@ class BoxDetection:
             max_det=100,
             verbose=False,
         )
-        
+
+        frame_area = enhanced.shape[0]*enhanced.shape[1]
+        bboxes:List[np.ndarray] = []
         for box_result in box_results:
-        
             if box_result and box_result.boxes and len(box_result.boxes) > 0:
                 for box in box_result.boxes:
                     bbox = np.int32(box.xyxy[0].tolist())
                     bbox_area = (bbox[2]-bbox[0])*(bbox[3]-bbox[1])
-                    frame_area = enhanced.shape[0]*enhanced.shape[1]
                     bbox_pct = bbox_area/ frame_area
-                    
+
                     # Ensure we are not getting a weird detection taking almos the whole screen
                     if bbox_pct > 0.05 and bbox_pct < 0.6:
-                        sam_result = self.sam_model(
-                            enhanced, bboxes=[bbox], verbose=False
-                        )
-                        
-                        if sam_result is not None and len(sam_result) > 0:
-                            mask:np.ndarray = sam_result[0].masks.data.cpu().numpy()[0]
-                            bbox:np.ndarray = self.__get_bbox_from_mask__(mask, bbox)
-                            corners:Optional[np.ndarray] = self.__detect_corners__(mask)
-                            if corners is not None:
-                                dimensions:Optional[Dimensions] = self.estimator.calculate_object_dimensions(depth_frame, corners)
-                                dimensions:Optional[Dimensions] = self.tracker.update(dimensions)
-                                return Prediction(
-                                    id=uuid4(),
-                                    frame=frame,
-                                    painted_frame=plot.plot_prediction(frame.copy(), bbox, mask, dimensions),
-                                    bbox=bbox,
-                                    mask=mask,
-                                    corners=corners,
-                                    dimensions=dimensions
-                                )
-                            else:
-                                continue
-                        else:
-                            continue
-                    else:
-                        continue
-        self.tracker.update(None)
-        return Prediction(
-            id=uuid4(),
-            frame=frame,
-            painted_frame=plot.plot_prediction(frame.copy())
+                        bboxes.append(bbox)
+        return bboxes
+
+
+    def __segment__(self, enhanced:np.ndarray, bboxes:List[np.ndarray]) -> List[Optional[CompactMask]]:
+        """Segments the bboxes, masks come back in the same order"""
+        if self.config.detection.sam_roi:
+            return self.__segment_roi__(enhanced, bboxes)
+
+        sam_result = self.sam_model(
+            enhanced, bboxes=bboxes, verbose=False
         )
-            
-            
\ No newline at end of file
+        if sam_result is None or len(sam_result) == 0 or sam_result[0].masks is None:
+            return []
+        return [CompactMask.from_dense(mask) for mask in sam_result[0].masks.data.cpu().numpy()]
+
+
+    def __roi_crop__(self, boxes:np.ndarray, w:int, h:int) -> tuple[int, int, int, int]:
+        """Padded crop around the boxes, clipped to the frame"""
+        x1, y1 = boxes[:, 0].min(), boxes[:, 1].min()
+        x2, y2 = boxes[:, 2].max(), boxes[:, 3].max()
+        pad_x = int((x2 - x1) * self.config.detection.sam_roi_padding)
+        pad_y = int((y2 - y1) * self.config.detection.sam_roi_padding)
+        return max(0, x1 - pad_x), max(0, y1 - pad_y), min(w, x2 + pad_x), min(h, y2 + pad_y)
+
+
+    def __roi_groups__(self, bboxes:List[np.ndarray], w:int, h:int, limit:float) -> List[List[int]]:
+        """Groups the bboxes whose shared crop stays within limit pixels per side"""
+        groups:List[List[int]] = []
+        for i, bbox in enumerate(bboxes):
+            for group in groups:
+                x1, y1, x2, y2 = self.__roi_crop__(np.array([bboxes[j] for j in group] + [bbox]), w, h)
+                if max(x2 - x1, y2 - y1) <= limit:
+                    group.append(i)
+                    break
+            else:
+                groups.append([i])
+        return groups
+
+
+    def __segment_roi__(self, enhanced:np.ndarray, bboxes:List[np.ndarray]) -> List[Optional[CompactMask]]:
+        """Runs SAM over padded crops around the bboxes at the ROI inference size and places the
+        masks in frame coordinates.
+
+        Nearby bboxes share a crop as long as its longest side fits in the ROI size scaled like
+        the full frame at 1024, so SAM never sees the boxes with fewer pixels than the full frame
+        path, bboxes far apart get crops of their own. With torch, a single bbox too large for
+        that runs over the full frame at 1024, exported encoders only take the ROI size."""
+        h, w = enhanced.shape[:2]
+        roi_size = self.config.detection.sam_roi_size
+        limit = max(h, w) * roi_size / 1024
+        masks:List[Optional[CompactMask]] = [None] * len(bboxes)
+        full:List[int] = []
+        for group in self.__roi_groups__(bboxes, w, h, limit):
+            x1, y1, x2, y2 = self.__roi_crop__(np.array([bboxes[i] for i in group]), w, h)
+            if max(x2 - x1, y2 - y1) > limit and self.config.detection.sam_backend == "torch":
+                full.extend(group)
+                continue
+
+            offset = np.array([x1, y1, x1, y1])
+            sam_result = self.sam_model(
+                np.ascontiguousarray(enhanced[y1:y2, x1:x2]),
+                bboxes=[bboxes[i] - offset for i in group],
+                imgsz=roi_size,
+                verbose=False
+            )
+            if sam_result is None or len(sam_result) == 0 or sam_result[0].masks is None:
+                continue
+            for i, crop_mask in zip(group, sam_result[0].masks.data.cpu().numpy()):
+                masks[i] = CompactMask.from_crop(crop_mask, x1, y1, (h, w))
+
+        if full:
+            sam_result = self.sam_model(enhanced, bboxes=[bboxes[i] for i in full], imgsz=1024, verbose=False)
+            if sam_result is not None and len(sam_result) > 0 and sam_result[0].masks is not None:
+                for i, mask in zip(full, sam_result[0].masks.data.cpu().numpy()):
+                    masks[i] = CompactMask.from_dense(mask)
+        return masks
+
+
+    def __segment_boxes__(self, enhanced:np.ndarray, depth_frame:np.ndarray, bboxes:List[np.ndarray]) -> List[Optional[CompactMask]]:
+        """Masks for every bbox, reusing the previous SAM masks for bboxes that barely moved"""
+        use_cache = self.config.detection.mask_cache
+        masks:List[Optional[CompactMask]] = [None] * len(bboxes)
+        pending:List[int] = []
+        for i, bbox in enumerate(bboxes):
+            cached = self.mask_cache.lookup(bbox, depth_frame.shape) if use_cache else None
+            if cached is not None and cached.any():
+                masks[i] = cached
+            else:
+                pending.append(i)
+
+        if pending:
+            started = time.perf_counter()
+            segmented = self.__segment__(enhanced, [bboxes[i] for i in pending])
+            self.mask_cache.record_sam(time.perf_counter() - started, len(pending))
+            for i, mask in zip(pending, segmented):
+                masks[i] = mask
+                if use_cache and mask is not None:
+                    self.mask_cache.store(bboxes[i], mask)
+        return masks
+
+
+    def __measure__(self, mask:CompactMask, bbox:np.ndarray, depth_frame:np.ndarray) -> Optional[Measurement]:
+        if self.config.detection.mask_optimization:
+            # Drops the background pixels SAM leaks around the box, far from the box depth
+            mask = self.optimize_mask(mask, depth_frame)
+        bbox:np.ndarray = self.__get_bbox_from_mask__(mask, bbox)
+        if self.config.detection.dimensions_method == "pointcloud":
+            return self.__measure_pointcloud__(mask, bbox, depth_frame)
+        corners:Optional[np.ndarray] = self.__detect_corners__(mask)
+        if corners is None:
+            return None
+        dimensions:Optional[Dimensions] = self.estimator.calculate_object_dimensions(depth_frame, corners)
+        return Measurement(bbox=bbox, mask=mask, corners=corners, dimensions=dimensions)
+
+
+    def __measure_pointcloud__(self, mask:CompactMask, bbox:np.ndarray, depth_frame:np.ndarray) -> Optional[Measurement]:
+        """Measures the whole mask point cloud, the corners are the outline of the fitted box"""
+        dimensions:Optional[Dimensions] = self.pointcloud_estimator.calculate_object_dimensions(depth_frame, mask)
+        if dimensions is None:
+            return None
+        corners = np.array([side.point1 for side in dimensions.sides])
+        return Measurement(bbox=bbox, mask=mask, corners=corners, dimensions=dimensions)
+
+
+    def __measure_first__(self, enhanced:np.ndarray, depth_frame:np.ndarray, bboxes:List[np.ndarray]) -> List[Measurement]:
+        for bbox in bboxes:
+            mask = self.__segment_boxes__(enhanced, depth_frame, [bbox])[0]
+            if mask is not None:
+                measurement = self.__measure__(mask, bbox, depth_frame)
+                if measurement is not None:
+                    return [measurement]
+        return []
+
+
+    def __measure_all__(self, enhanced:np.ndarray, depth_frame:np.ndarray, bboxes:List[np.ndarray]) -> List[Measurement]:
+        if not bboxes:
+            return []
+        measurements:List[Measurement] = []
+        for mask, bbox in zip(self.__segment_boxes__(enhanced, depth_frame, bboxes), bboxes):
+            if mask is None:
+                continue
+            measurement = self.__measure__(mask, bbox, depth_frame)
+            if measurement is not None:
+                measurements.append(measurement)
+        return measurements
+
+
+    def __measure_propagated__(self, frame:np.ndarray, depth_frame:np.ndarray, aligner:Optional[DepthAligner]) -> Optional[List[Measurement]]:
+        masks = self.propagator.propagate(frame)
+        if masks is None:
+            return None
+        if aligner is not None:
+            depth_frame = aligner.align(depth_frame, [mask.bbox for mask in masks if mask.any()])
+
+        measurements:List[Measurement] = []
+        for mask in masks:
+            measurement = self.__measure__(mask, None, depth_frame)
+            if measurement is not None:
+                measurements.append(measurement)
+
+        if not self.config.detection.multi_object:
+            measurements = measurements[:1]
+        return measurements
+
+
+    def __track__(self, measurements:List[Measurement]) -> List[Measurement]:
+        """Assigns every measurement to its track and stabilizes its dimensions with the track history"""
+        now = int(time.time() * 1000)
+        tracked = self.tracker.update([m.bbox for m in measurements], [m.dimensions for m in measurements], now)
+        return [m._replace(track_id=track_id, dimensions=dimensions) for m, (track_id, dimensions) in zip(measurements, tracked)]
+
+
+    def __corner_calls_per_frame__(self) -> float:
+        frames = self.full_frames + self.propagated_frames
+        return self.corner_detector.approx_calls / frames if frames > 0 else 0.0
+
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "full_frames": self.full_frames,
+            "propagated_frames": self.propagated_frames,
+            **self.gate.stats(),
+            **self.mask_cache.stats(),
+            **self.corner_detector.stats(),
+            **self.tracker.stats(),
+            "corner_approx_calls_per_frame": self.__corner_calls_per_frame__(),
+            **(self.pointcloud_estimator.stats() if self.pointcloud_estimator else {}),
+            **models.stats(),
+        }
+
+
+    def __paint__(self, frame:np.ndarray, overlay:Optional[np.ndarray], measurements:List[Measurement]) -> np.ndarray:
+        if overlay is None:
+            overlay = frame.copy()
+        else:
+            np.copyto(overlay, frame)
+        for m in measurements:
+            plot.plot_prediction(overlay, m.bbox, m.mask, m.dimensions)
+        return overlay
+
+
+    def predict_all(self, frame: np.ndarray, enhanced: np.ndarray, depth_frame:np.ndarray, overlay:Optional[np.ndarray]=None, aligner:Optional[DepthAligner]=None) -> List[Prediction]:
+        """Predicts the boxes in the frame, all the predictions share the frame and the painted frame.
+
+        In multi object mode every box is segmented in one SAM call and measured, otherwise only
+        the first box that can be measured is returned. With a detection interval above one, the
+        full YOLO+SAM pass only runs every N frames (or when the propagation confidence drops) and
+        the masks are propagated with optical flow in between. With the scene gate enabled, a frame
+        that barely differs from the last processed one reuses its measurements. With the mask
+        cache enabled, SAM is skipped for bboxes that overlap last frame ones. Every measured box
+        is assigned to a track, its dimensions are stabilized with that track history only. With
+        an aligner the depth is raw and only aligned around the boxes once they are found. When
+        nothing is measured the list holds a single prediction with just the frames. The first
+        call waits for the models when they are still loading.
+        """
+        self.load_models()
+        scene_gate = self.config.detection.scene_gate
+        if scene_gate and self.gate.is_unchanged(frame, depth_frame):
+            return self.__to_predictions__(frame, overlay, self.last_measurements)
+
+        measurements:Optional[List[Measurement]] = None
+        if not self.propagator.is_due():
+            measurements = self.__measure_propagated__(frame, depth_frame, aligner)
+            if measurements is not None:
+                self.propagated_frames += 1
+
+        if measurements is None:
+            self.mask_cache.next_frame()
+            bboxes = self.__detect_boxes__(enhanced)
+            if aligner is not None and bboxes:
+                depth_frame = aligner.align(depth_frame, bboxes)
+            if self.config.detection.multi_object:
+                measurements = self.__measure_all__(enhanced, depth_frame, bboxes)
+            else:
+                measurements = self.__measure_first__(enhanced, depth_frame, bboxes)
+            self.full_frames += 1
+            if self.config.detection.detection_interval > 1:
+                self.propagator.reset(frame, [m.mask for m in measurements])
+        measurements = self.__track__(measurements)
+
+        if scene_gate:
+            self.gate.update()
+            self.last_measurements = measurements
+        if (self.full_frames + self.propagated_frames) % CORNER_STATS_FRAMES == 0:
+            logging.info(f"approxPolyDP calls per frame: {self.__corner_calls_per_frame__():.2f}")
+        return self.__to_predictions__(frame, overlay, measurements)
+
+
+    def __to_predictions__(self, frame:np.ndarray, overlay:Optional[np.ndarray], measurements:List[Measurement]) -> List[Prediction]:
+        painted_frame = self.__paint__(frame, overlay, measurements)
+        if not measurements:
+            return [Prediction(
+                id=uuid4(),
+                frame=frame,
+                painted_frame=painted_frame
+            )]
+
+        return [
+            Prediction(
+                id=uuid4(),
+                frame=frame,
+                painted_frame=painted_frame,
+                bbox=m.bbox,
+                mask=m.mask,
+                corners=m.corners,
+                dimensions=m.dimensions,
+                track_id=m.track_id
+            )
+            for m in measurements
+        ]
+
+
+    def predict(self, frame: np.ndarray, enhanced: np.ndarray, depth_frame:np.ndarray, overlay:Optional[np.ndarray]=None) -> Prediction:
+        return self.predict_all(frame, enhanced, depth_frame, overlay)[0]
\ No newline at end of file
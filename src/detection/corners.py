@@ -0,0 +1,82 @@
+# All rights reserved. No part of this code may be reproduced, distributed, or transmitted
+# in any form or by any means, including photocopying, recording, or other electronic or
+# mechanical methods, without the prior written permission of the author, except in the
+# case of brief quotations embodied in critical reviews and certain other noncommercial
+# uses permitted by copyright law. For permission requests, please contact the author.
+#
+# Copyright (c) Lucía Alejandra Moreno Canuto, Gabriel Ernesto Gutiérrez Añez, Alicia Hernández Gutiérrez, Guillermo Daniel González Lozano
+
+import cv2
+import numpy as np
+from typing import Optional, Union
+from detection.mask import CompactMask
+
+
+def epsilon_factors(steps:int=100, step:float=0.001) -> list[float]:
+    """The factors of the original sweep, accumulated the same way so the floats match"""
+    factors, factor = [], step
+    for _ in range(steps):
+        factor += step
+        factors.append(factor)
+    return factors
+
+
+EPSILON_FACTORS = epsilon_factors()
+
+
+class CornerDetector:
+    """Approximates the mask contour with the polygon of the smallest epsilon giving 6 vertices.
+
+    The factors are scanned in order like the original sweep, the vertex count of approxPolyDP
+    can go up and down as epsilon grows so none is skipped. When no factor gives exactly 6
+    vertices the result is the first polygon with the fewest vertices above 6, or the first
+    polygon when it already has fewer. The arc length is computed once per contour.
+    """
+
+    def __init__(self, vertices:int=6):
+        self.vertices = vertices
+        self.approx_calls = 0
+        self.detections = 0
+
+
+    def detect(self, mask:Union[CompactMask, np.ndarray]) -> Optional[np.ndarray]:
+        contour = self.__contour__(mask)
+        if contour is None:
+            return None
+        return self.__approximate__(contour)
+
+
+    def __contour__(self, mask:Union[CompactMask, np.ndarray]) -> Optional[np.ndarray]:
+        if isinstance(mask, CompactMask):
+            return mask.contour()
+
+        # findContours only needs non zero pixels, a bool mask is read as uint8 without a copy
+        if mask.dtype == bool and mask.flags.c_contiguous:
+            binary_image = mask.view(np.uint8)
+        else:
+            binary_image = np.ascontiguousarray(mask, dtype=np.uint8)
+        contours, _ = cv2.findContours(binary_image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+        if not contours:
+            return None
+        return max(contours, key=cv2.contourArea)
+
+
+    def __approximate__(self, contour:np.ndarray) -> np.ndarray:
+        self.detections += 1
+        length = cv2.arcLength(contour, True)
+        best = None
+        for factor in EPSILON_FACTORS:
+            self.approx_calls += 1
+            polygon = cv2.approxPolyDP(contour, length * factor, True).reshape(-1, 2)
+            if best is None or self.vertices <= len(polygon) < len(best):
+                best = polygon
+            if len(best) == self.vertices:
+                break
+        return best
+
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "corner_detections": self.detections,
+            "corner_approx_calls": self.approx_calls,
+        }
\ No newline at end of file
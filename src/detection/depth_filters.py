@@ -0,0 +1,314 @@
+# All rights reserved. No part of this code may be reproduced, distributed, or transmitted
+# in any form or by any means, including photocopying, recording, or other electronic or
+# mechanical methods, without the prior written permission of the author, except in the
+# case of brief quotations embodied in critical reviews and certain other noncommercial
+# uses permitted by copyright law. For permission requests, please contact the author.
+#
+# Copyright (c) Lucía Alejandra Moreno Canuto, Gabriel Ernesto Gutiérrez Añez, Alicia Hernández Gutiérrez, Guillermo Daniel González Lozano
+
+import math
+import time
+import cv2
+import numpy as np
+from typing import Optional, List
+from config import Config
+
+
+class TemporalDepthFilter:
+    """Fuses the depth of the last N frames, pixel by pixel, ignoring the invalid (zero) samples.
+
+    The frames live in a preallocated uint16 ring buffer next to a running sum and a count of
+    valid samples per pixel, so the mean is updated in O(pixels) by adding the new frame and
+    removing the oldest one. The median keeps the window sorted per pixel across frames, every
+    update takes the oldest sample out and puts the new one in with a single pass over the N
+    planes, O(N * pixels), around twice the cost of the mean. A pixel is valid when it has depth
+    in a fraction of the buffered frames, otherwise it is zero. When enough pixels differ from
+    the fused depth the scene moved and the buffer starts over. Every buffer is allocated once,
+    the returned depth is overwritten by the next update.
+    """
+
+    def __init__(self, config:Config):
+        self.config = config
+        w, h = config.camera.resolution
+        n = config.depth.temporal_frames
+        self.frames = np.zeros((n, h, w), dtype=np.uint16)
+        self.sum = np.zeros((h, w), dtype=np.uint32)
+        self.count = np.zeros((h, w), dtype=np.int32)
+        self.output = np.zeros((h, w), dtype=np.uint16)
+        self.valid = np.zeros((h, w), dtype=bool)
+        self.scratch = np.empty((h, w), dtype=np.uint32)
+        self.counts = np.empty((h, w), dtype=np.int32)
+        self.difference = np.empty((h, w), dtype=np.float32)
+        self.threshold = np.empty((h, w), dtype=np.float32)
+        self.mask = np.empty((h, w), dtype=bool)
+        self.other = np.empty((h, w), dtype=bool)
+        if config.depth.temporal_mode == "median":
+            self.sorted = np.zeros((n, h, w), dtype=np.uint16)
+            self.lower = np.empty((h, w), dtype=np.uint16)
+            self.upper = np.empty((h, w), dtype=np.uint16)
+            self.previous = np.empty((h, w), dtype=np.uint16)
+            self.current = np.empty((h, w), dtype=np.uint16)
+            # The lower and upper middle values sit on plane n - 1 - count // 2 and n - (count + 1) // 2,
+            # their flat index is that plane times the pixels from these bases
+            index_type = np.int32 if (n + 1) * h * w < 2**31 else np.int64
+            pixels = np.arange(h * w, dtype=index_type).reshape(h, w)
+            self.lower_base = pixels + (n - 1) * h * w
+            self.upper_base = pixels + n * h * w
+            self.index = np.empty((h, w), dtype=index_type)
+            self.half = np.empty((h, w), dtype=index_type)
+        self.head = 0
+        self.size = 0
+        self.updates = 0
+        self.resets = 0
+        self.elapsed = 0.0
+
+
+    def clear(self):
+        self.frames.fill(0)
+        if self.config.depth.temporal_mode == "median":
+            self.sorted.fill(0)
+        self.sum.fill(0)
+        self.count.fill(0)
+        self.output.fill(0)
+        self.valid.fill(False)
+        self.head = 0
+        self.size = 0
+
+
+    def __moved__(self, depth:np.ndarray) -> bool:
+        """Whether too many pixels valid in both differ by more than the threshold, relative to the
+        distance like the sensor noise"""
+        if self.size == 0:
+            return False
+        np.greater(depth, 0, out=self.mask)
+        np.logical_and(self.mask, self.valid, out=self.mask)
+        compared = np.count_nonzero(self.mask)
+        if compared == 0:
+            return False
+        np.subtract(depth, self.output, out=self.difference, dtype=np.float32)
+        np.abs(self.difference, out=self.difference)
+        np.multiply(self.output, self.config.depth.temporal_motion_threshold, out=self.threshold, dtype=np.float32)
+        np.greater(self.difference, self.threshold, out=self.other)
+        np.logical_and(self.other, self.mask, out=self.other)
+        return np.count_nonzero(self.other) > self.config.depth.temporal_motion_fraction * compared
+
+
+    def __replace_sorted__(self, oldest:np.ndarray, depth:np.ndarray):
+        """Takes the oldest sample out of the sorted planes and inserts the new one. Unfilled slots
+        are zero in both, so the oldest sample is always among the sorted ones"""
+        planes = self.sorted
+        n = len(planes)
+        previous, current = self.previous, self.current
+        for i in range(n):
+            # current is plane i without the oldest sample, the planes from it up move down one,
+            # planes[i] + (planes[i] >= oldest) * (planes[i + 1] - planes[i]) as the planes are sorted
+            if i < n - 1:
+                np.greater_equal(planes[i], oldest, out=self.mask)
+                np.subtract(planes[i + 1], planes[i], out=current)
+                np.multiply(current, self.mask, out=current)
+                np.add(current, planes[i], out=current)
+                np.minimum(current, depth, out=planes[i])
+            else:
+                np.copyto(planes[i], depth)
+            if i > 0:
+                np.maximum(planes[i], previous, out=planes[i])
+            previous, current = current, previous
+
+
+    def __push__(self, depth:np.ndarray):
+        n = len(self.frames)
+        oldest = self.frames[self.head]
+        if self.config.depth.temporal_mode == "median":
+            self.__replace_sorted__(oldest, depth)
+        if self.size == n:
+            np.subtract(self.sum, oldest, out=self.sum)
+            np.greater(oldest, 0, out=self.mask)
+            np.subtract(self.count, self.mask, out=self.count)
+        else:
+            self.size += 1
+        np.copyto(oldest, depth)
+        np.add(self.sum, depth, out=self.sum)
+        np.greater(depth, 0, out=self.mask)
+        np.add(self.count, self.mask, out=self.count)
+        self.head = (self.head + 1) % n
+
+
+    def __mean__(self):
+        # Rounded (sum + count / 2) // count, the count is at least 1 wherever the result is kept
+        np.maximum(self.count, 1, out=self.counts)
+        denominator = self.counts.view(np.uint32)
+        np.right_shift(denominator, 1, out=self.scratch)
+        np.add(self.scratch, self.sum, out=self.scratch)
+        np.floor_divide(self.scratch, denominator, out=self.scratch)
+        np.copyto(self.output, self.scratch, casting="unsafe")
+
+
+    def __median__(self):
+        # Invalid samples and unfilled slots are zero and sort first, the valid ones sit at the end
+        flat = self.sorted.reshape(-1)
+        plane = flat.size // len(self.sorted)
+        for rounding, base, result in ((0, self.lower_base, self.lower), (1, self.upper_base, self.upper)):
+            np.add(self.count, rounding, out=self.half)
+            np.right_shift(self.half, 1, out=self.half)
+            np.multiply(self.half, plane, out=self.half)
+            np.subtract(base, self.half, out=self.index)
+            # Without valid samples the upper index is past the end, those pixels are zeroed anyway
+            np.take(flat, self.index, out=result, mode="clip")
+        np.add(self.lower, self.upper, out=self.scratch, dtype=np.uint32)
+        np.add(self.scratch, 1, out=self.scratch)
+        np.right_shift(self.scratch, 1, out=self.scratch)
+        np.copyto(self.output, self.scratch, casting="unsafe")
+
+
+    def update(self, depth:np.ndarray) -> np.ndarray:
+        """Adds the frame and returns the fused depth"""
+        started = time.perf_counter()
+        if self.__moved__(depth):
+            self.clear()
+            self.resets += 1
+        self.__push__(depth)
+
+        if self.config.depth.temporal_mode == "median":
+            self.__median__()
+        else:
+            self.__mean__()
+        minimum = max(1, math.ceil(self.config.depth.temporal_min_valid * self.size))
+        np.greater_equal(self.count, minimum, out=self.valid)
+        np.logical_not(self.valid, out=self.mask)
+        np.copyto(self.output, 0, where=self.mask)
+
+        self.updates += 1
+        self.elapsed += time.perf_counter() - started
+        return self.output
+
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "temporal_updates": self.updates,
+            "temporal_resets": self.resets,
+            "temporal_frames": self.size,
+            "temporal_mean_ms": 1000 * self.elapsed / self.updates if self.updates else 0.0,
+        }
+
+class SpatialDepthFilter:
+    """Post-processes the depth once per frame: decimation, edge preserving smoothing and hole filling.
+
+    The frame is decimated by averaging the valid pixels of every block, smoothed with a
+    bilateral filter, whose depth sigma keeps the box edges and the holes apart, and every hole
+    is filled with the mean of the valid pixels around it, taken from integral images. The
+    result is scaled back to the frame resolution. In ROI mode only the padded union of the
+    given bboxes is processed, the rest of the frame keeps the raw depth.
+    """
+
+    STAGES = ("decimation", "smoothing", "hole_filling", "upsampling")
+
+    def __init__(self, config:Config):
+        self.config = config
+        w, h = config.camera.resolution
+        self.output = np.zeros((h, w), dtype=np.uint16)
+        self.elapsed = {stage: 0.0 for stage in self.STAGES}
+        self.frames = 0
+        self.skipped = 0
+
+
+    def __roi__(self, shape:tuple[int, int], bboxes:Optional[List[np.ndarray]]) -> Optional[tuple[slice, slice]]:
+        h, w = shape
+        if not self.config.depth.spatial_roi:
+            return slice(0, h), slice(0, w)
+        if not bboxes:
+            return None
+        boxes = np.array(bboxes)
+        x1, y1 = boxes[:, 0].min(), boxes[:, 1].min()
+        x2, y2 = boxes[:, 2].max(), boxes[:, 3].max()
+        pad_x = int((x2 - x1) * self.config.depth.spatial_roi_padding)
+        pad_y = int((y2 - y1) * self.config.depth.spatial_roi_padding)
+        # Aligned to the decimation blocks, so the same pixels average together in and out of ROI mode
+        f = self.config.depth.spatial_decimation
+        x1, y1 = max(0, x1 - pad_x) // f * f, max(0, y1 - pad_y) // f * f
+        x2, y2 = min(w, x2 + pad_x), min(h, y2 + pad_y)
+        if x2 - x1 < f or y2 - y1 < f:
+            return None
+        return slice(int(y1), int(y2)), slice(int(x1), int(x2))
+
+
+    def __decimate__(self, depth:np.ndarray) -> np.ndarray:
+        """Mean of the valid pixels of every block, zero when none is valid"""
+        f = self.config.depth.spatial_decimation
+        if f == 1:
+            return depth.astype(np.float32)
+        h, w = depth.shape[0] // f, depth.shape[1] // f
+        depth = depth[:h * f, :w * f]
+        # Area resizing averages whole blocks, the block mean over the valid fraction is the valid mean
+        total = cv2.resize(depth.astype(np.float32), (w, h), interpolation=cv2.INTER_AREA)
+        valid = cv2.resize((depth > 0).astype(np.float32), (w, h), interpolation=cv2.INTER_AREA)
+        return np.divide(total, valid, out=np.zeros((h, w), dtype=np.float32), where=valid > 0)
+
+
+    def __smooth__(self, depth:np.ndarray) -> np.ndarray:
+        config = self.config.depth
+        if config.spatial_sigma_space <= 0:
+            return depth
+        # Holes are far from any depth in the range kernel, they neither spread nor get averaged in
+        smoothed = cv2.bilateralFilter(depth, config.spatial_diameter, config.spatial_sigma_depth, config.spatial_sigma_space)
+        smoothed[depth == 0] = 0
+        return smoothed
+
+
+    def __fill_holes__(self, depth:np.ndarray) -> np.ndarray:
+        r = self.config.depth.hole_filling_radius
+        holes = depth == 0
+        if r <= 0 or not holes.any():
+            return depth
+        h, w = depth.shape
+        sums = cv2.integral(depth, sdepth=cv2.CV_64F)
+        counts = cv2.integral((~holes).view(np.uint8))
+        ys, xs = np.nonzero(holes)
+        y0, y1 = np.maximum(ys - r, 0), np.minimum(ys + r + 1, h)
+        x0, x1 = np.maximum(xs - r, 0), np.minimum(xs + r + 1, w)
+        box = lambda table: table[y1, x1] - table[y0, x1] - table[y1, x0] + table[y0, x0]
+        total, count = box(sums), box(counts)
+        filled = count > 0
+        depth[ys[filled], xs[filled]] = total[filled] / count[filled]
+        return depth
+
+
+    def process(self, depth:np.ndarray, bboxes:Optional[List[np.ndarray]]=None) -> np.ndarray:
+        """The post-processed depth, overwritten by the next call. In ROI mode the bboxes are the
+        ones of the previous frame, without them the raw depth is returned"""
+        roi = self.__roi__(depth.shape, bboxes)
+        if roi is None:
+            self.skipped += 1
+            return depth
+
+        np.copyto(self.output, depth)
+        source = depth[roi]
+        timings = [time.perf_counter()]
+        small = self.__decimate__(source)
+        timings.append(time.perf_counter())
+        small = self.__smooth__(small)
+        timings.append(time.perf_counter())
+        small = self.__fill_holes__(small)
+        timings.append(time.perf_counter())
+
+        f = self.config.depth.spatial_decimation
+        h, w = small.shape[0] * f, small.shape[1] * f
+        rows, cols = roi
+        target = self.output[rows.start:rows.start + h, cols.start:cols.start + w]
+        if f > 1:
+            small = cv2.resize(small, (w, h), interpolation=cv2.INTER_NEAREST)
+        np.rint(small, out=small)
+        np.copyto(target, small, casting="unsafe")
+        timings.append(time.perf_counter())
+
+        for stage, started, finished in zip(self.STAGES, timings, timings[1:]):
+            self.elapsed[stage] += finished - started
+        self.frames += 1
+        return self.output
+
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "spatial_frames": self.frames,
+            "spatial_skipped": self.skipped,
+            **{f"spatial_{stage}_ms": 1000 * elapsed / self.frames if self.frames else 0.0 for stage, elapsed in self.elapsed.items()},
+        }
\ No newline at end of file
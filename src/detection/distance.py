@@ -7,7 +7,11 @@
 # Copyright (c) Lucía Alejandra Moreno Canuto, Gabriel Ernesto Gutiérrez Añez, Alicia Hernández Gutiérrez, Guillermo Daniel González Lozano
 
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 from config import Config
+from detection.projection import deproject, RayTable
+from detection.mask import CompactMask
+from typing import Optional
 import pyrealsense2 as rs
 
 class DistanceEstimator:
@@ -15,9 +19,15 @@ class DistanceEstimator:
     def __init__(self, depth_intrinsics:rs.intrinsics, config:Config):
         self.depth_intrinsics:rs.intrinsics = depth_intrinsics
         self.config = config
+        self.rays = RayTable(depth_intrinsics, config.distance.ray_cache)
+
+
+    def point_cloud(self, depth_frame:np.ndarray, mask:Optional[CompactMask]=None) -> np.ndarray:
+        return self.rays.point_cloud(depth_frame, mask)
 
     def get_stable_value(self, depth_frame:np.ndarray, p1: tuple[int, int], sigma:float=1.5, k=10):
-        y, x = p1
+        # Points are (x, y) pixels like the contour corners
+        x, y = p1
         h, w = depth_frame.shape
 
         # Define region bounds (clamp to image boundaries)
@@ -52,6 +62,71 @@ class DistanceEstimator:
         return int(np.median(filtered_data))
 
 
+    def get_stable_values(self, depth_frame:np.ndarray, points:np.ndarray, sigma:float=1.5, k=10) -> np.ndarray:
+        """get_stable_value of every (N, 2) point at once.
+
+        The patches are gathered from a strided view of the frame; near the borders the view is
+        shifted inside the frame and the pixels outside the original patch are masked out. Each
+        patch is sorted once, so the quartiles and the filtered median are plain index lookups.
+        """
+        points = np.asarray(points, dtype=np.int64).reshape(-1, 2)
+        h, w = depth_frame.shape
+        size = 2 * k + 1
+        x = np.clip(points[:, 0], 0, w - 1)
+        y = np.clip(points[:, 1], 0, h - 1)
+        x0 = np.clip(x - k, 0, w - size)
+        y0 = np.clip(y - k, 0, h - size)
+        regions = sliding_window_view(depth_frame, (size, size))[y0, x0].astype(np.float64)
+
+        offsets = np.arange(size)
+        rows = np.abs(y0[:, None] + offsets - y[:, None]) <= k
+        cols = np.abs(x0[:, None] + offsets - x[:, None]) <= k
+        inside = rows[:, :, None] & cols[:, None, :]
+        regions = regions.reshape(len(points), -1)
+        regions[~(inside.reshape(len(points), -1) & (regions > 0))] = np.nan
+
+        # NaNs sort last, the first count values of every row are the valid ones
+        regions = np.sort(regions, axis=1)
+        count = np.count_nonzero(~np.isnan(regions), axis=1)
+        values = np.zeros(len(points), dtype=np.int64)
+        valid = count > 0
+        if not valid.any():
+            return values
+        regions, count = regions[valid], count[valid]
+
+        def at(index:np.ndarray) -> np.ndarray:
+            return np.take_along_axis(regions, index[:, None], axis=1)[:, 0]
+
+        def quantile(q:float) -> np.ndarray:
+            # np.percentile linear interpolation
+            position = (count - 1) * q
+            lo = np.floor(position).astype(np.int64)
+            hi = np.minimum(lo + 1, count - 1)
+            a, b, t = at(lo), at(hi), position - lo
+            return np.where(t >= 0.5, b - (b - a) * (1 - t), a + (b - a) * t)
+
+        q1, q3 = quantile(0.25), quantile(0.75)
+        iqr = q3 - q1
+        lower = np.count_nonzero(regions < (q1 - sigma * iqr)[:, None], axis=1)
+        upper = np.count_nonzero(regions <= (q3 + sigma * iqr)[:, None], axis=1)
+        # Without values within the bounds, the median of the whole patch
+        empty = upper <= lower
+        lower = np.where(empty, 0, lower)
+        upper = np.where(empty, count, upper)
+        n = upper - lower
+        median = (at(lower + (n - 1) // 2) + at(lower + n // 2)) / 2
+        values[valid] = median.astype(np.int64)
+        return values
+
+
+    def distances(self, depth_frame:np.ndarray, corners:np.ndarray) -> np.ndarray:
+        """Length of every side of the closed polygon, side i goes from corner i to corner i + 1"""
+        corners = np.asarray(corners).reshape(-1, 2)
+        depths = self.get_stable_values(depth_frame, corners)
+        points = deproject(self.depth_intrinsics, corners, depths)
+        return np.linalg.norm(points - np.roll(points, -1, axis=0), axis=1) * self.config.distance.to_centimeter * self.config.distance.distance_factor
+
+
     def distance(
         self,
         depth_frame:np.ndarray,
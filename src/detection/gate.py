@@ -0,0 +1,92 @@
+# All rights reserved. No part of this code may be reproduced, distributed, or transmitted
+# in any form or by any means, including photocopying, recording, or other electronic or
+# mechanical methods, without the prior written permission of the author, except in the
+# case of brief quotations embodied in critical reviews and certain other noncommercial
+# uses permitted by copyright law. For permission requests, please contact the author.
+#
+# Copyright (c) Lucía Alejandra Moreno Canuto, Gabriel Ernesto Gutiérrez Añez, Alicia Hernández Gutiérrez, Guillermo Daniel González Lozano
+
+import cv2
+import numpy as np
+from config import Config
+
+
+class SceneChangeGate:
+    """Tells whether a frame differs enough from the last processed one to run the detection again.
+
+    Both frames are reduced to a small thumbnail, the color one in grayscale, and compared with
+    the mean absolute difference. Depth is only compared where both thumbnails have valid depth.
+    """
+
+    def __init__(self, config:Config):
+        self.config = config
+        w, h = config.detection.scene_gate_size
+        self.gray = np.empty((h, w), dtype=np.uint8)
+        self.depth = np.empty((h, w), dtype=np.uint16)
+        self.reference_gray = np.empty((h, w), dtype=np.uint8)
+        self.reference_depth = np.empty((h, w), dtype=np.uint16)
+        self.small = np.empty((h, w, 3), dtype=np.uint8)
+        self.has_reference = False
+        self.skipped = 0
+        self.hits = 0
+        self.misses = 0
+        self.gray_difference = 0.0
+        self.depth_difference = 0.0
+
+
+    def __thumbnails__(self, frame:np.ndarray, depth_frame:np.ndarray):
+        size = self.config.detection.scene_gate_size
+        cv2.resize(frame, size, dst=self.small, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self.small, cv2.COLOR_BGR2GRAY, dst=self.gray)
+        # Nearest keeps invalid (zero) depth out of the valid pixels
+        cv2.resize(depth_frame, size, dst=self.depth, interpolation=cv2.INTER_NEAREST)
+
+
+    def __depth_difference__(self) -> float:
+        valid = (self.depth > 0) & (self.reference_depth > 0)
+        if not np.any(valid):
+            return 0.0
+        difference = np.abs(self.depth[valid].astype(np.int32) - self.reference_depth[valid])
+        return float(difference.mean())
+
+
+    def is_unchanged(self, frame:np.ndarray, depth_frame:np.ndarray) -> bool:
+        self.__thumbnails__(frame, depth_frame)
+        if not self.has_reference or self.skipped >= self.config.detection.scene_gate_max_skip:
+            self.misses += 1
+            return False
+
+        self.gray_difference = float(cv2.absdiff(self.gray, self.reference_gray).mean())
+        self.depth_difference = self.__depth_difference__()
+        unchanged = (
+            self.gray_difference <= self.config.detection.scene_gate_gray_threshold
+            and self.depth_difference <= self.config.detection.scene_gate_depth_threshold
+        )
+        if unchanged:
+            self.hits += 1
+            self.skipped += 1
+        else:
+            self.misses += 1
+        return unchanged
+
+
+    def update(self):
+        """Makes the thumbnails of the last checked frame the reference, call it once the frame was processed"""
+        np.copyto(self.reference_gray, self.gray)
+        np.copyto(self.reference_depth, self.depth)
+        self.has_reference = True
+        self.skipped = 0
+
+
+    def clear(self):
+        self.has_reference = False
+        self.skipped = 0
+
+
+    def stats(self) -> dict[str, float]:
+        checked = self.hits + self.misses
+        return {
+            "gate_hits": self.hits,
+            "gate_misses": self.misses,
+            "gate_hit_rate": self.hits / checked if checked > 0 else 0.0,
+        }
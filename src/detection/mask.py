@@ -0,0 +1,108 @@
+# All rights reserved. No part of this code may be reproduced, distributed, or transmitted
+# in any form or by any means, including photocopying, recording, or other electronic or
+# mechanical methods, without the prior written permission of the author, except in the
+# case of brief quotations embodied in critical reviews and certain other noncommercial
+# uses permitted by copyright law. For permission requests, please contact the author.
+#
+# Copyright (c) Lucía Alejandra Moreno Canuto, Gabriel Ernesto Gutiérrez Añez, Alicia Hernández Gutiérrez, Guillermo Daniel González Lozano
+
+import numpy as np
+from typing import Optional
+
+
+class CompactMask:
+    """Boolean frame mask kept as the bit packed crop of its bbox.
+
+    A box mask covers a fraction of the frame and takes one bit per pixel, so it is one or two
+    orders of magnitude smaller than the full frame array. The bbox is known up front, contours
+    and depth lookups only unpack the crop and the full frame array is built only on request.
+    """
+
+    __slots__ = ("shape", "bbox", "crop_shape", "bits")
+
+    def __init__(self, shape:tuple[int, int], bbox:Optional[np.ndarray], crop_shape:tuple[int, int], bits:np.ndarray):
+        self.shape = shape
+        self.bbox = bbox
+        self.crop_shape = crop_shape
+        self.bits = bits
+
+
+    @staticmethod
+    def from_crop(crop:np.ndarray, x:int, y:int, shape:tuple[int, int]) -> "CompactMask":
+        """Mask from the part of a frame of the given shape starting at (x, y)"""
+        crop = crop if crop.dtype == bool else crop > 0
+        rows = np.flatnonzero(crop.any(axis=1))
+        if len(rows) == 0:
+            return CompactMask(tuple(shape), None, (0, 0), np.empty(0, dtype=np.uint8))
+
+        y1, y2 = int(rows[0]), int(rows[-1])
+        cols = np.flatnonzero(crop[y1:y2 + 1].any(axis=0))
+        x1, x2 = int(cols[0]), int(cols[-1])
+        crop = crop[y1:y2 + 1, x1:x2 + 1]
+        return CompactMask(
+            tuple(shape),
+            np.array([x + x1, y + y1, x + x2, y + y2]),
+            crop.shape,
+            np.packbits(crop, axis=None)
+        )
+
+
+    @staticmethod
+    def from_dense(mask:np.ndarray) -> "CompactMask":
+        return CompactMask.from_crop(mask, 0, 0, mask.shape[:2])
+
+
+    def any(self) -> bool:
+        return self.bbox is not None
+
+
+    @property
+    def roi(self) -> tuple[slice, slice]:
+        """Rows and columns of the frame covered by the bbox"""
+        x1, y1, x2, y2 = self.bbox
+        return slice(y1, y2 + 1), slice(x1, x2 + 1)
+
+
+    @property
+    def nbytes(self) -> int:
+        return self.bits.nbytes
+
+
+    def crop(self) -> np.ndarray:
+        """The unpacked bbox crop, a bool array"""
+        h, w = self.crop_shape
+        return np.unpackbits(self.bits, count=h * w).reshape(h, w).view(bool)
+
+
+    def dense(self) -> np.ndarray:
+        """The full frame bool array"""
+        mask = np.zeros(self.shape, dtype=bool)
+        if self.any():
+            mask[self.roi] = self.crop()
+        return mask
+
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        mask = self.dense()
+        return mask if dtype is None else mask.astype(dtype)
+
+
+    def select(self, frame:np.ndarray) -> np.ndarray:
+        """Values of the frame under the mask"""
+        if not self.any():
+            return frame[:0, 0]
+        return frame[self.roi][self.crop()]
+
+
+    def contour(self) -> Optional[np.ndarray]:
+        """Largest external contour in frame coordinates"""
+        import cv2
+
+        if not self.any():
+            return None
+        contours, _ = cv2.findContours(
+            self.crop().view(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE, offset=(int(self.bbox[0]), int(self.bbox[1]))
+        )
+        if not contours:
+            return None
+        return max(contours, key=cv2.contourArea)
\ No newline at end of file
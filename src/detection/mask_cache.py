@@ -0,0 +1,105 @@
+# All rights reserved. No part of this code may be reproduced, distributed, or transmitted
+# in any form or by any means, including photocopying, recording, or other electronic or
+# mechanical methods, without the prior written permission of the author, except in the
+# case of brief quotations embodied in critical reviews and certain other noncommercial
+# uses permitted by copyright law. For permission requests, please contact the author.
+#
+# Copyright (c) Lucía Alejandra Moreno Canuto, Gabriel Ernesto Gutiérrez Añez, Alicia Hernández Gutiérrez, Guillermo Daniel González Lozano
+
+import cv2
+import numpy as np
+from typing import Optional, List, NamedTuple
+from config import Config
+from detection.mask import CompactMask
+
+
+def bbox_iou(a:np.ndarray, b:np.ndarray) -> float:
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    intersection = max(0, x2 - x1) * max(0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return float(intersection / union) if union > 0 else 0.0
+
+
+class CachedMask(NamedTuple):
+    bbox: np.ndarray
+    mask: CompactMask
+    age: int
+
+
+class MaskCache:
+    """SAM masks of the previous frame, reused when YOLO returns almost the same bbox.
+
+    The cached mask is always the one SAM produced, it is mapped from its own bbox to the new
+    one so consecutive hits don't accumulate warping error. After mask_cache_refresh hits the
+    entry expires and SAM runs again.
+    """
+
+    def __init__(self, config:Config):
+        self.config = config
+        self.previous:List[CachedMask] = []
+        self.current:List[CachedMask] = []
+        self.hits = 0
+        self.misses = 0
+        self.sam_seconds = 0.0
+        self.sam_boxes = 0
+        self.saved_seconds = 0.0
+
+
+    def next_frame(self):
+        self.previous, self.current = self.current, []
+
+
+    def clear(self):
+        self.previous, self.current = [], []
+
+
+    def lookup(self, bbox:np.ndarray, shape:tuple[int, int]) -> Optional[CompactMask]:
+        best, best_iou = None, self.config.detection.mask_cache_iou
+        for entry in self.previous:
+            iou = bbox_iou(entry.bbox, bbox)
+            if iou >= best_iou and entry.age < self.config.detection.mask_cache_refresh:
+                best, best_iou = entry, iou
+
+        if best is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        if self.sam_boxes > 0:
+            self.saved_seconds += self.sam_seconds / self.sam_boxes
+        self.current.append(best._replace(age=best.age + 1))
+        return self.__warp__(best, bbox, shape)
+
+
+    def store(self, bbox:np.ndarray, mask:CompactMask):
+        self.current.append(CachedMask(bbox=bbox, mask=mask, age=0))
+
+
+    def record_sam(self, seconds:float, boxes:int):
+        self.sam_seconds += seconds
+        self.sam_boxes += boxes
+
+
+    def __warp__(self, entry:CachedMask, bbox:np.ndarray, shape:tuple[int, int]) -> CompactMask:
+        ox1, oy1, ox2, oy2 = [float(v) for v in entry.bbox]
+        nx1, ny1, nx2, ny2 = [float(v) for v in bbox]
+        sx = (nx2 - nx1) / max(ox2 - ox1, 1)
+        sy = (ny2 - ny1) / max(oy2 - oy1, 1)
+        transform = np.float32([
+            [sx, 0, nx1 - sx * ox1],
+            [0, sy, ny1 - sy * oy1],
+        ])
+        h, w = shape
+        warped = cv2.warpAffine(entry.mask.dense().view(np.uint8), transform, (w, h), flags=cv2.INTER_NEAREST)
+        return CompactMask.from_dense(warped)
+
+
+    def stats(self) -> dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "mask_cache_hits": self.hits,
+            "mask_cache_misses": self.misses,
+            "mask_cache_hit_rate": self.hits / lookups if lookups > 0 else 0.0,
+            "mask_cache_saved_ms": self.saved_seconds * 1000,
+        }
@@ -0,0 +1,186 @@
+# All rights reserved. No part of this code may be reproduced, distributed, or transmitted
+# in any form or by any means, including photocopying, recording, or other electronic or
+# mechanical methods, without the prior written permission of the author, except in the
+# case of brief quotations embodied in critical reviews and certain other noncommercial
+# uses permitted by copyright law. For permission requests, please contact the author.
+#
+# Copyright (c) Lucía Alejandra Moreno Canuto, Gabriel Ernesto Gutiérrez Añez, Alicia Hernández Gutiérrez, Guillermo Daniel González Lozano
+
+import time
+import itertools
+import cv2
+import numpy as np
+from typing import Optional, List, NamedTuple
+from config import Config
+from domain import Dimensions, DimSide
+from detection.distance import DistanceEstimator
+from detection.mask import CompactMask
+from detection.projection import project
+
+# Box faces are perpendicular, a later face normal must be within ~17 degrees of it
+MAX_FACE_COS = 0.3
+# Fraction of the points trimmed at both ends of every axis, flying pixels at the edges
+EXTENT_TRIM = 0.005
+SIGNS = np.array(list(itertools.product((-1, 1), repeat=3)), dtype=np.float64)
+
+
+class Plane(NamedTuple):
+    normal: np.ndarray
+    centroid: np.ndarray
+    inliers: np.ndarray
+
+
+def fit_plane(points:np.ndarray, iterations:int, threshold:float, rng:np.random.Generator, normals:Optional[List[np.ndarray]]=None) -> Optional[Plane]:
+    """RANSAC with every hypothesis scored at once, refined with a least squares fit of the inliers.
+    Hypotheses not perpendicular to the given normals are discarded"""
+    samples = points[rng.integers(0, len(points), (iterations, 3))]
+    candidates = np.cross(samples[:, 1] - samples[:, 0], samples[:, 2] - samples[:, 0])
+    norms = np.linalg.norm(candidates, axis=1)
+    valid = norms > 1e-9
+    candidates[valid] /= norms[valid, None]
+    for normal in normals or []:
+        valid &= np.abs(candidates @ normal) < MAX_FACE_COS
+    if not valid.any():
+        return None
+
+    candidates, samples = candidates[valid], samples[valid]
+    offsets = np.einsum("ij,ij->i", candidates, samples[:, 0])
+    scores = (np.abs(points @ candidates.T - offsets) < threshold).sum(axis=0)
+    best = scores.argmax()
+    inliers = np.abs(points @ candidates[best] - offsets[best]) < threshold
+    if inliers.sum() < 3:
+        return None
+
+    centroid = points[inliers].mean(axis=0)
+    normal = np.linalg.svd(points[inliers] - centroid, full_matrices=False)[2][2]
+    return Plane(normal=normal, centroid=centroid, inliers=np.abs((points - centroid) @ normal) < threshold)
+
+
+def fit_faces(points:np.ndarray, iterations:int, threshold:float, min_inliers:float, rng:np.random.Generator) -> List[Plane]:
+    """Up to the three visible faces of a box, each one fitted over the points left by the previous"""
+    faces:List[Plane] = []
+    remaining = np.ones(len(points), dtype=bool)
+    minimum = max(int(min_inliers * len(points)), 3)
+    while len(faces) < 3 and remaining.sum() >= minimum:
+        indices = np.flatnonzero(remaining)
+        plane = fit_plane(points[indices], iterations, threshold, rng, [f.normal for f in faces])
+        if plane is None or plane.inliers.sum() < minimum:
+            break
+        inliers = np.zeros(len(points), dtype=bool)
+        inliers[indices[plane.inliers]] = True
+        faces.append(plane._replace(inliers=inliers))
+        remaining &= ~inliers
+    return faces
+
+
+def box_axes(points:np.ndarray, faces:List[Plane]) -> np.ndarray:
+    """Orthonormal box axes, as rows. From the face normals, or with a single face from the
+    minimum area rectangle of the points over it"""
+    first = faces[0].normal
+    if len(faces) > 1:
+        second = faces[1].normal - (faces[1].normal @ first) * first
+    else:
+        u = np.cross(first, [1.0, 0.0, 0.0] if abs(first[0]) < 0.9 else [0.0, 1.0, 0.0])
+        u /= np.linalg.norm(u)
+        v = np.cross(first, u)
+        flat = np.column_stack([points @ u, points @ v]).astype(np.float32)
+        angle = np.deg2rad(cv2.minAreaRect(flat)[2])
+        second = np.cos(angle) * u + np.sin(angle) * v
+    second /= np.linalg.norm(second)
+    return np.stack([first, second, np.cross(first, second)])
+
+
+class PointCloudEstimator:
+    """Measures a box from the point cloud of its whole mask instead of six contour corners.
+
+    The visible faces are segmented with RANSAC, the oriented bounding box takes its axes from
+    the face normals and its extents from the face points. The confidence is the fraction of
+    points explained by the faces times the fraction of the three faces found. Boxes with fewer
+    than pointcloud_min_faces faces, or below pointcloud_min_confidence, are not measured. Clouds
+    are subsampled to a point count adapted every frame to the configured time budget.
+    """
+
+    def __init__(self, distance_estimator:DistanceEstimator, config:Config):
+        self.distance_estimator = distance_estimator
+        self.config = config
+        self.samples = config.detection.pointcloud_max_points
+        self.rng = np.random.default_rng(0)
+        self.estimations = 0
+        self.over_budget = 0
+        self.elapsed = 0.0
+
+
+    def calculate_object_dimensions(self, depth_frame:np.ndarray, mask:CompactMask) -> Optional[Dimensions]:
+        started = time.perf_counter()
+        try:
+            return self.__estimate__(depth_frame, mask)
+        finally:
+            self.__adapt__(time.perf_counter() - started)
+
+
+    def __adapt__(self, elapsed:float):
+        detection = self.config.detection
+        budget = detection.pointcloud_budget_ms / 1000
+        self.estimations += 1
+        self.elapsed += elapsed
+        if elapsed > budget:
+            self.over_budget += 1
+        scale = min(max(budget / max(elapsed, 1e-6), 0.5), 1.25)
+        self.samples = int(min(max(self.samples * scale, detection.pointcloud_min_points), detection.pointcloud_max_points))
+
+
+    def __estimate__(self, depth_frame:np.ndarray, mask:CompactMask) -> Optional[Dimensions]:
+        detection = self.config.detection
+        points = self.distance_estimator.point_cloud(depth_frame, mask)
+        if len(points) < detection.pointcloud_min_points:
+            return None
+        if len(points) > self.samples:
+            points = points[self.rng.integers(0, len(points), self.samples)]
+        points = points.astype(np.float64)
+
+        faces = fit_faces(points, detection.ransac_iterations, detection.ransac_threshold, detection.ransac_min_inliers, self.rng)
+        # With a single face the extent along its normal is only the plane noise
+        if not faces or len(faces) < detection.pointcloud_min_faces:
+            return None
+        inliers = np.logical_or.reduce([f.inliers for f in faces])
+        axes = box_axes(points[faces[0].inliers], faces)
+
+        projected = points[inliers] @ axes.T
+        lower, upper = np.quantile(projected, [EXTENT_TRIM, 1 - EXTENT_TRIM], axis=0)
+        center = (lower + upper) / 2 @ axes
+        half = (upper - lower) / 2
+        confidence = float(inliers.mean() * len(faces) / 3)
+        if confidence < detection.pointcloud_min_confidence:
+            return None
+        return self.__dimensions__(center, axes, half, confidence)
+
+
+    def __dimensions__(self, center:np.ndarray, axes:np.ndarray, half:np.ndarray, confidence:float) -> Dimensions:
+        """The outline hexagon around the corner closest to the camera, so the sides 3 to 5 are
+        the three box dimensions like in the corner method"""
+        corners = center + (SIGNS * half) @ axes
+        nearest = np.linalg.norm(corners, axis=1).argmin()
+        a, b, c = -2 * (SIGNS[nearest] * half)[:, None] * axes
+        origin = corners[nearest]
+        outline = origin + np.array([c, c + a, a, a + b, b, b + c])
+        pixels = np.rint(project(self.distance_estimator.depth_intrinsics, outline)).astype(int)
+
+        distance = self.config.distance
+        lengths = np.linalg.norm(np.roll(outline, -1, axis=0) - outline, axis=1) * distance.to_centimeter * distance.distance_factor
+        sides:List[DimSide] = []
+        for i, length in enumerate(lengths):
+            sides.append(DimSide(
+                value=int(length),
+                point1=tuple(int(v) for v in pixels[i]),
+                point2=tuple(int(v) for v in pixels[(i + 1) % 6])
+            ))
+        return Dimensions(sides=sides, confidence=confidence)
+
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "pointcloud_estimations": self.estimations,
+            "pointcloud_over_budget": self.over_budget,
+            "pointcloud_samples": self.samples,
+            "pointcloud_mean_ms": 1000 * self.elapsed / self.estimations if self.estimations else 0.0,
+        }
\ No newline at end of file
@@ -0,0 +1,188 @@
+# All rights reserved. No part of this code may be reproduced, distributed, or transmitted
+# in any form or by any means, including photocopying, recording, or other electronic or
+# mechanical methods, without the prior written permission of the author, except in the
+# case of brief quotations embodied in critical reviews and certain other noncommercial
+# uses permitted by copyright law. For permission requests, please contact the author.
+#
+# Copyright (c) Lucía Alejandra Moreno Canuto, Gabriel Ernesto Gutiérrez Añez, Alicia Hernández Gutiérrez, Guillermo Daniel González Lozano
+
+import os
+import hashlib
+import numpy as np
+import pyrealsense2 as rs
+from typing import Optional
+from detection.mask import CompactMask
+from log import logging
+
+EPSILON = np.finfo(np.float32).eps
+
+
+def deproject_rays(intrinsics:rs.intrinsics, pixels:np.ndarray) -> np.ndarray:
+    """(x/z, y/z) of the ray through every (N, 2) pixel, rs2_deproject_pixel_to_point at depth 1
+    for every distortion model, vectorized"""
+    pixels = np.asarray(pixels, dtype=np.float64).reshape(-1, 2)
+    c = np.asarray(intrinsics.coeffs, dtype=np.float64)
+    xo = (pixels[:, 0] - intrinsics.ppx) / intrinsics.fx
+    yo = (pixels[:, 1] - intrinsics.ppy) / intrinsics.fy
+    x, y = xo.copy(), yo.copy()
+    model = intrinsics.model
+
+    # Like librealsense, a forward distorted (modified brown conrady) image is not undistorted.
+    # RealSense depth streams usually report all zero brown conrady coefficients, nothing to undo
+    if model in (rs.distortion.inverse_brown_conrady, rs.distortion.brown_conrady) and np.any(c[:5]):
+        # Fixed point iterations, 10 like librealsense
+        for _ in range(10):
+            r2 = x * x + y * y
+            icdist = 1 / (1 + ((c[4] * r2 + c[1]) * r2 + c[0]) * r2)
+            if model == rs.distortion.inverse_brown_conrady:
+                xq, yq = x / icdist, y / icdist
+            else:
+                xq, yq = x, y
+            delta_x = 2 * c[2] * xq * yq + c[3] * (r2 + 2 * xq * xq)
+            delta_y = 2 * c[3] * xq * yq + c[2] * (r2 + 2 * yq * yq)
+            x = (xo - delta_x) * icdist
+            y = (yo - delta_y) * icdist
+
+    elif model == rs.distortion.kannala_brandt4:
+        rd = np.maximum(np.sqrt(x * x + y * y), EPSILON)
+        theta = rd.copy()
+        theta2 = rd * rd
+        active = np.ones(len(rd), dtype=bool)
+        # Newton iterations, every pixel stops on its own once converged
+        for _ in range(4):
+            f = theta * (1 + theta2 * (c[0] + theta2 * (c[1] + theta2 * (c[2] + theta2 * c[3])))) - rd
+            active &= np.abs(f) >= EPSILON
+            if not active.any():
+                break
+            df = 1 + theta2 * (3 * c[0] + theta2 * (5 * c[1] + theta2 * (7 * c[2] + 9 * theta2 * c[3])))
+            theta = np.where(active, theta - f / df, theta)
+            theta2 = theta * theta
+        r = np.tan(theta)
+        x = x * r / rd
+        y = y * r / rd
+
+    elif model == rs.distortion.ftheta:
+        rd = np.maximum(np.sqrt(x * x + y * y), EPSILON)
+        r = np.tan(c[0] * rd) / np.arctan(2 * np.tan(c[0] / 2))
+        x = x * r / rd
+        y = y * r / rd
+
+    return np.stack([x, y], axis=1)
+
+
+def deproject(intrinsics:rs.intrinsics, pixels:np.ndarray, depths:np.ndarray) -> np.ndarray:
+    """(N, 3) points of the (N, 2) pixels at the given depths"""
+    rays = deproject_rays(intrinsics, pixels)
+    depths = np.asarray(depths, dtype=np.float64).reshape(-1)
+    return np.column_stack([rays * depths[:, None], depths])
+
+
+def project(intrinsics:rs.intrinsics, points:np.ndarray) -> np.ndarray:
+    """(N, 2) pixels of the (N, 3) points, pinhole only, meant for drawing"""
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    z = np.maximum(points[:, 2], EPSILON)
+    return np.column_stack([
+        points[:, 0] / z * intrinsics.fx + intrinsics.ppx,
+        points[:, 1] / z * intrinsics.fy + intrinsics.ppy,
+    ])
+
+
+def distort(intrinsics:rs.intrinsics, x:np.ndarray, y:np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Distorts the normalized (x/z, y/z) coordinates like rs2_project_point_to_pixel"""
+    c = np.asarray(intrinsics.coeffs, dtype=np.float64)
+    model = intrinsics.model
+
+    # Like librealsense, there is no projection to an inverse distorted image
+    if model in (rs.distortion.modified_brown_conrady, rs.distortion.brown_conrady) and np.any(c[:5]):
+        r2 = x * x + y * y
+        f = 1 + c[0] * r2 + c[1] * r2 * r2 + c[4] * r2 * r2 * r2
+        if model == rs.distortion.modified_brown_conrady:
+            x, y = x * f, y * f
+            xf, yf = x, y
+        else:
+            xf, yf = x * f, y * f
+        x, y = xf + 2 * c[2] * x * y + c[3] * (r2 + 2 * x * x), yf + 2 * c[3] * x * y + c[2] * (r2 + 2 * y * y)
+
+    elif model == rs.distortion.ftheta:
+        r = np.maximum(np.sqrt(x * x + y * y), EPSILON)
+        rd = np.arctan(2 * r * np.tan(c[0] / 2)) / c[0]
+        x, y = x * rd / r, y * rd / r
+
+    elif model == rs.distortion.kannala_brandt4:
+        r = np.maximum(np.sqrt(x * x + y * y), EPSILON)
+        theta = np.arctan(r)
+        theta2 = theta * theta
+        rd = theta * (1 + theta2 * (c[0] + theta2 * (c[1] + theta2 * (c[2] + theta2 * c[3]))))
+        x, y = x * rd / r, y * rd / r
+
+    return x, y
+
+
+def project_pixels(intrinsics:rs.intrinsics, points:np.ndarray) -> np.ndarray:
+    """(N, 2) pixels of the (N, 3) points, rs2_project_point_to_pixel for every distortion model,
+    vectorized"""
+    points = np.asarray(points).reshape(-1, 3)
+    x, y = distort(intrinsics, points[:, 0] / points[:, 2], points[:, 1] / points[:, 2])
+    return np.column_stack([x * intrinsics.fx + intrinsics.ppx, y * intrinsics.fy + intrinsics.ppy])
+
+
+def intrinsics_key(intrinsics:rs.intrinsics) -> str:
+    """Hash of everything the deprojection depends on"""
+    values = [intrinsics.width, intrinsics.height, intrinsics.ppx, intrinsics.ppy, intrinsics.fx, intrinsics.fy, str(intrinsics.model), *intrinsics.coeffs]
+    return hashlib.sha1(repr(values).encode()).hexdigest()[:16]
+
+
+class RayTable:
+    """(x/z, y/z, 1) of every pixel, so deprojecting a depth region is a single multiply.
+
+    The table is computed once per intrinsics and saved to the cache directory by intrinsics
+    hash, later loads memory-map it. Without a directory it is only kept in memory.
+    """
+
+    def __init__(self, intrinsics:rs.intrinsics, directory:Optional[str]=None):
+        self.key = intrinsics_key(intrinsics)
+        self.path = os.path.join(directory, f"rays_{self.key}.npy") if directory else None
+        self.loaded = False
+        if self.path and os.path.exists(self.path):
+            try:
+                self.rays = np.load(self.path, mmap_mode="r")
+                self.loaded = self.rays.shape == (intrinsics.height, intrinsics.width, 3)
+            except:
+                logging.error(f"Unable to load ray table {self.path}", exc_info=True)
+
+        if not self.loaded:
+            self.rays = self.__build__(intrinsics)
+            if self.path:
+                self.__save__()
+
+
+    def __build__(self, intrinsics:rs.intrinsics) -> np.ndarray:
+        h, w = intrinsics.height, intrinsics.width
+        ys, xs = np.mgrid[0:h, 0:w]
+        rays = np.ones((h, w, 3), dtype=np.float32)
+        rays[..., :2] = deproject_rays(intrinsics, np.column_stack([xs.reshape(-1), ys.reshape(-1)])).reshape(h, w, 2)
+        return rays
+
+
+    def __save__(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            partial = f"{self.path}.{os.getpid()}.tmp"
+            with open(partial, "wb") as f:
+                np.save(f, self.rays)
+            os.replace(partial, self.path)
+            self.rays = np.load(self.path, mmap_mode="r")
+        except:
+            logging.error(f"Unable to save ray table {self.path}", exc_info=True)
+
+
+    def point_cloud(self, depth_frame:np.ndarray, mask:Optional[CompactMask]=None) -> np.ndarray:
+        """(N, 3) points, in depth units, of the pixels under the mask with a valid depth"""
+        if mask is None:
+            rays, depth, selected = self.rays, depth_frame, depth_frame > 0
+        elif not mask.any():
+            return np.empty((0, 3), dtype=np.float32)
+        else:
+            rays, depth = self.rays[mask.roi], depth_frame[mask.roi]
+            selected = mask.crop() & (depth > 0)
+        return rays[selected] * depth[selected].astype(np.float32)[:, None]
\ No newline at end of file
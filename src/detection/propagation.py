@@ -0,0 +1,115 @@
+# All rights reserved. No part of this code may be reproduced, distributed, or transmitted
+# in any form or by any means, including photocopying, recording, or other electronic or
+# mechanical methods, without the prior written permission of the author, except in the
+# case of brief quotations embodied in critical reviews and certain other noncommercial
+# uses permitted by copyright law. For permission requests, please contact the author.
+#
+# Copyright (c) Lucía Alejandra Moreno Canuto, Gabriel Ernesto Gutiérrez Añez, Alicia Hernández Gutiérrez, Guillermo Daniel González Lozano
+
+import cv2
+import numpy as np
+from typing import Optional, List
+from config import Config
+from detection.mask import CompactMask
+
+
+class MaskPropagator:
+    """Carries the masks of the last full detection to the following frames.
+
+    Good features inside each mask are followed with pyramidal Lucas-Kanade optical flow, a
+    similarity transform is fitted to them and the mask is warped with it. The propagation
+    confidence is the fraction of features consistent with the transform.
+    """
+
+    def __init__(self, config:Config):
+        self.config = config
+        self.previous_gray:Optional[np.ndarray] = None
+        self.gray:Optional[np.ndarray] = None
+        self.masks:List[CompactMask] = []
+        self.frames_since_detection = 0
+        self.confidence = 0.0
+        self.kernel = np.ones((9, 9), dtype=np.uint8)
+
+
+    def __to_gray__(self, frame:np.ndarray) -> np.ndarray:
+        if self.gray is None or self.gray.shape != frame.shape[:2]:
+            self.gray = np.empty(frame.shape[:2], dtype=np.uint8)
+            self.previous_gray = np.empty(frame.shape[:2], dtype=np.uint8)
+        cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self.gray)
+        return self.gray
+
+
+    def __swap__(self):
+        self.gray, self.previous_gray = self.previous_gray, self.gray
+
+
+    def __feature_points__(self, mask:np.ndarray) -> Optional[np.ndarray]:
+        # Corners inside the mask and along its border, straight contour points alone can't
+        # be followed by optical flow (aperture problem)
+        region = cv2.dilate(mask.view(np.uint8), self.kernel)
+        return cv2.goodFeaturesToTrack(
+            self.previous_gray,
+            maxCorners=self.config.detection.tracking_points,
+            qualityLevel=0.01,
+            minDistance=5,
+            mask=region
+        )
+
+
+    def is_due(self) -> bool:
+        """True when the next frame needs a full detection pass"""
+        return not self.masks or self.frames_since_detection + 1 >= self.config.detection.detection_interval
+
+
+    def reset(self, frame:np.ndarray, masks:List[CompactMask]):
+        self.__to_gray__(frame)
+        self.__swap__()
+        self.masks = list(masks)
+        self.frames_since_detection = 0
+        self.confidence = 1.0
+
+
+    def clear(self):
+        self.masks = []
+        self.frames_since_detection = 0
+
+
+    def propagate(self, frame:np.ndarray) -> Optional[List[CompactMask]]:
+        """Warps the tracked masks into the frame, None when any of them can't be followed reliably"""
+        gray = self.__to_gray__(frame)
+        h, w = gray.shape
+        propagated:List[CompactMask] = []
+        confidence = 1.0
+
+        for compact in self.masks:
+            mask = compact.dense()
+            points = self.__feature_points__(mask)
+            if points is None or len(points) < 3:
+                confidence = 0.0
+                break
+
+            next_points, status, _ = cv2.calcOpticalFlowPyrLK(
+                self.previous_gray, gray, points, None, winSize=(21, 21), maxLevel=3
+            )
+            tracked = status.reshape(-1) == 1
+            if np.count_nonzero(tracked) < 3:
+                confidence = 0.0
+                break
+
+            transform, inliers = cv2.estimateAffinePartial2D(points[tracked], next_points[tracked], method=cv2.RANSAC)
+            if transform is None:
+                confidence = 0.0
+                break
+
+            confidence = min(confidence, float(np.count_nonzero(inliers)) / len(points))
+            warped = cv2.warpAffine(mask.view(np.uint8), transform, (w, h), flags=cv2.INTER_NEAREST)
+            propagated.append(CompactMask.from_dense(warped))
+
+        self.confidence = confidence
+        if confidence < self.config.detection.tracking_min_confidence:
+            return None
+
+        self.__swap__()
+        self.masks = propagated
+        self.frames_since_detection += 1
+        return propagated
@@ -0,0 +1,133 @@
+# All rights reserved. No part of this code may be reproduced, distributed, or transmitted
+# in any form or by any means, including photocopying, recording, or other electronic or
+# mechanical methods, without the prior written permission of the author, except in the
+# case of brief quotations embodied in critical reviews and certain other noncommercial
+# uses permitted by copyright law. For permission requests, please contact the author.
+#
+# Copyright (c) Lucía Alejandra Moreno Canuto, Gabriel Ernesto Gutiérrez Añez, Alicia Hernández Gutiérrez, Guillermo Daniel González Lozano
+
+import os
+import glob
+import shutil
+import numpy as np
+from typing import List
+from ultralytics.data.augment import LetterBox
+from detection.backends import box_model_path, export_box_model, export_sam_encoder, sam_encoder_path
+from log import logging
+
+
+# Post-training static quantization of the exported models. Both backends calibrate the
+# activation ranges with recorded frames preprocessed exactly as the predictors do it.
+SAM_MEAN = np.array([123.675, 116.28, 103.53], dtype=np.float32)
+SAM_STD = np.array([58.395, 57.12, 57.375], dtype=np.float32)
+
+
+def yolo_input(frame:np.ndarray, imgsz:int=640) -> np.ndarray:
+    image = LetterBox((imgsz, imgsz), auto=False)(image=frame)
+    image = image[..., ::-1].transpose(2, 0, 1)[None].astype(np.float32) / 255
+    return np.ascontiguousarray(image)
+
+
+def sam_input(frame:np.ndarray, imgsz:int=1024) -> np.ndarray:
+    image = LetterBox((imgsz, imgsz), auto=False, center=False)(image=frame)
+    image = (image[..., ::-1].astype(np.float32) - SAM_MEAN) / SAM_STD
+    return np.ascontiguousarray(image.transpose(2, 0, 1)[None])
+
+
+def int8_path(path:str) -> str:
+    if path.rstrip("/").endswith("_openvino_model"):
+        return path.rstrip("/")[:-len("_openvino_model")] + "_int8_openvino_model"
+    base, extension = os.path.splitext(path)
+    if base.endswith("_openvino"):
+        return base[:-len("_openvino")] + "_int8_openvino" + extension
+    return base + "_int8" + extension
+
+
+def quantize_onnx(source:str, target:str, inputs:List[np.ndarray]):
+    import onnx
+    from onnxruntime.quantization import quantize_static, CalibrationDataReader, QuantFormat, QuantType
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    class FrameReader(CalibrationDataReader):
+        def __init__(self, name:str):
+            self.frames = iter([{name: x} for x in inputs])
+
+        def get_next(self):
+            return next(self.frames, None)
+
+    prepared = target + ".prep.onnx"
+    quant_pre_process(source, prepared)
+    name = onnx.load(prepared, load_external_data=False).graph.input[0].name
+    quantize_static(
+        prepared,
+        target,
+        FrameReader(name),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+    )
+    os.remove(prepared)
+
+    # ultralytics reads the class names and strides from the model metadata
+    original = onnx.load(source, load_external_data=False)
+    quantized = onnx.load(target)
+    del quantized.metadata_props[:]
+    quantized.metadata_props.extend(original.metadata_props)
+    onnx.save(quantized, target)
+
+
+def quantize_openvino(source:str, target:str, inputs:List[np.ndarray]):
+    import nncf
+    import openvino as ov
+
+    model = ov.Core().read_model(source)
+    quantized = nncf.quantize(model, nncf.Dataset(inputs), subset_size=len(inputs), preset=nncf.QuantizationPreset.MIXED)
+    ov.save_model(quantized, target)
+
+
+def quantize_box_model(weights:str, backend:str, frames:List[np.ndarray], imgsz:int=640) -> str:
+    source = box_model_path(weights, backend)
+    if not os.path.exists(source):
+        source = export_box_model(weights, backend, imgsz=imgsz)
+    target = int8_path(source)
+    inputs = [yolo_input(frame, imgsz) for frame in frames]
+
+    if backend == "onnx":
+        quantize_onnx(source, target, inputs)
+    else:
+        os.makedirs(target, exist_ok=True)
+        xml = glob.glob(os.path.join(source, "*.xml"))[0]
+        quantize_openvino(xml, os.path.join(target, os.path.basename(xml)), inputs)
+        shutil.copy(os.path.join(source, "metadata.yaml"), os.path.join(target, "metadata.yaml"))
+
+    logging.info(f"Quantized {source} to {target} with {len(frames)} calibration frames.")
+    return target
+
+
+def quantize_sam_encoder(weights:str, backend:str, frames:List[np.ndarray], imgsz:int=1024) -> str:
+    source = sam_encoder_path(weights, backend, imgsz)
+    if not os.path.exists(source):
+        source = export_sam_encoder(weights, backend, imgsz)
+    target = int8_path(source)
+    inputs = [sam_input(frame, imgsz) for frame in frames]
+
+    if backend == "onnx":
+        quantize_onnx(source, target, inputs)
+    else:
+        quantize_openvino(source, target, inputs)
+    shutil.copy(source + ".spec", target + ".spec")
+
+    logging.info(f"Quantized {source} to {target} with {len(frames)} calibration frames.")
+    return target
+
+
+def artifact_size(path:str) -> int:
+    if os.path.isdir(path):
+        return sum(os.path.getsize(f) for f in glob.glob(os.path.join(path, "*")) if os.path.isfile(f))
+    size = os.path.getsize(path)
+    # openvino keeps the weights next to the xml
+    weights = os.path.splitext(path)[0] + ".bin"
+    if path.endswith(".xml") and os.path.exists(weights):
+        size += os.path.getsize(weights)
+    return size
@@ -0,0 +1,119 @@
+# All rights reserved. No part of this code may be reproduced, distributed, or transmitted
+# in any form or by any means, including photocopying, recording, or other electronic or
+# mechanical methods, without the prior written permission of the author, except in the
+# case of brief quotations embodied in critical reviews and certain other noncommercial
+# uses permitted by copyright law. For permission requests, please contact the author.
+#
+# Copyright (c) Lucía Alejandra Moreno Canuto, Gabriel Ernesto Gutiérrez Añez, Alicia Hernández Gutiérrez, Guillermo Daniel González Lozano
+
+import time
+import threading
+from typing import Any, Optional, NamedTuple
+from config import Config
+from log import logging
+
+
+class ModelKey(NamedTuple):
+    box_model: str
+    box_backend: str
+    sam_model: str
+    sam_backend: str
+    sam_imgsz: int
+    sam_encoder: Optional[str]
+
+
+class LoadedModels:
+    """Models of one key, filled in by the loading thread"""
+
+    def __init__(self):
+        self.ready = threading.Event()
+        self.waiting = False
+        self.box_model:Any = None
+        self.sam_model:Any = None
+        self.error:Optional[BaseException] = None
+        self.load_seconds = 0.0
+        self.warmup_seconds = 0.0
+
+
+class ModelRegistry:
+    """Loads (and warms up) the YOLO and SAM models once per process and shares them with every
+    BoxDetection using the same models, so restarting the camera never reloads them."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.models:dict[ModelKey, LoadedModels] = {}
+
+
+    def key(self, config:Config) -> ModelKey:
+        from detection.backends import sam_imgsz
+        return ModelKey(
+            box_model=config.detection.box_model,
+            box_backend=config.detection.box_backend,
+            sam_model=config.detection.sam_model,
+            sam_backend=config.detection.sam_backend,
+            sam_imgsz=sam_imgsz(config),
+            sam_encoder=config.detection.sam_encoder,
+        )
+
+
+    def preload(self, config:Config) -> LoadedModels:
+        """Starts loading the models on a background thread, returns immediately"""
+        key = self.key(config)
+        with self.lock:
+            loaded = self.models.get(key)
+            if loaded is None:
+                loaded = self.models[key] = LoadedModels()
+                threading.Thread(target=self.__load__, args=(key, loaded, config), name="model-loader", daemon=True).start()
+        return loaded
+
+
+    def get(self, config:Config, timeout:Optional[float]=None) -> tuple[Any, Any]:
+        """Returns the (box, sam) models, waiting for the background load if it is still running"""
+        key = self.key(config)
+        loaded = self.preload(config)
+        if not loaded.ready.is_set() and not loaded.waiting:
+            loaded.waiting = True
+            logging.info("Waiting for the detection models to load ...")
+        if not loaded.ready.wait(timeout):
+            raise TimeoutError(f"Detection models not loaded after {timeout}s")
+        if loaded.error is not None:
+            # Drop the failed entry so the next call retries the load
+            with self.lock:
+                if self.models.get(key) is loaded:
+                    del self.models[key]
+            raise RuntimeError("Unable to load the detection models") from loaded.error
+        return loaded.box_model, loaded.sam_model
+
+
+    def is_ready(self, config:Config) -> bool:
+        loaded = self.models.get(self.key(config))
+        return loaded is not None and loaded.ready.is_set() and loaded.error is None
+
+
+    def __load__(self, key:ModelKey, loaded:LoadedModels, config:Config):
+        try:
+            from detection.backends import load_box_model, load_sam_model, warmup
+            started = time.perf_counter()
+            loaded.box_model = load_box_model(key.box_model, key.box_backend)
+            loaded.sam_model = load_sam_model(key.sam_model, key.sam_backend, key.sam_imgsz, key.sam_encoder)
+            loaded.load_seconds = time.perf_counter() - started
+            if config.detection.warmup:
+                loaded.warmup_seconds = warmup(loaded.box_model, loaded.sam_model, config)
+            logging.info(f"Detection models loaded in {loaded.load_seconds:.2f}s and warmed up in {loaded.warmup_seconds:.2f}s ({key.box_backend}/{key.sam_backend}).")
+        except BaseException as e:
+            loaded.error = e
+            logging.error("Unable to load detection models", exc_info=True)
+        finally:
+            loaded.ready.set()
+
+
+    def stats(self) -> dict[str, float]:
+        ready = [m for m in self.models.values() if m.ready.is_set() and m.error is None]
+        return {
+            "models_loaded": len(ready),
+            "models_load_seconds": sum(m.load_seconds for m in ready),
+            "models_warmup_seconds": sum(m.warmup_seconds for m in ready),
+        }
+
+
+models = ModelRegistry()
\ No newline at end of file
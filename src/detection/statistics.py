@@ -0,0 +1,173 @@
+# All rights reserved. No part of this code may be reproduced, distributed, or transmitted
+# in any form or by any means, including photocopying, recording, or other electronic or
+# mechanical methods, without the prior written permission of the author, except in the
+# case of brief quotations embodied in critical reviews and certain other noncommercial
+# uses permitted by copyright law. For permission requests, please contact the author.
+#
+# Copyright (c) Lucía Alejandra Moreno Canuto, Gabriel Ernesto Gutiérrez Añez, Alicia Hernández Gutiérrez, Guillermo Daniel González Lozano
+
+import math
+import numpy as np
+from typing import Optional
+
+
+# Counting pays off while the value range is not much wider than the number of values
+HISTOGRAM_MAX_RANGE = 2
+
+
+class OrderStatistics:
+    """Multiset of integers in [0, size) backed by a Fenwick tree of counts.
+
+    Adding, removing, ranking and selecting the k-th smallest value cost O(log size), so the
+    quantiles of a sliding window are updated without sorting it. Values outside the range are
+    clamped to it.
+    """
+
+    def __init__(self, size:int=1 << 14):
+        self.size = 1 << (size - 1).bit_length()
+        self.tree = [0] * (self.size + 1)
+        self.count = 0
+
+
+    def clear(self):
+        self.tree = [0] * (self.size + 1)
+        self.count = 0
+
+
+    def add(self, value:int, delta:int=1):
+        i = min(max(int(value), 0), self.size - 1) + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+        self.count += delta
+
+
+    def remove(self, value:int):
+        self.add(value, -1)
+
+
+    def rank(self, value:int) -> int:
+        """How many values are lower or equal than value"""
+        if value < 0:
+            return 0
+        i = min(int(value), self.size - 1) + 1
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+
+    def kth(self, k:int) -> int:
+        """The k-th (0 based) smallest value"""
+        position, step = 0, self.size
+        while step > 0:
+            if position + step <= self.size and self.tree[position + step] <= k:
+                position += step
+                k -= self.tree[position]
+            step >>= 1
+        return position
+
+
+    def quantile(self, q:float) -> float:
+        """Same as np.percentile(values, 100 * q) with the default linear interpolation"""
+        h = (self.count - 1) * q
+        lo = math.floor(h)
+        a = self.kth(lo)
+        if lo + 1 >= self.count:
+            return float(a)
+        b = self.kth(lo + 1)
+        t = h - lo
+        return b - (b - a) * (1 - t) if t >= 0.5 else a + (b - a) * t
+
+
+    def median(self, lower:int=0, upper:Optional[int]=None) -> float:
+        """Median of the values in [lower, upper]"""
+        below = self.rank(lower - 1)
+        inside = (self.count if upper is None else self.rank(upper)) - below
+        if inside <= 0:
+            return math.nan
+        a = self.kth(below + (inside - 1) // 2)
+        b = self.kth(below + inside // 2)
+        return (a + b) / 2
+
+
+    def robust_median(self, sigma:float=3) -> float:
+        """Median of the values within sigma interquartile ranges of the quartiles"""
+        q1 = self.quantile(0.25)
+        q3 = self.quantile(0.75)
+        iqr = q3 - q1
+        return self.median(math.ceil(q1 - sigma * iqr), math.floor(q3 + sigma * iqr))
+
+
+class DepthHistogram:
+    """Exact order statistics of bounded non negative integers, like the z16 depth under a mask,
+    from their counts.
+
+    The values are counted with np.bincount, O(n) plus their range, instead of sorted, and the
+    k-th value is a binary search of the cumulative counts. It pays off for large inputs like
+    whole masks, small patches sort faster. Quantiles match np.percentile with the default
+    linear interpolation and medians match np.median.
+    """
+
+    def __init__(self, values:np.ndarray):
+        values = np.asarray(values).reshape(-1)
+        self.count = len(values)
+        self.offset = int(values.min()) if self.count else 0
+        self.cumulative = np.cumsum(np.bincount(values - self.offset if self.offset else values)) if self.count else np.zeros(1, dtype=np.int64)
+
+
+    def kth(self, k:int) -> int:
+        """The k-th (0 based) smallest value"""
+        return int(np.searchsorted(self.cumulative, k, side="right")) + self.offset
+
+
+    def rank(self, value:float) -> int:
+        """How many values are lower or equal than value"""
+        index = math.floor(value) - self.offset
+        if index < 0:
+            return 0
+        return int(self.cumulative[min(index, len(self.cumulative) - 1)])
+
+
+    def quantile(self, q:float) -> float:
+        """Same as np.percentile(values, 100 * q), NaN without values"""
+        if self.count == 0:
+            return math.nan
+        h = (self.count - 1) * q
+        lo = math.floor(h)
+        a = self.kth(lo)
+        if lo + 1 >= self.count:
+            return float(a)
+        b = self.kth(lo + 1)
+        t = h - lo
+        return b - (b - a) * (1 - t) if t >= 0.5 else a + (b - a) * t
+
+
+    def iqr_bounds(self, sigma:float) -> tuple[float, float]:
+        """Values within sigma interquartile ranges of the quartiles"""
+        q1, q3 = self.quantile(0.25), self.quantile(0.75)
+        iqr = q3 - q1
+        return q1 - sigma * iqr, q3 + sigma * iqr
+
+
+    def median(self, lower:Optional[float]=None, upper:Optional[float]=None) -> float:
+        """Median of the values in [lower, upper], NaN without values there"""
+        below = 0 if lower is None else self.rank(math.ceil(lower) - 1)
+        inside = (self.count if upper is None else self.rank(upper)) - below
+        if inside <= 0:
+            return math.nan
+        a = self.kth(below + (inside - 1) // 2)
+        b = self.kth(below + inside // 2)
+        return (a + b) / 2
+
+
+def iqr_bounds(values:np.ndarray, sigma:float) -> tuple[float, float]:
+    """Values within sigma interquartile ranges of the quartiles, like np.percentile, counted
+    unless a few far values (saturated depth) make the range too wide for the values"""
+    values = np.asarray(values).reshape(-1)
+    if len(values) == 0 or int(values.max()) - int(values.min()) > HISTOGRAM_MAX_RANGE * len(values):
+        q1, q3 = np.percentile(values, [25, 75]) if len(values) else (math.nan, math.nan)
+        iqr = q3 - q1
+        return q1 - sigma * iqr, q3 + sigma * iqr
+    return DepthHistogram(values).iqr_bounds(sigma)
\ No newline at end of file
@@ -0,0 +1,188 @@
+# All rights reserved. No part of this code may be reproduced, distributed, or transmitted
+# in any form or by any means, including photocopying, recording, or other electronic or
+# mechanical methods, without the prior written permission of the author, except in the
+# case of brief quotations embodied in critical reviews and certain other noncommercial
+# uses permitted by copyright law. For permission requests, please contact the author.
+#
+# Copyright (c) Lucía Alejandra Moreno Canuto, Gabriel Ernesto Gutiérrez Añez, Alicia Hernández Gutiérrez, Guillermo Daniel González Lozano
+
+import numpy as np
+from itertools import count
+from typing import Optional, List
+from scipy.optimize import linear_sum_assignment
+from config import Config
+from domain import Dimensions, DimSide
+from detection.statistics import OrderStatistics
+
+OBJECT_LOST_SECONDS = 5*1000 # 5 seconds
+NO_MATCH = 1e6
+
+
+class Tracker:
+    """Stabilizes the measured sides with the IQR filtered median of the last maxlen measurements.
+
+    The side values live in a NumPy ring buffer and in an order statistics tree per side, so
+    every update is O(log n) instead of sorting the whole window.
+    """
+
+    def __init__(self, maxlen:int=100, min_samples:int=10, sigma:float=3):
+        self.maxlen = maxlen
+        self.min_samples = min_samples
+        self.sigma = sigma
+        self.values = np.zeros((maxlen, 3), dtype=np.int64)
+        self.head = 0
+        self.size = 0
+        self.statistics = [OrderStatistics() for _ in range(3)]
+        self.last_dimension:Optional[Dimensions] = None
+
+
+    def clear(self):
+        self.head = 0
+        self.size = 0
+        for statistics in self.statistics:
+            statistics.clear()
+        self.last_dimension = None
+
+
+    def __push__(self, dimension:Dimensions):
+        values = (dimension.side3.value, dimension.side4.value, dimension.side5.value)
+        if self.size == self.maxlen:
+            for statistics, value in zip(self.statistics, self.values[self.head]):
+                statistics.remove(value)
+        else:
+            self.size += 1
+        self.values[self.head] = values
+        for statistics, value in zip(self.statistics, values):
+            statistics.add(value)
+        self.head = (self.head + 1) % self.maxlen
+        self.last_dimension = dimension
+
+
+    def get_sides(self):
+        dimension = self.last_dimension
+        if self.size < self.min_samples:
+            return dimension.side3, dimension.side4, dimension.side5
+
+        return tuple(
+            DimSide(
+                value=int(statistics.robust_median(self.sigma)),
+                point1=side.point1,
+                point2=side.point2
+            )
+            for statistics, side in zip(self.statistics, (dimension.side3, dimension.side4, dimension.side5))
+        )
+
+    def update(self, dimension: Optional[Dimensions]):
+        if dimension:
+            if self.last_dimension is not None and (dimension.detection_time - self.last_dimension.detection_time) > OBJECT_LOST_SECONDS:
+                self.clear()
+
+            self.__push__(dimension)
+            if self.size > 5:
+                side3, side4, side5 = self.get_sides()
+                return dimension.model_copy(update={
+                    "sides": [
+                        dimension.side1,
+                        dimension.side2,
+                        side3,
+                        side4,
+                        side5,
+                        dimension.side6
+                    ]
+                })
+
+        return dimension
+
+
+class Track:
+    """A physical box followed across frames, with its own dimension stabilizer"""
+
+    def __init__(self, track_id:int, bbox:np.ndarray, now:int):
+        self.id = track_id
+        self.bbox = bbox
+        self.last_seen = now
+        self.hits = 0
+        self.tracker = Tracker()
+
+
+class MultiObjectTracker:
+    """Associates the measured boxes of every frame to tracks with the Hungarian algorithm.
+
+    The cost of a pair is 1 - IoU of the track bbox and the new one. Pairs below tracking_iou
+    can still match when the centroids are closer than tracking_distance times the track bbox
+    diagonal (at a cost above any IoU match), anything else starts a new track. Each track keeps
+    its own stabilization window and expires on its own after OBJECT_LOST_SECONDS unseen.
+    """
+
+    def __init__(self, config:Config):
+        self.config = config
+        self.tracks:List[Track] = []
+        self.ids = count(1)
+        self.created = 0
+
+
+    def clear(self):
+        self.tracks = []
+
+
+    def __costs__(self, bboxes:List[np.ndarray]) -> np.ndarray:
+        tracks = np.array([t.bbox for t in self.tracks], dtype=np.float64)[:, None, :]
+        boxes = np.array(bboxes, dtype=np.float64)[None, :, :]
+        width = np.clip(np.minimum(tracks[..., 2], boxes[..., 2]) - np.maximum(tracks[..., 0], boxes[..., 0]), 0, None)
+        height = np.clip(np.minimum(tracks[..., 3], boxes[..., 3]) - np.maximum(tracks[..., 1], boxes[..., 1]), 0, None)
+        intersection = width * height
+        areas = lambda b: (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+        union = areas(tracks) + areas(boxes) - intersection
+        iou = np.divide(intersection, union, out=np.zeros_like(union), where=union > 0)
+
+        diagonal = np.maximum(np.hypot(tracks[..., 2] - tracks[..., 0], tracks[..., 3] - tracks[..., 1]), 1.0)
+        distance = np.hypot(
+            (tracks[..., 0] + tracks[..., 2] - boxes[..., 0] - boxes[..., 2]) / 2,
+            (tracks[..., 1] + tracks[..., 3] - boxes[..., 1] - boxes[..., 3]) / 2,
+        ) / diagonal
+
+        costs = np.full(iou.shape, NO_MATCH)
+        close = distance <= self.config.detection.tracking_distance
+        costs[close] = 1 + distance[close]
+        overlapping = iou >= self.config.detection.tracking_iou
+        costs[overlapping] = 1 - iou[overlapping]
+        return costs
+
+
+    def assign(self, bboxes:List[np.ndarray], now:int) -> List[Track]:
+        """The track of every bbox, unmatched bboxes start new tracks"""
+        self.tracks = [t for t in self.tracks if now - t.last_seen <= OBJECT_LOST_SECONDS]
+        assigned:List[Optional[Track]] = [None] * len(bboxes)
+        if self.tracks and bboxes:
+            costs = self.__costs__(bboxes)
+            rows, cols = linear_sum_assignment(costs)
+            for i, j in zip(rows, cols):
+                if costs[i, j] < NO_MATCH:
+                    assigned[j] = self.tracks[i]
+
+        for j, bbox in enumerate(bboxes):
+            track = assigned[j]
+            if track is None:
+                track = Track(next(self.ids), bbox, now)
+                self.tracks.append(track)
+                self.created += 1
+                assigned[j] = track
+            track.bbox = bbox
+            track.last_seen = now
+            track.hits += 1
+        return assigned
+
+
+    def update(self, bboxes:List[np.ndarray], dimensions:List[Optional[Dimensions]], now:int) -> List[tuple[int, Optional[Dimensions]]]:
+        """Track id and stabilized dimensions of every measured box"""
+        return [
+            (track.id, track.tracker.update(dimension))
+            for track, dimension in zip(self.assign(bboxes, now), dimensions)
+        ]
+
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "tracks": len(self.tracks),
+            "tracks_created": self.created,
+        }
\ No newline at end of file
@@ -20,14 +20,14 @@ class DimensionsEstimator:
 
 
     def calculate_object_dimensions(self, depth_frame:np.ndarray, corners:np.ndarray) -> Dimensions:
-        
+        # All the sides in one batch, every corner depth is sampled and deprojected once
+        distances = self.distance_estimator.distances(depth_frame, corners)
         sides:List[DimSide] = []
         for i, corner in enumerate(corners):
             next_corner = corners[0] if len(corners)-1 == i else corners[i+1]
-            distance = self.distance_estimator.distance(depth_frame, corner, next_corner)
             sides.append(DimSide(
-                value=int(distance),
+                value=int(distances[i]),
                 point1=corner,
                 point2=next_corner
             ))
-        return Dimensions(sides=sides)
+        return Dimensions(sides=sides)
\ No newline at end of file
@@ -8,15 +8,13 @@
 
 from datetime import datetime
 import os
-from dotenv import load_dotenv, find_dotenv
 import numpy as np
 import time
 from functools import cached_property
 from uuid import UUID
 from typing import List, Optional, Literal, Any
 from pydantic import BaseModel, ConfigDict, Field, computed_field
-
-load_dotenv(find_dotenv())
+from detection.mask import CompactMask
 
 
 class Box(BaseModel):
@@ -31,6 +29,7 @@ class Box(BaseModel):
     width: float
     height: float
     depth: float
+    mask: Optional[CompactMask] = Field(default=None, repr=False)
     inplan: bool = Field(default=False)
     created_on: datetime = Field(default=datetime.now())
 
@@ -98,6 +97,7 @@ class DimSide(BaseModel):
 
 class Dimensions(BaseModel):
     sides: List[DimSide]
+    confidence: Optional[float] = Field(default=None)
     detection_time: int = Field(default_factory=lambda: int(time.time() * 1000))
 
     @computed_field
@@ -147,10 +147,12 @@ class Prediction(BaseModel):
     frame: np.ndarray
     painted_frame: np.ndarray
     bbox: Optional[np.ndarray] = Field(default=None)
-    mask: Optional[np.ndarray] = Field(default=None)
+    mask: Optional[CompactMask] = Field(default=None)
     corners: Optional[np.ndarray] = Field(default=None)
     dimensions: Optional[Dimensions] = Field(default=None)
+    track_id: Optional[int] = Field(default=None)
     detection_time: int = Field(default_factory=lambda: int(time.time() * 1000))
+    buffers: Optional[Any] = Field(default=None, exclude=True, repr=False)
 
     @cached_property
     def size(self) -> tuple[int, int]:
@@ -216,8 +218,8 @@ class BinPackingResponseParams(BaseModel):
 
 
 class BinPackingRequest(BaseModel):
-    username: str = Field(default=os.getenv("BIN3D_PACKING_USERNAME"))
-    api_key: str = Field(default=os.getenv("BIN3D_PACKING_API_KEY"))
+    username: str = Field(default_factory=lambda: os.getenv("BIN3D_PACKING_USERNAME"))
+    api_key: str = Field(default_factory=lambda: os.getenv("BIN3D_PACKING_API_KEY"))
     items: List[BinPackingItems]
     bins: List[BinPackingBin]
     params: BinPackingResponseParams = Field(default=BinPackingResponseParams())
@@ -275,4 +277,4 @@ class PackingResponse(BaseModel):
 
 class BinPackingResponse(BaseModel):
     model_config = ConfigDict(extra="ignore", arbitrary_types_allowed=True)
-    response: PackingResponse
+    response: PackingResponse
\ No newline at end of file
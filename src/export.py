@@ -0,0 +1,53 @@
+# All rights reserved. No part of this code may be reproduced, distributed, or transmitted
+# in any form or by any means, including photocopying, recording, or other electronic or
+# mechanical methods, without the prior written permission of the author, except in the
+# case of brief quotations embodied in critical reviews and certain other noncommercial
+# uses permitted by copyright law. For permission requests, please contact the author.
+#
+# Copyright (c) Lucía Alejandra Moreno Canuto, Gabriel Ernesto Gutiérrez Añez, Alicia Hernández Gutiérrez, Guillermo Daniel González Lozano
+
+
+import argparse
+import glob
+import json
+import cv2
+import numpy as np
+from config import Config
+from detection.backends import export_box_model, export_sam_encoder, check_parity, check_backend, sam_imgsz
+
+
+def parity_images(session:str, frames:int) -> list[np.ndarray]:
+    if session:
+        from recording import SessionReader
+        reader = SessionReader(session)
+        step = max(1, len(reader) // frames)
+        return [np.array(reader[i][0]) for i in range(0, len(reader), step)][:frames]
+    return [cv2.imread(f) for f in sorted(glob.glob("images/*.jpeg"))][:frames]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exports the detection models to a CPU inference backend")
+    parser.add_argument("backend", choices=["onnx", "openvino"])
+    parser.add_argument("--box-model", default=None, help="YOLO weights, defaults to DetectionConfig.box_model")
+    parser.add_argument("--sam-model", default=None, help="SAM weights, defaults to DetectionConfig.sam_model")
+    parser.add_argument("--sam-roi", action="store_true", help="Export the SAM encoder at the ROI inference size")
+    parser.add_argument("--session", default=None, help="Recorded session used for the parity check, defaults to images/*.jpeg")
+    parser.add_argument("--frames", type=int, default=10, help="Frames used for the parity check")
+    parser.add_argument("--tolerance", type=float, default=0.05)
+    args = parser.parse_args()
+    check_backend(args.backend)
+
+    config = Config()
+    if args.box_model:
+        config.detection.box_model = args.box_model
+    if args.sam_model:
+        config.detection.sam_model = args.sam_model
+    config.detection.sam_roi = args.sam_roi
+
+    export_box_model(config.detection.box_model, args.backend)
+    export_sam_encoder(config.detection.sam_model, args.backend, sam_imgsz(config))
+
+    report = check_parity(config, args.backend, parity_images(args.session, args.frames), args.tolerance)
+    print(json.dumps(report, indent=2))
+    if not report["passed"]:
+        raise SystemExit(1)
@@ -10,6 +10,7 @@
 import cv2
 from typing import Optional
 import numpy as np
+from detection.mask import CompactMask
 
 
 THICKNESS:int = 4
@@ -24,12 +25,13 @@ COLOR_YELLOW:tuple[int, int, int] = (0, 255, 255)
 COLOR_WHITE:tuple[int, int, int] = (255, 255, 255)
 COLOR_GREEN:tuple[int, int, int] = (0, 255, 0)
 COLOR_RED:tuple[int, int, int] = (0, 0, 255)
+MASK_OVERLAY:tuple[float, float, float, float] = (0, 0, 127.5, 0)
 CORNER_SIZE:int = 2
 
 def plot_prediction(
     frame: np.ndarray,
     bbox:Optional[np.ndarray]=None,
-    mask:Optional[np.ndarray]=None,
+    mask:Optional[CompactMask]=None,
     dimensions=None,
     draw_bbox:bool=True,
     draw_mask:bool=True,
@@ -37,7 +39,7 @@ def plot_prediction(
     draw_corners:bool=True,
     draw_distance:bool=True
 ) -> np.ndarray:
-    """Plots bbox, mask and corners to the given frame"""
+    """Plots bbox, mask and corners to the given frame, in place"""
     if draw_bbox and bbox is not None:
         x1, y1, x2, y2 = bbox
         frame = cv2.rectangle(
@@ -49,16 +51,11 @@ def plot_prediction(
             lineType=LINE_TYPE
         )
 
-    if draw_mask and mask is not None:
-        mask2:np.ndarray = np.zeros_like(frame)
-        mask2[mask == True] = COLOR_RED
-        frame:np.ndarray = cv2.addWeighted(frame, 1, mask2, 0.5, 0)
-
-        if mask2.dtype != np.uint8:
-            mask2:np.ndarray = mask2.astype(np.uint8)
-    
-        if len(mask2.shape) > 2:
-            mask2:np.ndarray = cv2.cvtColor(mask2, cv2.COLOR_BGR2GRAY)
+    if draw_mask and mask is not None and mask.any():
+        # Same as blending a half transparent red layer, without allocating the layer, and
+        # only over the mask bbox
+        roi = frame[mask.roi]
+        cv2.add(roi, MASK_OVERLAY, dst=roi, mask=mask.crop().view(np.uint8))
     
     if draw_corners and dimensions is not None:
         draw_side(frame, dimensions.side4, COLOR_CYAN, draw_distance, draw_corner_values)
@@ -0,0 +1,158 @@
+# All rights reserved. No part of this code may be reproduced, distributed, or transmitted
+# in any form or by any means, including photocopying, recording, or other electronic or
+# mechanical methods, without the prior written permission of the author, except in the
+# case of brief quotations embodied in critical reviews and certain other noncommercial
+# uses permitted by copyright law. For permission requests, please contact the author.
+#
+# Copyright (c) Lucía Alejandra Moreno Canuto, Gabriel Ernesto Gutiérrez Añez, Alicia Hernández Gutiérrez, Guillermo Daniel González Lozano
+
+
+import argparse
+import json
+import time
+import numpy as np
+from typing import Any, Optional
+from config import Config
+from recording import SessionReader
+from detection.backends import box_model_path, sam_encoder_path, sam_imgsz, mask_iou, check_backend
+from detection.quantization import quantize_box_model, quantize_sam_encoder, artifact_size
+import utils
+
+
+def evaluation_config(args, box_model:str, sam_encoder:str) -> Config:
+    config = Config()
+    config.detection.box_model = box_model
+    config.detection.sam_encoder = sam_encoder
+    config.detection.box_backend = args.backend
+    config.detection.sam_backend = args.backend
+    # Measure every frame the same way on both variants
+    config.detection.detection_interval = 1
+    config.detection.scene_gate = False
+    config.detection.mask_cache = False
+    config.detection.multi_object = False
+    return config
+
+
+def evaluate(config:Config, reader:SessionReader, indices:list[int], data:Optional[str]) -> tuple[dict[str, Any], Any, list]:
+    from detection.box import BoxDetection
+
+    detection = BoxDetection(config)
+    detection.init(reader.intrinsics)
+    detection.load_models()
+
+    latencies, sides = [], []
+    for i in indices:
+        color, depth, _ = reader[i]
+        color, depth = np.array(color), np.array(depth)
+        enhanced = utils.enhance(color)
+        started = time.perf_counter()
+        prediction = detection.predict(color, enhanced, depth)
+        latencies.append(time.perf_counter() - started)
+        dimensions = prediction.dimensions if prediction.is_complete() else None
+        sides.append(None if dimensions is None else [dimensions.side3.value, dimensions.side4.value, dimensions.side5.value])
+
+    latencies = np.array(latencies) * 1000
+    result = {
+        "box_model": config.detection.box_model,
+        "sam_encoder": config.detection.sam_encoder,
+        "model_bytes": artifact_size(config.detection.box_model) + artifact_size(config.detection.sam_encoder),
+        "latency_mean_ms": float(latencies.mean()),
+        "latency_p95_ms": float(np.percentile(latencies, 95)),
+        "measured_frames": sum(1 for s in sides if s is not None),
+    }
+    if data:
+        from ultralytics import YOLO
+        metrics = YOLO(config.detection.box_model, task="detect").val(data=data, verbose=False)
+        result["map50"] = float(metrics.box.map50)
+        result["map50_95"] = float(metrics.box.map)
+    return result, detection, sides
+
+
+def dimension_error(sides:list, reference:list) -> Optional[float]:
+    errors = [np.abs(np.array(s) - np.array(r)).mean() for s, r in zip(sides, reference) if s is not None and r is not None]
+    return float(np.mean(errors)) if errors else None
+
+
+def segmentation_agreement(reference, candidate, reader:SessionReader, indices:list[int], config:Config) -> Optional[float]:
+    """Mean IoU of the INT8 SAM masks against the FP32 ones, both prompted with the FP32 YOLO boxes"""
+    imgsz = sam_imgsz(config)
+    ious = []
+    for i in indices:
+        enhanced = utils.enhance(np.array(reader[i][0]))
+        boxes = reference.box_model.predict(source=enhanced, conf=config.detection.confidence, iou=config.detection.iou, verbose=False)[0].boxes
+        if boxes is None or len(boxes) == 0:
+            continue
+        bboxes = [np.int32(b) for b in boxes.xyxy.cpu().numpy()]
+        a = reference.sam_model(enhanced, bboxes=bboxes, imgsz=imgsz, verbose=False)[0].masks.data.cpu().numpy() > 0
+        b = candidate.sam_model(enhanced, bboxes=bboxes, imgsz=imgsz, verbose=False)[0].masks.data.cpu().numpy() > 0
+        ious.extend(mask_iou(x, y) for x, y in zip(a, b))
+    return float(np.mean(ious)) if ious else None
+
+
+def markdown(report:dict[str, Any]) -> str:
+    rows = [
+        ("Model size (MB)", lambda r: f"{r['model_bytes'] / 1e6:.1f}"),
+        ("Latency mean (ms)", lambda r: f"{r['latency_mean_ms']:.1f}"),
+        ("Latency p95 (ms)", lambda r: f"{r['latency_p95_ms']:.1f}"),
+        ("Measured frames", lambda r: str(r["measured_frames"])),
+        ("mAP50", lambda r: f"{r['map50']:.3f}" if "map50" in r else "-"),
+        ("mAP50-95", lambda r: f"{r['map50_95']:.3f}" if "map50_95" in r else "-"),
+        ("Dimension error vs truth (cm)", lambda r: f"{r['dimension_error_cm']:.2f}" if r.get("dimension_error_cm") is not None else "-"),
+    ]
+    lines = ["| | FP32 | INT8 |", "|---|---|---|"]
+    for name, value in rows:
+        lines.append(f"| {name} | {value(report['fp32'])} | {value(report['int8'])} |")
+    lines.append("")
+    lines.append(f"Mask IoU INT8 vs FP32: {report['mask_iou']}")
+    lines.append(f"Dimension difference INT8 vs FP32 (cm): {report['dimension_difference_cm']}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Quantizes the detection models to INT8 and compares them with FP32")
+    parser.add_argument("backend", choices=["onnx", "openvino"])
+    parser.add_argument("session", help="Recorded session used for calibration and evaluation")
+    parser.add_argument("--calibration-frames", type=int, default=100)
+    parser.add_argument("--evaluation-frames", type=int, default=100)
+    parser.add_argument("--data", default=None, help="YOLO dataset yaml to report mAP")
+    parser.add_argument("--dimensions", type=float, nargs=3, default=None, metavar=("W", "H", "D"), help="Real size in cm of the recorded box")
+    parser.add_argument("--report", default="quantization_report")
+    args = parser.parse_args()
+    # ONNX Runtime brings its own quantizer, OpenVINO models are quantized with NNCF
+    check_backend(args.backend, *(("nncf",) if args.backend == "openvino" else ()))
+
+    config = Config()
+    reader = SessionReader(args.session)
+    frames = np.arange(len(reader))
+    calibration = frames[::2][::max(1, len(frames[::2]) // args.calibration_frames)][:args.calibration_frames]
+    evaluation = frames[1::2][::max(1, len(frames[1::2]) // args.evaluation_frames)][:args.evaluation_frames]
+    calibration_frames = [utils.enhance(np.array(reader[i][0])) for i in calibration]
+
+    imgsz = sam_imgsz(config)
+    box_int8 = quantize_box_model(config.detection.box_model, args.backend, calibration_frames)
+    sam_int8 = quantize_sam_encoder(config.detection.sam_model, args.backend, calibration_frames, imgsz)
+
+    fp32_config = evaluation_config(args, box_model_path(config.detection.box_model, args.backend), sam_encoder_path(config.detection.sam_model, args.backend, imgsz))
+    int8_config = evaluation_config(args, box_int8, sam_int8)
+    fp32, fp32_detection, fp32_sides = evaluate(fp32_config, reader, list(evaluation), args.data)
+    int8, int8_detection, int8_sides = evaluate(int8_config, reader, list(evaluation), args.data)
+    if args.dimensions:
+        truth = [sorted(args.dimensions)] * len(evaluation)
+        fp32["dimension_error_cm"] = dimension_error([sorted(s) if s else None for s in fp32_sides], truth)
+        int8["dimension_error_cm"] = dimension_error([sorted(s) if s else None for s in int8_sides], truth)
+
+    report = {
+        "backend": args.backend,
+        "session": args.session,
+        "calibration_frames": len(calibration),
+        "evaluation_frames": len(evaluation),
+        "fp32": fp32,
+        "int8": int8,
+        "mask_iou": segmentation_agreement(fp32_detection, int8_detection, reader, list(evaluation), config),
+        "dimension_difference_cm": dimension_error(int8_sides, fp32_sides),
+    }
+    with open(args.report + ".json", "w") as f:
+        json.dump(report, f, indent=2)
+    with open(args.report + ".md", "w") as f:
+        f.write(markdown(report))
+    print(markdown(report))
@@ -0,0 +1,229 @@
+# All rights reserved. No part of this code may be reproduced, distributed, or transmitted
+# in any form or by any means, including photocopying, recording, or other electronic or
+# mechanical methods, without the prior written permission of the author, except in the
+# case of brief quotations embodied in critical reviews and certain other noncommercial
+# uses permitted by copyright law. For permission requests, please contact the author.
+#
+# Copyright (c) Lucía Alejandra Moreno Canuto, Gabriel Ernesto Gutiérrez Añez, Alicia Hernández Gutiérrez, Guillermo Daniel González Lozano
+
+
+import os
+import json
+import time
+import queue
+import threading
+import numpy as np
+import pyrealsense2 as rs
+from typing import Any, Optional
+from log import logging
+
+
+# A recorded session is a directory with a session.json manifest and, per chunk, three
+# .npy files holding the aligned color frames (N, H, W, 3) uint8, the z16 depth frames
+# (N, H, W) uint16 and the frame timestamps (N,) float64 in milliseconds.
+SESSION_MANIFEST = "session.json"
+SESSION_VERSION = 1
+
+
+def chunk_file(path:str, kind:str, chunk:str) -> str:
+    return os.path.join(path, f"{kind}_{chunk}.npy")
+
+
+def intrinsics_to_dict(intrinsics:rs.intrinsics) -> dict[str, Any]:
+    return {
+        "width": intrinsics.width,
+        "height": intrinsics.height,
+        "ppx": intrinsics.ppx,
+        "ppy": intrinsics.ppy,
+        "fx": intrinsics.fx,
+        "fy": intrinsics.fy,
+        "model": str(intrinsics.model).split(".")[-1],
+        "coeffs": list(intrinsics.coeffs),
+    }
+
+
+def intrinsics_from_dict(values:dict[str, Any]) -> rs.intrinsics:
+    intrinsics = rs.intrinsics()
+    intrinsics.width = int(values["width"])
+    intrinsics.height = int(values["height"])
+    intrinsics.ppx = float(values["ppx"])
+    intrinsics.ppy = float(values["ppy"])
+    intrinsics.fx = float(values["fx"])
+    intrinsics.fy = float(values["fy"])
+    intrinsics.model = getattr(rs.distortion, values["model"])
+    intrinsics.coeffs = [float(c) for c in values["coeffs"]]
+    return intrinsics
+
+
+class SessionReader:
+    """Random access to a recorded session, chunks are memory mapped so frames are only read when used"""
+
+    def __init__(self, path:str):
+        self.path = path
+        with open(os.path.join(path, SESSION_MANIFEST), "r") as f:
+            self.manifest:dict[str, Any] = json.load(f)
+
+        self.intrinsics:rs.intrinsics = intrinsics_from_dict(self.manifest["intrinsics"])
+        self.chunks:list[str] = [c["name"] for c in self.manifest["chunks"]]
+        self.offsets = np.cumsum([0] + [int(c["frames"]) for c in self.manifest["chunks"]])
+        self.loaded:dict[str, tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+
+
+    def __len__(self) -> int:
+        return int(self.offsets[-1])
+
+
+    def __load_chunk__(self, chunk:str) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        if chunk not in self.loaded:
+            self.loaded[chunk] = (
+                np.load(chunk_file(self.path, "color", chunk), mmap_mode="r"),
+                np.load(chunk_file(self.path, "depth", chunk), mmap_mode="r"),
+                np.load(chunk_file(self.path, "timestamps", chunk), mmap_mode="r"),
+            )
+        return self.loaded[chunk]
+
+
+    def __getitem__(self, index:int) -> tuple[np.ndarray, np.ndarray, float]:
+        if index < 0 or index >= len(self):
+            raise IndexError(f"Frame {index} out of range for session with {len(self)} frames")
+
+        position = int(np.searchsorted(self.offsets, index, side="right")) - 1
+        color, depth, timestamps = self.__load_chunk__(self.chunks[position])
+        i = index - int(self.offsets[position])
+        return color[i], depth[i], float(timestamps[i])
+
+
+    def close(self):
+        self.loaded.clear()
+
+
+class SessionWriter:
+    """Appends frames to a recorded session from a background thread.
+
+    The camera loop only pushes into a bounded queue, when the queue is full the frame is
+    dropped and counted instead of blocking. Every chunk is a set of preallocated memory
+    mapped .npy files, the manifest is rewritten each time a chunk is completed so a crash
+    loses at most the chunk in progress.
+    """
+
+    def __init__(self, path:str, intrinsics:rs.intrinsics, resolution:tuple[int, int], fps:int, chunk_size:int=150, queue_size:int=60):
+        self.path = path
+        self.resolution = resolution
+        self.chunk_size = chunk_size
+        self.manifest:dict[str, Any] = {
+            "version": SESSION_VERSION,
+            "resolution": list(resolution),
+            "fps": fps,
+            "intrinsics": intrinsics_to_dict(intrinsics),
+            "chunks": [],
+        }
+        self.queue:queue.Queue = queue.Queue(maxsize=queue_size)
+        self.thread:Optional[threading.Thread] = None
+        self.chunk:Optional[tuple[np.memmap, np.memmap, np.memmap]] = None
+        self.chunk_frames = 0
+        self.received = 0
+        self.written = 0
+        self.dropped = 0
+        self.max_queued = 0
+        self.write_time = 0.0
+        self.max_write_time = 0.0
+
+
+    def start(self):
+        os.makedirs(self.path, exist_ok=True)
+        self.__write_manifest__()
+        self.thread = threading.Thread(target=self.__write_loop__, name="session-writer", daemon=True)
+        self.thread.start()
+        logging.info(f"Recording session to {self.path}.")
+
+
+    def write(self, color:np.ndarray, depth:np.ndarray, timestamp:float, lease:Optional[Any]=None) -> bool:
+        """Queues a frame without blocking, the lease (if any) is released once the frame is on disk"""
+        self.received += 1
+        try:
+            self.queue.put_nowait((color, depth, timestamp, lease))
+            self.max_queued = max(self.max_queued, self.queue.qsize())
+            return True
+        except queue.Full:
+            self.dropped += 1
+            if lease is not None:
+                lease.release()
+            return False
+
+
+    def close(self):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+        self.__close_chunk__()
+        logging.info(f"Recording closed {self.stats()}")
+
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "received": self.received,
+            "written": self.written,
+            "dropped": self.dropped,
+            "max_queued": self.max_queued,
+            "mean_write_ms": (self.write_time / self.written * 1000) if self.written > 0 else 0.0,
+            "max_write_ms": self.max_write_time * 1000,
+        }
+
+
+    def __write_manifest__(self):
+        manifest_file = os.path.join(self.path, SESSION_MANIFEST)
+        with open(manifest_file + ".tmp", "w") as f:
+            json.dump(self.manifest, f)
+        os.replace(manifest_file + ".tmp", manifest_file)
+
+
+    def __open_chunk__(self):
+        name = f"{len(self.manifest['chunks']):05d}"
+        w, h = self.resolution
+        self.chunk = (
+            np.lib.format.open_memmap(chunk_file(self.path, "color", name), mode="w+", dtype=np.uint8, shape=(self.chunk_size, h, w, 3)),
+            np.lib.format.open_memmap(chunk_file(self.path, "depth", name), mode="w+", dtype=np.uint16, shape=(self.chunk_size, h, w)),
+            np.lib.format.open_memmap(chunk_file(self.path, "timestamps", name), mode="w+", dtype=np.float64, shape=(self.chunk_size,)),
+        )
+        self.manifest["chunks"].append({"name": name, "frames": 0})
+        self.chunk_frames = 0
+
+
+    def __close_chunk__(self):
+        if self.chunk is None:
+            return
+        for array in self.chunk:
+            array.flush()
+        self.manifest["chunks"][-1]["frames"] = self.chunk_frames
+        self.__write_manifest__()
+        self.chunk = None
+
+
+    def __write_loop__(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            color, depth, timestamp, lease = item
+            try:
+                started = time.perf_counter()
+                if self.chunk is None:
+                    self.__open_chunk__()
+                colors, depths, timestamps = self.chunk
+                colors[self.chunk_frames] = color
+                depths[self.chunk_frames] = depth
+                timestamps[self.chunk_frames] = timestamp
+                self.chunk_frames += 1
+                if self.chunk_frames == self.chunk_size:
+                    self.__close_chunk__()
+
+                elapsed = time.perf_counter() - started
+                self.written += 1
+                self.write_time += elapsed
+                self.max_write_time = max(self.max_write_time, elapsed)
+            except:
+                logging.error("Unable to write recorded frame.", exc_info=True)
+            finally:
+                if lease is not None:
+                    lease.release()
@@ -6,7 +6,7 @@
 #
 # Copyright (c) Lucía Alejandra Moreno Canuto, Gabriel Ernesto Gutiérrez Añez, Alicia Hernández Gutiérrez, Guillermo Daniel González Lozano
 
-from typing import Optional
+from typing import Optional, List
 from uuid import uuid4, UUID
 from kivy.clock import Clock
 from kivymd.uix.textfield import MDTextField
@@ -15,9 +15,8 @@ from kivy.uix.screenmanager import  Screen
 from kivy.uix.label import Label
 from kivy.metrics import dp
 from kivy.graphics.texture import Texture
-from camera import DepthCamera
+from detection.registry import models
 from config import Config
-from clp import Clp3DBinPackingGenerator
 import numpy as np
 from .box_table import BoxTable
 from .clp_table import ClpTable
@@ -184,14 +183,22 @@ class ExecutionScreen(Screen):
     container_height = StringProperty('200.0')
     container_depth = StringProperty('200.0')
     execution:Execution = ObjectProperty(Execution(id=uuid4(), container_width=200, container_height=200, container_depth=200))
-    latest_prediction:Optional[Prediction] = None
+    latest_predictions:List[Prediction] = []
+    latest_sequence:int = 0
     capturing_video:bool = False
+    video_event = None
     
     def __init__(self, **kwargs):
         Screen.__init__(self, **kwargs)
         self.config = Config()
-        self.camera = DepthCamera(self.config)
-        self.clp_plan_generator = Clp3DBinPackingGenerator()
+        # camera, detection and clp pull in torch, realsense and requests, they are created on
+        # first use so the window shows up without waiting for them
+        self.camera = None
+        self.pipeline = None
+        self.textures:dict[tuple[int, int], Texture] = {}
+        self.clp_plan_generator = None
+        # Load the detection models once the window is up, while the operator fills in the container
+        Clock.schedule_once(lambda dt: models.preload(self.config))
 
         self.box_table = BoxTable(remove_row_callback=self.on_box_table_remove_row)
         self.clp_table = ClpTable()
@@ -259,34 +266,66 @@ class ExecutionScreen(Screen):
             self.video = self.ids.video
             Clock.schedule_once(self.start_video_capture)
         else:
-            self.camera.stop_camera()
+            self.stop_video_capture()
             self.ids.start_stop_camera_button.text = "Start Camera"
-            w, h = self.camera.config.camera.resolution
-            texture = Texture.create(size=self.camera.config.camera.resolution, colorfmt='bgr')
-            texture.blit_buffer(np.zeros((h, w, 3), dtype=np.uint8).tobytes(), colorfmt='bgr', bufferfmt='ubyte')
-            self.video.texture = texture
+            w, h = self.config.camera.resolution
+            self.show_frame(np.zeros((h, w, 3), dtype=np.uint8))
 
     
     def start_video_capture(self, dt):
-        if self.capturing_video and self.camera.open_camera():
-            Clock.schedule_once(self.update_video_panel)
+        if self.pipeline is None:
+            from camera import CameraPipeline, create_camera
+            self.camera = create_camera(self.config)
+            self.pipeline = CameraPipeline(self.camera)
+
+        if self.capturing_video and self.pipeline.start():
+            self.latest_sequence = 0
+            self.video_event = Clock.schedule_interval(self.update_video_panel, 1 / self.config.camera.ui_fps)
+
+
+    def stop_video_capture(self):
+        if self.video_event is not None:
+            self.video_event.cancel()
+            self.video_event = None
+        if self.pipeline is not None:
+            self.pipeline.stop()
+
 
     def on_pre_leave(self, *args):
-        self.camera.stop_camera()
+        self.stop_video_capture()
         return super().on_pre_leave(*args)
     
     def update_video_panel(self, dt):
         try:
-            self.latest_prediction = self.camera.read()
-            if self.latest_prediction is not None:
-                texture = Texture.create(size=self.camera.config.camera.resolution, colorfmt='bgr')
-                texture.blit_buffer(self.latest_prediction.painted_frame.tobytes(), colorfmt='bgr', bufferfmt='ubyte')
-                texture.flip_vertical()
-                self.video.texture = texture
+            if self.pipeline.has_failed():
+                self.start_stop_camera()
+                return
+            sequence, predictions = self.pipeline.latest(self.latest_sequence)
+            if sequence == self.latest_sequence:
+                return
+            self.latest_sequence = sequence
+            if predictions:
+                from camera import release_predictions
+                release_predictions(self.latest_predictions)
+                self.latest_predictions = predictions
+                self.show_frame(predictions[0].painted_frame)
         except:
             logging.error("Error processing camera", exc_info=True)
-        finally:
-            Clock.schedule_once(self.update_video_panel)
+
+
+    def show_frame(self, frame:np.ndarray):
+        # One texture per resolution, re-uploaded in place from the contiguous frame buffer
+        size = (frame.shape[1], frame.shape[0])
+        texture = self.textures.get(size)
+        if texture is None:
+            texture = Texture.create(size=size, colorfmt='bgr')
+            texture.flip_vertical()
+            self.textures[size] = texture
+        texture.blit_buffer(np.ascontiguousarray(frame), colorfmt='bgr', bufferfmt='ubyte')
+        if self.video.texture is not texture:
+            self.video.texture = texture
+        else:
+            self.video.canvas.ask_update()
 
     def on_box_table_remove_row(self, table:BoxTable, short_id:UUID):
         self.execution.boxes = [b for b in self.execution.boxes if b.short_id != short_id]
@@ -294,7 +333,10 @@ class ExecutionScreen(Screen):
 
 
     def reset_data(self):
-        self.latest_prediction = None
+        if self.latest_predictions:
+            from camera import release_predictions
+            release_predictions(self.latest_predictions)
+        self.latest_predictions = []
 
 
     def to_texture(self, frame:np.ndarray):
@@ -305,20 +347,23 @@ class ExecutionScreen(Screen):
 
 
     def capture_image(self):
-        if self.latest_prediction is not None and self.latest_prediction.is_complete():
+        predictions = [p for p in self.latest_predictions if p.is_complete()]
+        for prediction in predictions:
             box = Box(
-                id=self.latest_prediction.id,
+                id=prediction.id,
                 execution_id=self.execution.id,
-                frame=self.latest_prediction.painted_frame,
-                x1=self.latest_prediction.bbox[0],
-                y1=self.latest_prediction.bbox[1],
-                x2=self.latest_prediction.bbox[2],
-                y2=self.latest_prediction.bbox[3],
-                width=self.latest_prediction.dimensions.side3.value,
-                height=self.latest_prediction.dimensions.side4.value,
-                depth=self.latest_prediction.dimensions.side5.value
+                frame=prediction.painted_frame.copy(),
+                mask=prediction.mask,
+                x1=prediction.bbox[0],
+                y1=prediction.bbox[1],
+                x2=prediction.bbox[2],
+                y2=prediction.bbox[3],
+                width=prediction.dimensions.side3.value,
+                height=prediction.dimensions.side4.value,
+                depth=prediction.dimensions.side5.value
             )
             self.execution.boxes.append(box)
+        if predictions:
             self.update_gallery()
 
 
@@ -351,6 +396,9 @@ class ExecutionScreen(Screen):
 
     def generate_plan(self):
         if len(self.execution.boxes) > 0:
+            if self.clp_plan_generator is None:
+                from clp import Clp3DBinPackingGenerator
+                self.clp_plan_generator = Clp3DBinPackingGenerator()
             plan: GeneratedClpPlan = self.clp_plan_generator.generate(self.execution)
             self.ids.not_packed_boxes_label.text = f"Unfitted Boxes: {len(plan.left_over_boxes)}"
             self.ids.packed_boxes_label.text = f"Fitted Boxes: {len(plan.plan)}"
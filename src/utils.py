@@ -8,6 +8,7 @@
 
 
 from typing import Optional
+import cv2
 import numpy as np
 
 
@@ -29,4 +30,63 @@ def sort_values(corners:Optional[np.ndarray]) -> Optional[np.ndarray]:
     top_left_idx = np.argmin(distances)
     corners = np.roll(corners, -top_left_idx, axis=0)
 
-    return corners[:6] 
\ No newline at end of file
+    return corners[:6] 
+
+
+def enhance(frame:np.ndarray, gray:Optional[np.ndarray]=None, out:Optional[np.ndarray]=None) -> np.ndarray:
+    """Histogram equalized grayscale of the frame as a 3 channel image, the input of the models"""
+    gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY, dst=gray)
+    cv2.equalizeHist(gray, dst=gray)
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR, dst=out)
+
+
+def max_area_polygon(points:np.ndarray, k:int=6) -> Optional[np.ndarray]:
+    """Subset of k points whose convex hull has the largest area, in the input order.
+
+    The best k-gon always lies on the convex hull of the points, so the search is a dynamic
+    program over the hull vertices (fan triangulation from the lowest vertex) instead of
+    enumerating every combination. With less than k hull vertices the hull is completed with
+    the first remaining points, like the first of the equally large combinations.
+    """
+    points = points.reshape(-1, 2)
+    if len(points) < k:
+        return None
+
+    hull = cv2.convexHull(points.astype(np.float32), clockwise=False, returnPoints=False)
+    hull = hull.reshape(-1) if hull is not None else np.empty(0, dtype=np.int32)
+    if len(hull) < 3:
+        return None
+
+    p = points[hull].astype(np.float64)
+    h = len(p)
+    # Shoelace area of every triangle (s, u, v) of hull vertices
+    d = p[None, :, :] - p[:, None, :]
+    triangles = 0.5 * np.abs(d[:, :, None, 0] * d[:, None, :, 1] - d[:, :, None, 1] * d[:, None, :, 0])
+    if triangles.max() <= 1e-10:
+        return None
+
+    if h <= k:
+        chosen = set(hull.tolist())
+        rest = [i for i in range(len(points)) if i not in chosen][:k - h]
+        return points[sorted(chosen.union(rest))]
+
+    best_area, best_vertices = -1.0, None
+    upper = np.triu(np.ones((h, h), dtype=bool), 1)
+    for s in range(h - k + 1):
+        # area[v] is the best chain s -> ... -> v with j vertices, parents to rebuild it
+        area = np.where(np.arange(h) > s, 0.0, -np.inf)
+        parents = []
+        for _ in range(k - 2):
+            candidates = area[:, None] + np.where(upper, triangles[s], -np.inf)
+            parent = np.argmax(candidates, axis=0)
+            area = candidates[parent, np.arange(h)]
+            parents.append(parent)
+
+        v = int(np.argmax(area))
+        if area[v] > best_area:
+            vertices = [v]
+            for parent in reversed(parents):
+                vertices.append(int(parent[vertices[-1]]))
+            best_area, best_vertices = area[v], [s] + vertices
+
+    return points[np.sort(hull[best_vertices])]
@@ -0,0 +1,63 @@
+# All rights reserved. No part of this code may be reproduced, distributed, or transmitted
+# in any form or by any means, including photocopying, recording, or other electronic or
+# mechanical methods, without the prior written permission of the author, except in the
+# case of brief quotations embodied in critical reviews and certain other noncommercial
+# uses permitted by copyright law. For permission requests, please contact the author.
+#
+# Copyright (c) Lucía Alejandra Moreno Canuto, Gabriel Ernesto Gutiérrez Añez, Alicia Hernández Gutiérrez, Guillermo Daniel González Lozano
+
+import numpy as np
+import pytest
+from types import SimpleNamespace
+
+pytest.importorskip("pyrealsense2")
+from config import Config
+from detection.pointcloud import PointCloudEstimator
+
+
+class CloudSource:
+    """Stands in for the DistanceEstimator, the mask point cloud is given"""
+
+    def __init__(self, points:np.ndarray):
+        self.points = points
+        self.depth_intrinsics = SimpleNamespace(fx=600.0, fy=600.0, ppx=320.0, ppy=240.0)
+
+    def point_cloud(self, depth_frame:np.ndarray, mask) -> np.ndarray:
+        return self.points
+
+
+def face(rng:np.random.Generator, origin, u, v, count:int=3000) -> np.ndarray:
+    """Points of the face spanned by u and v from origin, in mm with 1mm of depth noise"""
+    s, t = rng.random((2, count))
+    points = np.asarray(origin) + s[:, None] * np.asarray(u) + t[:, None] * np.asarray(v)
+    points[:, 2] += rng.normal(0, 1, count)
+    return points.astype(np.float32)
+
+
+def estimate(points:np.ndarray):
+    estimator = PointCloudEstimator(CloudSource(points), Config())
+    return estimator.calculate_object_dimensions(None, None)
+
+
+def test_single_face_is_not_measured():
+    rng = np.random.default_rng(0)
+    # Only the 300x200mm top of a box, seen straight from 1m
+    top = face(rng, (-150, -100, 1000), (300, 0, 0), (0, 200, 0))
+    assert estimate(top) is None
+
+
+def test_two_faces_give_the_box_dimensions():
+    rng = np.random.default_rng(1)
+    # The top and the front of a 300x200x150mm box, the camera looks down at it
+    angle = np.deg2rad(30)
+    down = np.array([0, np.cos(angle), np.sin(angle)]) * 200
+    front = np.array([0, np.sin(angle), -np.cos(angle)]) * 150
+    origin = np.array([-150, -100, 1000])
+    points = np.concatenate([
+        face(rng, origin, (300, 0, 0), down),
+        face(rng, origin, (300, 0, 0), front),
+    ])
+    dimensions = estimate(points)
+    assert dimensions is not None
+    sides = sorted([dimensions.side3.value, dimensions.side4.value, dimensions.side5.value])
+    assert np.allclose(sides, [15, 20, 30], atol=1)
\ No newline at end of file
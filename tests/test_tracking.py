@@ -0,0 +1,69 @@
+# All rights reserved. No part of this code may be reproduced, distributed, or transmitted
+# in any form or by any means, including photocopying, recording, or other electronic or
+# mechanical methods, without the prior written permission of the author, except in the
+# case of brief quotations embodied in critical reviews and certain other noncommercial
+# uses permitted by copyright law. For permission requests, please contact the author.
+#
+# Copyright (c) Lucía Alejandra Moreno Canuto, Gabriel Ernesto Gutiérrez Añez, Alicia Hernández Gutiérrez, Guillermo Daniel González Lozano
+
+import numpy as np
+import pytest
+from domain import Dimensions, DimSide
+from detection.tracking import Tracker
+
+MAXLEN = 20
+SIGMA = 3
+
+
+def dimensions(values:tuple[int, int, int], detection_time:int) -> Dimensions:
+    sides = [DimSide(value=v, point1=(0, 0), point2=(1, 1)) for v in (0, 0, *values, 0)]
+    return Dimensions(sides=sides, detection_time=detection_time)
+
+
+def robust_median(values:np.ndarray) -> int:
+    """The original filtering, sorting the whole window"""
+    q1, q3 = np.percentile(values, [25, 75])
+    iqr = q3 - q1
+    filtered = values[(values >= q1 - SIGMA * iqr) & (values <= q3 + SIGMA * iqr)]
+    return int(np.median(filtered))
+
+
+def stabilized(tracker:Tracker, values:np.ndarray) -> list[tuple[int, int, int]]:
+    results = []
+    for i, row in enumerate(values):
+        result = tracker.update(dimensions(tuple(int(v) for v in row), 1000 + i * 33))
+        results.append((result.side3.value, result.side4.value, result.side5.value))
+    return results
+
+
+def test_filters_outliers_over_the_window():
+    rng = np.random.default_rng(0)
+    # An older box the window has to forget, then the tracked one with injected outliers
+    old = rng.normal((300, 200, 100), 2, (60, 3)).round()
+    new = rng.normal((500, 400, 250), 2, (3 * MAXLEN, 3)).round()
+    new[::7] = (5000, 4000, 2500)
+    new[3::7] = (1, 1, 1)
+    values = np.concatenate([old, new]).astype(np.int64)
+
+    results = stabilized(Tracker(maxlen=MAXLEN, sigma=SIGMA), values)
+
+    for side, expected in zip(results[-1], (500, 400, 250)):
+        assert abs(side - expected) <= 3
+    # Once the old box left the window, its values no longer count
+    for i in range(len(old) + MAXLEN, len(values)):
+        assert all(abs(side - expected) <= 3 for side, expected in zip(results[i], (500, 400, 250)))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_percentile_over_the_last_maxlen(seed:int):
+    rng = np.random.default_rng(seed)
+    values = rng.normal((500, 400, 250), 10, (5 * MAXLEN, 3)).round().astype(np.int64)
+    outliers = rng.random(len(values)) < 0.15
+    values[outliers] = rng.integers(1, 6000, (outliers.sum(), 3))
+    tracker = Tracker(maxlen=MAXLEN, sigma=SIGMA)
+
+    for i, result in enumerate(stabilized(tracker, values)):
+        window = values[max(0, i + 1 - MAXLEN):i + 1]
+        if len(window) < tracker.min_samples:
+            continue
+        assert result == tuple(robust_median(window[:, side]) for side in range(3))
\ No newline at end of file